@@ -0,0 +1,151 @@
+"""
+Measures what the API key middleware adds to each streamed token on /chat.
+
+Compares no middleware at all, the old `@app.middleware("http")` version (Starlette's BaseHTTPMiddleware),
+and the plain ASGI `ApiKeyMiddleware`. The app is called directly, without a server or a network, so
+the only difference between the runs is the middleware.
+
+    python benchmark_streaming_middleware.py --tokens 500 --requests 200
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Callable, List, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from starlette.responses import StreamingResponse
+from starlette.types import ASGIApp, Message
+
+from validation.proxy import sql
+from validation.proxy.api_key_cache import ApiKeyCache
+from validation.proxy.api_server.middleware import ApiKeyMiddleware
+from validation.proxy.billing_ledger import BillingLedger
+from validation.proxy.rate_limiter import SlidingWindowRateLimiter
+
+API_KEY = "benchmark-key"
+
+
+def _make_chat_app(tokens: int) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/chat")
+    async def chat() -> StreamingResponse:
+        async def _stream():
+            for _ in range(tokens):
+                yield "token "
+
+        return StreamingResponse(_stream(), media_type="text/plain")
+
+    return app
+
+
+def _make_dependencies(total_requests: int):
+    cache = ApiKeyCache(ttl_seconds=float("inf"))
+    cache._keys = {API_KEY: {sql.KEY: API_KEY, sql.BALANCE: None, sql.RATE_LIMIT_PER_MINUTE: total_requests * 10}}
+    cache._loaded_at = time.monotonic()
+    # Never started, so it never flushes - the debits just pile up in memory
+    ledger = BillingLedger(cache, max_logs=total_requests * 10)
+    return cache, ledger, SlidingWindowRateLimiter()
+
+
+def _with_http_middleware(app: FastAPI, cache: ApiKeyCache, ledger: BillingLedger, limiter) -> FastAPI:
+    """The middleware as it was before, through `@app.middleware("http")`"""
+
+    @app.middleware("http")
+    async def api_key_validator(request: Request, call_next):
+        api_key = request.headers.get("Authorization", "").split(" ")[-1]
+        api_key_info = await cache.get(api_key)
+        if api_key_info is None:
+            return JSONResponse(status_code=401, content={"detail": "Invalid API key"})
+        if not limiter.allow(api_key_info[sql.KEY], api_key_info[sql.RATE_LIMIT_PER_MINUTE]):
+            return JSONResponse(status_code=429, content={"detail": "Rate limit exceeded - sorry!"})
+        start_time = time.time()
+        response = await call_next(request)
+        if response.status_code == 200:
+            ledger.debit(api_key_info, request.url.path, 1, time.time() - start_time)
+        return response
+
+    return app
+
+
+async def _time_request(app: ASGIApp) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/chat",
+        "raw_path": b"/chat",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"authorization", f"Bearer {API_KEY}".encode())],
+        "client": ("127.0.0.1", 1234),
+        "server": ("127.0.0.1", 8000),
+    }
+    request_sent = False
+    response_complete = asyncio.Event()
+
+    async def receive() -> Message:
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Message) -> None:
+        if message["type"] == "http.response.body" and not message.get("more_body", False):
+            response_complete.set()
+
+    start_time = time.perf_counter()
+    await app(scope, receive, send)
+    return time.perf_counter() - start_time
+
+
+async def _benchmark(make_app: Callable[[], ASGIApp], requests: int) -> List[float]:
+    app = make_app()
+    for _ in range(min(requests, 20)):
+        await _time_request(app)
+    return [await _time_request(app) for _ in range(requests)]
+
+
+def _median(timings: List[float]) -> float:
+    return sorted(timings)[len(timings) // 2]
+
+
+async def main(tokens: int, requests: int) -> None:
+    def _plain() -> ASGIApp:
+        return _make_chat_app(tokens)
+
+    def _http_middleware() -> ASGIApp:
+        return _with_http_middleware(_make_chat_app(tokens), *_make_dependencies(requests + 20))
+
+    def _asgi_middleware() -> ASGIApp:
+        cache, ledger, limiter = _make_dependencies(requests + 20)
+        return ApiKeyMiddleware(_make_chat_app(tokens), cache=cache, ledger=ledger, limiter=limiter)
+
+    runs: List[Tuple[str, Callable[[], ASGIApp]]] = [
+        ("no middleware", _plain),
+        ('@app.middleware("http")', _http_middleware),
+        ("ApiKeyMiddleware (ASGI)", _asgi_middleware),
+    ]
+
+    baseline = None
+    print(f"{tokens} tokens per request, median of {requests} requests")
+    for name, make_app in runs:
+        median = _median(await _benchmark(make_app, requests))
+        if baseline is None:
+            baseline = median
+        overhead_per_token_us = (median - baseline) / tokens * 1e6
+        print(f"{name:<26} {median * 1000:8.2f}ms per request   {overhead_per_token_us:6.2f}us per token overhead")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.tokens, args.requests))
@@ -38,6 +38,36 @@ class Config(BaseModel):
 
     api_server_port: Optional[int] = os.getenv(core_cst.API_SERVER_PORT_PARAM, None)
 
+    db_read_pool_size: int = int(os.getenv(core_cst.DB_READ_POOL_SIZE_PARAM, 4))
+    data_retention_minutes: int = int(os.getenv(core_cst.DATA_RETENTION_MINUTES_PARAM, 60 * 24 * 2))
+    task_retention_minutes: int = int(os.getenv(core_cst.TASK_RETENTION_MINUTES_PARAM, 120))
+    log_retention_minutes: int = int(os.getenv(core_cst.LOG_RETENTION_MINUTES_PARAM, 60 * 24 * 30))
+    retention_interval_seconds: float = float(os.getenv(core_cst.RETENTION_INTERVAL_SECONDS_PARAM, 300))
+    persist_rate_limits: bool = os.getenv(core_cst.PERSIST_RATE_LIMITS_PARAM, "false").lower() == "true"
+
+    api_role: str = os.getenv(core_cst.API_ROLE_PARAM, core_cst.API_ROLE_COMBINED)
+    api_workers: int = max(int(os.getenv(core_cst.API_WORKERS_PARAM, 1)), 1)
+    core_socket_path: str = os.getenv(
+        core_cst.CORE_SOCKET_PATH_PARAM, f"/tmp/vision_core_{os.getenv(core_cst.HOTKEY_PARAM, 'default')}.sock"
+    )
+
+    clip_embedding_cache_size: int = int(os.getenv(core_cst.CLIP_EMBEDDING_CACHE_SIZE_PARAM, 5000))
+    # Unset for no disk tier
+    clip_embedding_disk_cache_dir: Optional[str] = os.getenv(core_cst.CLIP_EMBEDDING_DISK_CACHE_DIR_PARAM, None)
+
+    # Per image, for the multipart upload endpoints
+    max_upload_image_bytes: int = int(os.getenv(core_cst.MAX_UPLOAD_IMAGE_BYTES_PARAM, 10 * 1024 * 1024))
+
+    # Share of organic queries sent to a uniformly random miner, rather than one of the fastest
+    miner_exploration_share: float = float(os.getenv(core_cst.MINER_EXPLORATION_SHARE_PARAM, 0.1))
+    # Send slow non streaming organic queries to a second miner too, for at most HEDGE_BUDGET_SHARE extra requests
+    hedge_requests: bool = os.getenv(core_cst.HEDGE_REQUESTS_PARAM, "false").lower() == "true"
+    hedge_latency_percentile: float = float(os.getenv(core_cst.HEDGE_LATENCY_PERCENTILE_PARAM, 0.95))
+    hedge_budget_share: float = float(os.getenv(core_cst.HEDGE_BUDGET_SHARE_PARAM, 0.05))
+    # Timeouts, 429s and 5xxs in a row before a miner gets no traffic for a while
+    circuit_breaker_failure_threshold: int = int(os.getenv(core_cst.CIRCUIT_BREAKER_FAILURE_THRESHOLD_PARAM, 5))
+    circuit_breaker_open_seconds: float = float(os.getenv(core_cst.CIRCUIT_BREAKER_OPEN_SECONDS_PARAM, 30))
+
     is_validator: bool = False
 
 
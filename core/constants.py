@@ -58,6 +58,10 @@ DEFAULT_SAMPLER = None
 DEFAULT_ENGINE = "stable-diffusion-xl-1024-v1-0"
 UPSCALE_ENGINE = "esrgan-v1-x2plus"
 
+# Batch endpoints: most requests in one batch, and most of a batch's requests in flight at once
+MAX_BATCH_SIZE = 100
+BATCH_MAX_CONCURRENCY = 8
+
 ALLOWED_IMAGE_SIZES: List[Tuple[int, int]] = [
     (1024, 1024),
     (1152, 896),
@@ -156,6 +160,30 @@ API_SERVER_PORT_PARAM = "API_SERVER_PORT"
 EXTERNAL_SERVER_ADDRESS_PARAM = "EXTERNAL_SERVER_ADDRESS"
 AXON_PORT_PARAM = "AXON_PORT"
 AXON_EXTERNAL_IP_PARAM = "AXON_EXTERNAL_IP"
+DB_READ_POOL_SIZE_PARAM = "DB_READ_POOL_SIZE"
+DATA_RETENTION_MINUTES_PARAM = "DATA_RETENTION_MINUTES"
+TASK_RETENTION_MINUTES_PARAM = "TASK_RETENTION_MINUTES"
+LOG_RETENTION_MINUTES_PARAM = "LOG_RETENTION_MINUTES"
+RETENTION_INTERVAL_SECONDS_PARAM = "RETENTION_INTERVAL_SECONDS"
+PERSIST_RATE_LIMITS_PARAM = "PERSIST_RATE_LIMITS"
+API_ROLE_PARAM = "API_ROLE"
+API_WORKERS_PARAM = "API_WORKERS"
+CORE_SOCKET_PATH_PARAM = "CORE_SOCKET_PATH"
+CLIP_EMBEDDING_CACHE_SIZE_PARAM = "CLIP_EMBEDDING_CACHE_SIZE"
+CLIP_EMBEDDING_DISK_CACHE_DIR_PARAM = "CLIP_EMBEDDING_DISK_CACHE_DIR"
+MAX_UPLOAD_IMAGE_BYTES_PARAM = "MAX_UPLOAD_IMAGE_BYTES"
+MINER_EXPLORATION_SHARE_PARAM = "MINER_EXPLORATION_SHARE"
+HEDGE_REQUESTS_PARAM = "HEDGE_REQUESTS"
+HEDGE_LATENCY_PERCENTILE_PARAM = "HEDGE_LATENCY_PERCENTILE"
+HEDGE_BUDGET_SHARE_PARAM = "HEDGE_BUDGET_SHARE"
+CIRCUIT_BREAKER_FAILURE_THRESHOLD_PARAM = "CIRCUIT_BREAKER_FAILURE_THRESHOLD"
+CIRCUIT_BREAKER_OPEN_SECONDS_PARAM = "CIRCUIT_BREAKER_OPEN_SECONDS"
+
+# API_ROLE values. Combined is everything in one process. Otherwise the core process runs the validator and
+# takes organic queries over a unix socket, from API_WORKERS worker processes serving the public API
+API_ROLE_COMBINED = "combined"
+API_ROLE_CORE = "core"
+API_ROLE_WORKER = "worker"
 
 
 VISION_DB = "vision_database.db"
@@ -0,0 +1,28 @@
+-- migrate:up
+
+-- Reward data is always looked up by (task, hotkey) or by hotkey, most recent first
+CREATE INDEX IF NOT EXISTS idx_reward_data_task_miner_hotkey_created_at ON reward_data(task, miner_hotkey, created_at);
+CREATE INDEX IF NOT EXISTS idx_reward_data_miner_hotkey_created_at ON reward_data(miner_hotkey, created_at);
+
+-- Covers the period score lookups entirely, so they never touch the table
+CREATE INDEX IF NOT EXISTS idx_uid_records_task_miner_hotkey_created_at ON uid_records(task, miner_hotkey, created_at, period_score, consumed_volume);
+
+CREATE INDEX IF NOT EXISTS idx_tasks_task_name_miner_hotkey ON tasks(task_name, miner_hotkey);
+
+-- Prefixes of the above, so they're just extra work on every insert
+DROP INDEX IF EXISTS idx_reward_data_task;
+DROP INDEX IF EXISTS idx_reward_data_miner_hotkey;
+DROP INDEX IF EXISTS idx_uid_records_task;
+DROP INDEX IF EXISTS idx_tasks_task_name;
+
+-- migrate:down
+
+DROP INDEX IF EXISTS idx_reward_data_task_miner_hotkey_created_at;
+DROP INDEX IF EXISTS idx_reward_data_miner_hotkey_created_at;
+DROP INDEX IF EXISTS idx_uid_records_task_miner_hotkey_created_at;
+DROP INDEX IF EXISTS idx_tasks_task_name_miner_hotkey;
+
+CREATE INDEX idx_reward_data_task ON reward_data(task);
+CREATE INDEX idx_reward_data_miner_hotkey ON reward_data(miner_hotkey);
+CREATE INDEX idx_uid_records_task ON uid_records(task);
+CREATE INDEX idx_tasks_task_name ON tasks(task_name);
@@ -0,0 +1,83 @@
+-- migrate:up
+
+-- Running totals per (task, hotkey), kept up to date by the triggers below, so weight setting
+-- reads a row per miner rather than its whole history
+
+CREATE TABLE IF NOT EXISTS reward_data_aggregates (
+    task TEXT NOT NULL,
+    miner_hotkey TEXT NOT NULL,
+    reward_count INTEGER NOT NULL DEFAULT 0,
+    combined_quality_score_sum FLOAT NOT NULL DEFAULT 0,
+    PRIMARY KEY (task, miner_hotkey)
+);
+
+-- Period scores are weighted by 0.5 ** (how many newer period scores there are), so each new one halves
+-- the weight of everything before it. oldest_decay_weight is the current weight of the oldest one,
+-- so it can be taken back out when it's deleted. 0.5 is 1 - PERIOD_SCORE_TIME_DECAYING_FACTOR
+CREATE TABLE IF NOT EXISTS period_score_aggregates (
+    task TEXT NOT NULL,
+    miner_hotkey TEXT NOT NULL,
+    period_score_count INTEGER NOT NULL DEFAULT 0,
+    decayed_weighted_score_sum FLOAT NOT NULL DEFAULT 0,
+    decayed_volume_sum FLOAT NOT NULL DEFAULT 0,
+    oldest_decay_weight FLOAT NOT NULL DEFAULT 1,
+    PRIMARY KEY (task, miner_hotkey)
+);
+
+CREATE INDEX IF NOT EXISTS idx_period_score_aggregates_miner_hotkey ON period_score_aggregates(miner_hotkey);
+CREATE INDEX IF NOT EXISTS idx_reward_data_aggregates_miner_hotkey ON reward_data_aggregates(miner_hotkey);
+
+CREATE TRIGGER IF NOT EXISTS trg_reward_data_aggregates_insert AFTER INSERT ON reward_data
+BEGIN
+    INSERT INTO reward_data_aggregates (task, miner_hotkey, reward_count, combined_quality_score_sum)
+    VALUES (NEW.task, NEW.miner_hotkey, 1, COALESCE(NEW.quality_score * NEW.speed_scoring_factor, 0))
+    ON CONFLICT (task, miner_hotkey) DO UPDATE SET
+        reward_count = reward_count + 1,
+        combined_quality_score_sum = combined_quality_score_sum + excluded.combined_quality_score_sum;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reward_data_aggregates_delete AFTER DELETE ON reward_data
+BEGIN
+    UPDATE reward_data_aggregates SET
+        reward_count = reward_count - 1,
+        combined_quality_score_sum = combined_quality_score_sum - COALESCE(OLD.quality_score * OLD.speed_scoring_factor, 0)
+    WHERE task = OLD.task AND miner_hotkey = OLD.miner_hotkey;
+    DELETE FROM reward_data_aggregates WHERE task = OLD.task AND miner_hotkey = OLD.miner_hotkey AND reward_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_period_score_aggregates_insert AFTER INSERT ON uid_records
+WHEN NEW.period_score IS NOT NULL
+BEGIN
+    INSERT INTO period_score_aggregates (
+        task, miner_hotkey, period_score_count, decayed_weighted_score_sum, decayed_volume_sum, oldest_decay_weight
+    )
+    VALUES (NEW.task, NEW.miner_hotkey, 1, NEW.period_score * NEW.consumed_volume, NEW.consumed_volume, 1)
+    ON CONFLICT (task, miner_hotkey) DO UPDATE SET
+        period_score_count = period_score_count + 1,
+        decayed_weighted_score_sum = decayed_weighted_score_sum * 0.5 + excluded.decayed_weighted_score_sum,
+        decayed_volume_sum = decayed_volume_sum * 0.5 + excluded.decayed_volume_sum,
+        oldest_decay_weight = oldest_decay_weight * 0.5;
+END;
+
+-- Rows are only ever deleted oldest first (retention), or all at once for a hotkey (deregistration)
+CREATE TRIGGER IF NOT EXISTS trg_period_score_aggregates_delete AFTER DELETE ON uid_records
+WHEN OLD.period_score IS NOT NULL
+BEGIN
+    UPDATE period_score_aggregates SET
+        period_score_count = period_score_count - 1,
+        decayed_weighted_score_sum = decayed_weighted_score_sum - OLD.period_score * OLD.consumed_volume * oldest_decay_weight,
+        decayed_volume_sum = decayed_volume_sum - OLD.consumed_volume * oldest_decay_weight,
+        oldest_decay_weight = oldest_decay_weight * 2
+    WHERE task = OLD.task AND miner_hotkey = OLD.miner_hotkey;
+    DELETE FROM period_score_aggregates WHERE task = OLD.task AND miner_hotkey = OLD.miner_hotkey AND period_score_count <= 0;
+END;
+
+-- migrate:down
+
+DROP TRIGGER IF EXISTS trg_reward_data_aggregates_insert;
+DROP TRIGGER IF EXISTS trg_reward_data_aggregates_delete;
+DROP TRIGGER IF EXISTS trg_period_score_aggregates_insert;
+DROP TRIGGER IF EXISTS trg_period_score_aggregates_delete;
+
+DROP TABLE IF EXISTS reward_data_aggregates;
+DROP TABLE IF EXISTS period_score_aggregates;
@@ -0,0 +1,36 @@
+-- migrate:up
+
+-- Large strings from stored results, compressed and stored once by their sha256.
+-- ref_count is kept by the triggers on tasks; unreferenced blobs are removed by retention
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs(hash) WHERE ref_count <= 0;
+
+-- Json list of the blob hashes the row's checking_data references
+ALTER TABLE tasks ADD COLUMN blob_hashes TEXT;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_blob_refs_insert AFTER INSERT ON tasks
+WHEN NEW.blob_hashes IS NOT NULL
+BEGIN
+    UPDATE blobs SET ref_count = ref_count + 1 WHERE hash IN (SELECT value FROM json_each(NEW.blob_hashes));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_blob_refs_delete AFTER DELETE ON tasks
+WHEN OLD.blob_hashes IS NOT NULL
+BEGIN
+    UPDATE blobs SET ref_count = ref_count - 1 WHERE hash IN (SELECT value FROM json_each(OLD.blob_hashes));
+END;
+
+-- migrate:down
+
+DROP TRIGGER IF EXISTS trg_tasks_blob_refs_insert;
+DROP TRIGGER IF EXISTS trg_tasks_blob_refs_delete;
+
+ALTER TABLE tasks DROP COLUMN blob_hashes;
+
+DROP TABLE IF EXISTS blobs;
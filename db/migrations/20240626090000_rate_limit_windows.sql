@@ -0,0 +1,13 @@
+-- migrate:up
+
+-- The in memory rate limiter's counters, saved on shutdown and loaded on startup
+CREATE TABLE IF NOT EXISTS rate_limit_windows (
+    key TEXT PRIMARY KEY,
+    window_index INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    previous_count INTEGER NOT NULL
+);
+
+-- migrate:down
+
+DROP TABLE IF EXISTS rate_limit_windows;
@@ -0,0 +1,49 @@
+-- migrate:up
+
+ALTER TABLE logs ADD COLUMN latency REAL;
+
+-- Per key and endpoint usage, per hour and per day. Kept up to date by the billing ledger as it flushes logs,
+-- and kept after the raw logs expire
+CREATE TABLE IF NOT EXISTS log_rollups_hourly (
+    key TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    bucket_start TEXT NOT NULL,
+    request_count INTEGER NOT NULL DEFAULT 0,
+    credits_used REAL NOT NULL DEFAULT 0,
+    total_latency REAL NOT NULL DEFAULT 0,
+    max_latency REAL,
+    PRIMARY KEY (key, endpoint, bucket_start)
+);
+
+CREATE TABLE IF NOT EXISTS log_rollups_daily (
+    key TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    bucket_start TEXT NOT NULL,
+    request_count INTEGER NOT NULL DEFAULT 0,
+    credits_used REAL NOT NULL DEFAULT 0,
+    total_latency REAL NOT NULL DEFAULT 0,
+    max_latency REAL,
+    PRIMARY KEY (key, endpoint, bucket_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_log_rollups_hourly_bucket_start ON log_rollups_hourly(bucket_start);
+CREATE INDEX IF NOT EXISTS idx_log_rollups_daily_bucket_start ON log_rollups_daily(bucket_start);
+
+INSERT INTO log_rollups_hourly (key, endpoint, bucket_start, request_count, credits_used, total_latency, max_latency)
+SELECT key, endpoint, strftime('%Y-%m-%d %H:00:00', created_at), COUNT(*), TOTAL(cost), TOTAL(latency), MAX(latency)
+FROM logs
+WHERE key IS NOT NULL AND endpoint IS NOT NULL
+GROUP BY key, endpoint, strftime('%Y-%m-%d %H:00:00', created_at);
+
+INSERT INTO log_rollups_daily (key, endpoint, bucket_start, request_count, credits_used, total_latency, max_latency)
+SELECT key, endpoint, strftime('%Y-%m-%d 00:00:00', created_at), COUNT(*), TOTAL(cost), TOTAL(latency), MAX(latency)
+FROM logs
+WHERE key IS NOT NULL AND endpoint IS NOT NULL
+GROUP BY key, endpoint, strftime('%Y-%m-%d 00:00:00', created_at);
+
+-- migrate:down
+
+DROP TABLE IF EXISTS log_rollups_hourly;
+DROP TABLE IF EXISTS log_rollups_daily;
+
+ALTER TABLE logs DROP COLUMN latency;
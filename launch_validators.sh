@@ -13,7 +13,16 @@ for env_file in .*.env; do
             NETUID_OPTION="--netuid $netuid"
         fi
 
-        pm2 start validation/proxy/api_server/asgi.py --name validating_server_$hotkey --interpreter python -- --env_file $env_file $NETUID_OPTION
+        # With API_WORKERS set, the public API runs in that many worker processes of its own,
+        # passing organic queries to the validator over a unix socket
+        api_workers=$(grep -E '^API_WORKERS=' $env_file | cut -d '=' -f 2)
+        pm2 delete validating_api_$hotkey
+        if [ -n "$api_workers" ]; then
+            API_ROLE=core pm2 start validation/proxy/api_server/asgi.py --name validating_server_$hotkey --interpreter python -- --env_file $env_file $NETUID_OPTION
+            API_ROLE=worker pm2 start validation/proxy/api_server/asgi.py --name validating_api_$hotkey --interpreter python -- --env_file $env_file $NETUID_OPTION
+        else
+            pm2 start validation/proxy/api_server/asgi.py --name validating_server_$hotkey --interpreter python -- --env_file $env_file $NETUID_OPTION
+        fi
     fi
 done
 
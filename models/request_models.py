@@ -297,6 +297,30 @@ class ClipEmbeddingsRequest(BaseModel):
     )
 
 
+class TextToImageBatchRequest(BaseModel):
+    """Generate many images from text, in one request"""
+
+    requests: List[TextToImageRequest] = Field(
+        ..., description="The images to generate", min_items=1, max_items=cst.MAX_BATCH_SIZE
+    )
+    stream: bool = Field(
+        False,
+        description="Stream each result as a line of json (NDJSON) as soon as it's done, rather than all at the end",
+    )
+
+
+class ImageToImageBatchRequest(BaseModel):
+    """Generate many images from other images (+ text), in one request"""
+
+    requests: List[ImageToImageRequest] = Field(
+        ..., description="The images to generate", min_items=1, max_items=cst.MAX_BATCH_SIZE
+    )
+    stream: bool = Field(
+        False,
+        description="Stream each result as a line of json (NDJSON) as soon as it's done, rather than all at the end",
+    )
+
+
 class TextToImageResponse(BaseModel):
     image_b64: str = Field(..., description="The base64 encoded images to return", title="image_b64")
 
@@ -321,5 +345,16 @@ class UpscaleResponse(BaseModel):
     image_b64: str = Field(..., description="The base64 encoded images to return", title="image_b64")
 
 
+class BatchImageResult(BaseModel):
+    index: int = Field(..., description="Which of the requests in the batch this is the result of", title="index")
+    status_code: int = Field(..., description="What the request would have got on its own", title="status_code")
+    image_b64: Optional[str] = Field(None, description="The base64 encoded image, if it worked", title="image_b64")
+    error: Optional[str] = Field(None, description="Why it didn't work, if it didn't", title="error")
+
+
+class BatchImageResponse(BaseModel):
+    results: List[BatchImageResult] = Field(..., description="The results, in request order", title="results")
+
+
 class ClipEmbeddingsResponse(BaseModel):
     clip_embeddings: List[List[float]] = Field(..., description="The image embeddings", title="clip_embeddings")
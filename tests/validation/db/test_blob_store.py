@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+from core import Task
+from validation.db import blob_store
+from validation.db.result_sampler import StoredResult
+from validation.db.retention import RetentionWorker
+from tests.validation.db.test_db_management import _make_db_manager
+
+INIT_IMAGE = "aW5pdA==" * 500
+
+
+def _stored_result(image: str) -> StoredResult:
+    data = {"result": {"formatted_response": {"image_b64": image}}, "synapse": {"init_image": INIT_IMAGE}}
+    checking_data, blobs = blob_store.extract_blobs(data)
+    return StoredResult(Task.avatar.value, json.dumps(checking_data), "hotkey", blobs)
+
+
+def test_large_strings_are_stored_once_and_collected_when_unreferenced(tmp_path, monkeypatch):
+    async def run():
+        db_manager = await _make_db_manager(tmp_path, monkeypatch)
+        try:
+            images = [f"image-{i}-" * 200 for i in range(2)]
+            for image in images:
+                db_manager.result_sampler.offer(Task.avatar.value, 10, lambda: _stored_result(image))
+            await db_manager.result_sampler.flush()
+
+            checking_data = (await db_manager.storage.fetchone("SELECT checking_data FROM tasks"))[0]
+            assert len(checking_data) < 300
+            ref_counts = await db_manager.storage.fetchall("SELECT ref_count FROM blobs ORDER BY ref_count")
+            assert ref_counts == [(1,), (1,), (2,)]
+
+            data, miner_hotkey = await db_manager.pop_task_result(Task.avatar)
+            assert miner_hotkey == "hotkey"
+            assert data["result"]["formatted_response"]["image_b64"] in images
+            assert data["synapse"]["init_image"] == INIT_IMAGE
+
+            await RetentionWorker(db_manager.storage).run_once()
+            ref_counts = await db_manager.storage.fetchall("SELECT ref_count FROM blobs ORDER BY ref_count")
+            assert ref_counts == [(1,), (1,)]
+        finally:
+            await db_manager.close()
+
+    asyncio.run(run())
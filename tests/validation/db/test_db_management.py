@@ -0,0 +1,95 @@
+import asyncio
+
+from core import Task
+from core import constants as core_cst
+from validation.db.db_management import DatabaseManager
+
+
+async def _make_db_manager(tmp_path, monkeypatch) -> DatabaseManager:
+    monkeypatch.setattr(core_cst, "VISION_DB", str(tmp_path / "test.db"))
+    db_manager = DatabaseManager()
+    await db_manager.initialize(read_pool_size=1)
+    return db_manager
+
+
+async def _insert_reward(db_manager: DatabaseManager, id: str, task: Task, hotkey: str, created_at: str) -> None:
+    await db_manager.storage.execute(
+        "INSERT INTO reward_data (id, task, axon_uid, quality_score, validator_hotkey, miner_hotkey, "
+        "synthetic_query, speed_scoring_factor, created_at) VALUES (?, ?, 1, 1.0, 'vali', ?, 1, 1.0, ?)",
+        (id, task.value, hotkey, created_at),
+    )
+
+
+def test_bulk_reward_fetch_tops_up_with_recent_rewards_from_other_tasks(tmp_path, monkeypatch):
+    async def run():
+        db_manager = await _make_db_manager(tmp_path, monkeypatch)
+        try:
+            await _insert_reward(db_manager, "a1", Task.avatar, "hotkey_a", "2024-06-01 00:00:01")
+            await _insert_reward(db_manager, "a2", Task.avatar, "hotkey_a", "2024-06-01 00:00:03")
+            await _insert_reward(db_manager, "a3", Task.jugger_inpainting, "hotkey_a", "2024-06-01 00:00:02")
+            await _insert_reward(db_manager, "b1", Task.avatar, "hotkey_b", "2024-06-01 00:00:01")
+
+            rewards = await db_manager.fetch_recent_most_rewards_for_hotkeys(
+                ["hotkey_a", "hotkey_b", "hotkey_c"], [Task.avatar, Task.jugger_inpainting], quality_tasks_to_fetch=3
+            )
+
+            ids = {key: [reward.id for reward in value] for key, value in rewards.items()}
+            assert ids[(Task.avatar, "hotkey_a")] == ["a2", "a1", "a2"]
+            assert ids[(Task.jugger_inpainting, "hotkey_a")] == ["a3", "a2", "a3"]
+            assert ids[(Task.avatar, "hotkey_b")] == ["b1", "b1"]
+            assert ids[(Task.jugger_inpainting, "hotkey_b")] == ["b1"]
+            assert ids[(Task.avatar, "hotkey_c")] == []
+        finally:
+            await db_manager.close()
+
+    asyncio.run(run())
+
+
+def test_concurrent_pops_take_distinct_results_from_the_least_rewarded_hotkey_first(tmp_path, monkeypatch):
+    async def run():
+        db_manager = await _make_db_manager(tmp_path, monkeypatch)
+        try:
+            await _insert_reward(db_manager, "a1", Task.avatar, "hotkey_a", "2024-06-01 00:00:01")
+            rows = [(Task.avatar.value, f'{{"n": {i}}}', "hotkey_a" if i < 3 else "hotkey_b") for i in range(6)]
+            await db_manager.storage.executemany(
+                "INSERT INTO tasks (task_name, checking_data, miner_hotkey) VALUES (?, ?, ?)", rows
+            )
+
+            popped = await asyncio.gather(*[db_manager.pop_task_result(Task.avatar) for _ in range(7)])
+
+            assert [result for result in popped if result is not None] == [
+                ({"n": 3}, "hotkey_b"),
+                ({"n": 4}, "hotkey_b"),
+                ({"n": 5}, "hotkey_b"),
+                ({"n": 0}, "hotkey_a"),
+                ({"n": 1}, "hotkey_a"),
+                ({"n": 2}, "hotkey_a"),
+            ]
+            assert popped.count(None) == 1
+        finally:
+            await db_manager.close()
+
+    asyncio.run(run())
+
+
+def test_clean_tables_of_hotkeys_removes_everything_for_only_those_hotkeys(tmp_path, monkeypatch):
+    async def run():
+        db_manager = await _make_db_manager(tmp_path, monkeypatch)
+        try:
+            for i in range(50):
+                await _insert_reward(db_manager, f"r{i}", Task.avatar, f"hotkey_{i % 10}", "2024-06-01 00:00:01")
+            await db_manager.storage.executemany(
+                "INSERT INTO tasks (task_name, checking_data, miner_hotkey) VALUES (?, ?, ?)",
+                [(Task.avatar.value, "{}", f"hotkey_{i}") for i in range(10)],
+            )
+
+            await db_manager.clean_tables_of_hotkeys([f"hotkey_{i}" for i in range(9)])
+
+            for table in ["reward_data", "tasks", "reward_data_aggregates"]:
+                hotkeys = await db_manager.storage.fetchall(f"SELECT DISTINCT miner_hotkey FROM {table}")
+                assert hotkeys == [("hotkey_9",)]
+            assert db_manager.result_sampler.counts[Task.avatar.value] == 1
+        finally:
+            await db_manager.close()
+
+    asyncio.run(run())
@@ -0,0 +1,46 @@
+import asyncio
+import inspect
+import re
+import sqlite3
+
+from validation.db import migrations
+from validation.db import sql
+
+FULL_SCAN_REGEX = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+SUBQUERY_REGEX = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (\w+)$")
+
+
+def _sql_queries():
+    for name, function in inspect.getmembers(sql, inspect.isfunction):
+        if function.__module__ == sql.__name__:
+            yield name, function()
+
+
+def _migrated_db(tmp_path) -> sqlite3.Connection:
+    db_path = str(tmp_path / "test.db")
+    asyncio.run(migrations.apply_migrations(db_path))
+    return sqlite3.connect(db_path)
+
+
+def test_migrations_apply_once(tmp_path):
+    db_path = str(tmp_path / "test.db")
+    applied = asyncio.run(migrations.apply_migrations(db_path))
+    assert applied == sorted(applied) and len(applied) > 0
+    assert asyncio.run(migrations.apply_migrations(db_path)) == []
+
+
+def test_no_query_does_a_full_table_scan(tmp_path):
+    conn = _migrated_db(tmp_path)
+    offenders = []
+    for name, query in _sql_queries():
+        params = [None] * query.count("?")
+        details = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()]
+
+        # Scanning the (already filtered) result of a subquery is fine, scanning a table isn't
+        subqueries = {match.group(1) for match in map(SUBQUERY_REGEX.match, details) if match}
+        for detail in details:
+            match = FULL_SCAN_REGEX.match(detail)
+            if match and match.group(1) not in subqueries:
+                offenders.append(f"{name}: {detail}")
+
+    assert offenders == []
@@ -0,0 +1,103 @@
+import asyncio
+import random
+
+from validation.db.result_sampler import ResultSampler, StoredResult
+from validation.db.storage_engine import StorageEngine
+from validation.db import migrations
+
+
+async def _make_sampler(tmp_path) -> ResultSampler:
+    db_path = str(tmp_path / "test.db")
+    await migrations.apply_migrations(db_path)
+    storage = StorageEngine(db_path, read_pool_size=1)
+    await storage.initialize()
+    return ResultSampler(storage, max_rows=7)
+
+
+def test_sampler_keeps_each_task_to_its_quota_and_matches_the_db(tmp_path):
+    random.seed(19)
+
+    async def run():
+        sampler = await _make_sampler(tmp_path)
+        try:
+            kept = 0
+            for i in range(300):
+                task = "avatar" if i % 3 else "upscale"
+                quota = 20 if task == "avatar" else 5
+                kept += sampler.offer(task, quota, lambda: StoredResult(task, f"data-{i}", "hotkey", {}))
+                if i % 50 == 0:
+                    await asyncio.sleep(0)
+
+            assert kept < 300
+            assert sampler.counts == {"avatar": 20, "upscale": 5}
+
+            stored_counts = await sampler.resync_counts()
+            assert stored_counts == {"avatar": 20, "upscale": 5}
+
+            # Random results are pushed out, not just the oldest, so some early ones are still there
+            rows = await sampler.storage.fetchall("SELECT checking_data FROM tasks WHERE task_name = 'avatar'")
+            stored = [int(row[0].split("-")[1]) for row in rows]
+            assert len(stored) == 20
+            assert min(stored) < 150
+
+            sampler.result_taken("upscale")
+            assert sampler.counts["upscale"] == 4
+            assert sampler.offer("upscale", 5, lambda: StoredResult("upscale", "fresh", "hotkey", {}))
+        finally:
+            await sampler.stop()
+            await sampler.storage.close()
+
+    asyncio.run(run())
+
+
+def test_syncing_the_counts_doesnt_reset_the_sample(tmp_path):
+    random.seed(6)
+
+    async def run():
+        sampler = await _make_sampler(tmp_path)
+        made = 0
+
+        def _make_row() -> StoredResult:
+            nonlocal made
+            made += 1
+            return StoredResult("avatar", "data", "hotkey", {})
+
+        try:
+            # As the scorer does, every so often
+            for i in range(2000):
+                sampler.offer("avatar", 10, _make_row)
+                if i % 20 == 0:
+                    await sampler.resync_counts()
+
+            # A reservoir of 10 from 2000 keeps about 10 * (1 + ln(200)), ~63 - a reset every
+            # 20 results would keep hundreds
+            assert made < 120
+            assert await sampler.resync_counts() == {"avatar": 10}
+        finally:
+            await sampler.stop()
+            await sampler.storage.close()
+
+    asyncio.run(run())
+
+
+def test_a_full_task_still_takes_new_results_after_a_long_run(tmp_path):
+    random.seed(4)
+
+    async def run():
+        sampler = await _make_sampler(tmp_path)
+        try:
+            for i in range(100_000):
+                sampler.offer("avatar", 10, lambda: StoredResult("avatar", "old", "hotkey", {}), now=i * 0.1)
+
+            # A reservoir over all 100k would keep about one in 10k from here on
+            later = 100_000 * 0.1 + 6 * 60 * 60
+            kept = sum(
+                sampler.offer("avatar", 10, lambda: StoredResult("avatar", "new", "hotkey", {}), now=later + i)
+                for i in range(100)
+            )
+            assert kept >= 5
+        finally:
+            await sampler.stop()
+            await sampler.storage.close()
+
+    asyncio.run(run())
@@ -0,0 +1,63 @@
+import asyncio
+
+from validation.db.retention import RetentionWorker
+from tests.validation.db.test_db_management import _make_db_manager
+
+
+def test_retention_prunes_in_chunks_and_keeps_the_aggregates_in_step(tmp_path, monkeypatch):
+    async def run():
+        db_manager = await _make_db_manager(tmp_path, monkeypatch)
+        try:
+            rows = [
+                (f"id-{i}", "avatar", 1, 0.5, "vali", f"hotkey_{i % 3}", 1, 1.0, created_at)
+                for i, created_at in enumerate(["2000-01-01 00:00:00"] * 25 + ["2999-01-01 00:00:00"] * 5)
+            ]
+            await db_manager.storage.executemany(
+                "INSERT INTO reward_data (id, task, axon_uid, quality_score, validator_hotkey, miner_hotkey, "
+                "synthetic_query, speed_scoring_factor, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+            worker = RetentionWorker(db_manager.storage, chunk_size=10, pause_between_chunks_seconds=0)
+            await worker.run_once()
+
+            assert worker.stats()["rows_pruned"]["reward_data"] == 25
+            assert worker.stats()["runs"] == 1
+            remaining = await db_manager.storage.fetchone("SELECT COUNT(*) FROM reward_data")
+            assert remaining == (5,)
+            reward_counts = await db_manager.storage.fetchone("SELECT SUM(reward_count) FROM reward_data_aggregates")
+            assert reward_counts == (5,)
+            assert await db_manager.storage.fetchone("PRAGMA auto_vacuum") == (2,)
+        finally:
+            await db_manager.close()
+
+    asyncio.run(run())
+
+
+def test_stop_waits_for_a_run_in_progress_to_be_cancelled(tmp_path, monkeypatch):
+    async def run():
+        db_manager = await _make_db_manager(tmp_path, monkeypatch)
+        try:
+            run_started = asyncio.Event()
+            run_finished = False
+
+            worker = RetentionWorker(db_manager.storage)
+
+            async def _slow_run() -> None:
+                nonlocal run_finished
+                run_started.set()
+                try:
+                    await asyncio.sleep(60)
+                finally:
+                    run_finished = True
+
+            worker.run_once = _slow_run
+            worker.start()
+            await run_started.wait()
+
+            await worker.stop()
+            assert run_finished
+        finally:
+            await db_manager.close()
+
+    asyncio.run(run())
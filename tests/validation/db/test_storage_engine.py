@@ -0,0 +1,136 @@
+import asyncio
+
+import aiosqlite
+
+from validation.db.storage_engine import StorageEngine
+
+
+async def _make_engine(tmp_path) -> StorageEngine:
+    engine = StorageEngine(str(tmp_path / "test.db"), read_pool_size=2)
+    await engine.initialize()
+    await engine.execute("CREATE TABLE things (name TEXT NOT NULL)")
+    return engine
+
+
+def test_reads_are_not_blocked_by_an_open_write(tmp_path):
+    async def run():
+        engine = await _make_engine(tmp_path)
+        await engine.execute("INSERT INTO things VALUES (?)", ("first",))
+
+        write_started = asyncio.Event()
+        release_write = asyncio.Event()
+
+        async def slow_write(conn: aiosqlite.Connection) -> None:
+            await conn.execute("INSERT INTO things VALUES (?)", ("second",))
+            write_started.set()
+            await release_write.wait()
+
+        write = asyncio.create_task(engine.write(slow_write))
+        await write_started.wait()
+
+        # The write transaction is still open, but we can read the last committed state
+        rows = await asyncio.wait_for(engine.fetchall("SELECT name FROM things"), timeout=2)
+        assert rows == [("first",)]
+
+        release_write.set()
+        await write
+        rows = await engine.fetchall("SELECT name FROM things ORDER BY name")
+        assert rows == [("first",), ("second",)]
+        await engine.close()
+
+    asyncio.run(run())
+
+
+def test_a_failing_write_job_does_not_roll_back_its_neighbours(tmp_path):
+    async def run():
+        engine = await _make_engine(tmp_path)
+
+        async def bad_job(conn: aiosqlite.Connection) -> None:
+            await conn.execute("INSERT INTO things VALUES (?)", ("bad",))
+            raise ValueError("nope")
+
+        results = await asyncio.gather(
+            engine.execute("INSERT INTO things VALUES (?)", ("a",)),
+            engine.write(bad_job),
+            engine.execute("INSERT INTO things VALUES (?)", ("b",)),
+            return_exceptions=True,
+        )
+        assert isinstance(results[1], ValueError)
+
+        rows = await engine.fetchall("SELECT name FROM things ORDER BY name")
+        assert rows == [("a",), ("b",)]
+        await engine.close()
+
+    asyncio.run(run())
+
+
+def test_close_flushes_queued_writes(tmp_path):
+    async def run():
+        engine = await _make_engine(tmp_path)
+        writes = [asyncio.create_task(engine.execute("INSERT INTO things VALUES (?)", (str(i),))) for i in range(50)]
+        await asyncio.sleep(0)
+        await engine.close()
+        await asyncio.gather(*writes)
+
+        async with aiosqlite.connect(engine.db_path) as conn:
+            async with conn.execute("SELECT COUNT(*) FROM things") as cursor:
+                assert (await cursor.fetchone())[0] == 50
+            async with conn.execute("PRAGMA journal_mode") as cursor:
+                assert (await cursor.fetchone())[0] == "wal"
+
+    asyncio.run(run())
+
+
+class _BrokenConnection:
+    """A writer connection whose COMMIT and ROLLBACK both fail"""
+
+    in_transaction = True
+
+    async def execute(self, query: str, *args) -> None:
+        if query in ("COMMIT", "ROLLBACK"):
+            raise aiosqlite.OperationalError(f"{query} failed")
+
+
+def test_a_failing_rollback_still_fails_the_jobs_and_keeps_the_writer_going(tmp_path):
+    async def run():
+        engine = await _make_engine(tmp_path)
+        real_conn = engine._writer_conn
+        engine._writer_conn = _BrokenConnection()
+
+        async def job(conn) -> None:
+            ...
+
+        future = asyncio.get_running_loop().create_future()
+        await engine._apply_batch([(job, future, False)])
+        assert isinstance(future.exception(), aiosqlite.OperationalError)
+
+        engine._writer_conn = real_conn
+        await engine.execute("INSERT INTO things VALUES (?)", ("after",))
+        assert await engine.fetchall("SELECT name FROM things") == [("after",)]
+        await engine.close()
+
+    asyncio.run(run())
+
+
+def test_only_the_maintaining_process_changes_the_db_file(tmp_path):
+    async def run():
+        db_path = str(tmp_path / "test.db")
+
+        async def _file_settings(engine: StorageEngine):
+            return (
+                await engine.fetchone("PRAGMA journal_mode"),
+                await engine.fetchone("PRAGMA auto_vacuum"),
+            )
+
+        # An API worker just opens its connections
+        worker_engine = StorageEngine(db_path, read_pool_size=1)
+        await worker_engine.initialize(run_maintenance=False)
+        assert await _file_settings(worker_engine) == (("delete",), (0,))
+        await worker_engine.close()
+
+        core_engine = StorageEngine(db_path, read_pool_size=1)
+        await core_engine.initialize()
+        assert await _file_settings(core_engine) == (("wal",), (2,))
+        await core_engine.close()
+
+    asyncio.run(run())
@@ -0,0 +1,100 @@
+import asyncio
+
+from validation.db.storage_engine import StorageEngine
+from validation.db.write_buffer import WriteBehindBuffer
+
+
+async def _make_engine(tmp_path) -> StorageEngine:
+    engine = StorageEngine(str(tmp_path / "test.db"), read_pool_size=1)
+    await engine.initialize()
+    await engine.execute("CREATE TABLE things (name TEXT NOT NULL)")
+    return engine
+
+
+async def _count(engine: StorageEngine) -> int:
+    return (await engine.fetchone("SELECT COUNT(*) FROM things"))[0]
+
+
+def test_buffer_flushes_on_size_and_on_demand(tmp_path):
+    async def run():
+        engine = await _make_engine(tmp_path)
+        buffer = WriteBehindBuffer("things", engine, "INSERT INTO things VALUES (?)", max_rows=10, max_delay_seconds=60)
+        buffer.start()
+
+        try:
+            for i in range(10):
+                buffer.add((str(i),))
+            await asyncio.sleep(0.2)
+            assert await _count(engine) == 10
+
+            for i in range(5):
+                buffer.add((str(i),))
+            await asyncio.sleep(0.2)
+            assert buffer.queue_depth() == 5
+            assert await _count(engine) == 10
+
+            await buffer.flush()
+            assert await _count(engine) == 15
+            assert buffer.stats()["rows_flushed"] == 15
+            assert buffer.stats()["queue_depth"] == 0
+        finally:
+            await buffer.stop()
+            await engine.close()
+
+    asyncio.run(run())
+
+
+def test_buffer_flushes_on_time_and_on_stop(tmp_path):
+    async def run():
+        engine = await _make_engine(tmp_path)
+        buffer = WriteBehindBuffer(
+            "things", engine, "INSERT INTO things VALUES (?)", max_rows=100, max_delay_seconds=0.1
+        )
+        buffer.start()
+
+        try:
+            buffer.add(("a",))
+            await asyncio.sleep(0.3)
+            assert await _count(engine) == 1
+
+            buffer.add(("b",))
+            await buffer.stop()
+            assert await _count(engine) == 2
+        finally:
+            await buffer.stop()
+            await engine.close()
+
+    asyncio.run(run())
+
+
+def test_a_bad_row_is_dropped_rather_than_holding_up_the_buffer(tmp_path):
+    async def run():
+        engine = await _make_engine(tmp_path)
+        buffer = WriteBehindBuffer(
+            "things", engine, "INSERT INTO things VALUES (?)", max_delay_seconds=60, max_flush_attempts=2
+        )
+
+        try:
+            buffer.add(("a",))
+            buffer.add((None,))
+            for _ in range(2):
+                await buffer.flush()
+                assert buffer.queue_depth() == 2
+            assert await _count(engine) == 0
+
+            buffer.add(("b",))
+            await buffer.flush()
+            assert buffer.queue_depth() == 0
+            assert await _count(engine) == 2
+            assert buffer.stats()["rows_dropped"] == 1
+            assert buffer.stats()["failed_flushes"] == 2
+
+            # And back to normal flushes after
+            buffer.add(("c",))
+            await buffer.flush()
+            assert await _count(engine) == 3
+        finally:
+            await buffer.stop()
+            await engine.close()
+
+    asyncio.run(run())
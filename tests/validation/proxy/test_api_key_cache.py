@@ -0,0 +1,31 @@
+import asyncio
+
+from validation.proxy import api_key_cache as api_key_cache_module
+from validation.proxy import sql
+from validation.proxy.api_key_cache import ApiKeyCache
+from tests.validation.db.test_db_management import _make_db_manager
+
+
+def test_api_key_cache_serves_from_memory_until_stale_or_invalidated(tmp_path, monkeypatch):
+    async def run():
+        db_manager = await _make_db_manager(tmp_path, monkeypatch)
+        monkeypatch.setattr(api_key_cache_module, "db_manager", db_manager)
+        try:
+            await db_manager.storage.execute(
+                "INSERT INTO api_keys (key, name, balance, rate_limit_per_minute) VALUES ('key', 'name', 10, 60)"
+            )
+            cache = ApiKeyCache(ttl_seconds=60)
+
+            assert (await cache.get("key"))[sql.BALANCE] == 10
+            assert await cache.get("not-a-key") is None
+
+            cache.adjust_balance("key", -1)
+            await db_manager.storage.execute("UPDATE api_keys SET balance = 5 WHERE key = 'key'")
+            assert (await cache.get("key"))[sql.BALANCE] == 9
+
+            cache.invalidate()
+            assert (await cache.get("key"))[sql.BALANCE] == 5
+        finally:
+            await db_manager.close()
+
+    asyncio.run(run())
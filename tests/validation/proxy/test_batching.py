@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from models import request_models
+from validation.proxy.api_server import batching
+from validation.proxy.api_server.middleware import BILLED_ITEMS_STATE_KEY
+
+
+class _Body(BaseModel):
+    delay: float
+    outcome: str
+
+
+async def _handle_one(body: _Body):
+    await asyncio.sleep(body.delay)
+    if body.outcome == "http_error":
+        raise HTTPException(status_code=403, detail="NSFW content detected")
+    if body.outcome == "json_response":
+        return JSONResponse(status_code=500, content={"error": "No UIDs available"})
+    if body.outcome == "crash":
+        raise RuntimeError("boom")
+    return request_models.TextToImageResponse(image_b64=body.outcome)
+
+
+def _make_request() -> Request:
+    return Request({"type": "http", "headers": [], "method": "POST", "path": "/text-to-image-batch"})
+
+
+BODIES = [
+    _Body(delay=0.03, outcome="first"),
+    _Body(delay=0.0, outcome="http_error"),
+    _Body(delay=0.01, outcome="json_response"),
+    _Body(delay=0.02, outcome="crash"),
+    _Body(delay=0.0, outcome="last"),
+]
+
+
+def test_one_failing_request_never_fails_the_batch():
+    async def run():
+        request = _make_request()
+        response = await batching.run_batch(request, BODIES, _handle_one, stream=False)
+
+        assert [(result.index, result.status_code) for result in response.results] == [
+            (0, 200),
+            (1, 403),
+            (2, 500),
+            (3, 500),
+            (4, 200),
+        ]
+        assert response.results[0].image_b64 == "first"
+        assert response.results[1].error == "NSFW content detected"
+        assert json.loads(response.results[2].error) == {"error": "No UIDs available"}
+        # Only the ones that worked are billed
+        assert request.scope["state"][BILLED_ITEMS_STATE_KEY] == 2
+
+    asyncio.run(run())
+
+
+def test_streamed_results_come_as_they_finish_with_a_limit_on_concurrency():
+    async def run():
+        in_flight = 0
+        most_in_flight = 0
+
+        async def _counting_handle_one(body: _Body):
+            nonlocal in_flight, most_in_flight
+            in_flight += 1
+            most_in_flight = max(most_in_flight, in_flight)
+            try:
+                return await _handle_one(body)
+            finally:
+                in_flight -= 1
+
+        request = _make_request()
+        response = await batching.run_batch(request, BODIES, _counting_handle_one, stream=True, max_concurrency=2)
+        lines = [json.loads(line) async for line in response.body_iterator]
+
+        assert response.media_type == "application/x-ndjson"
+        assert sorted(line["index"] for line in lines) == [0, 1, 2, 3, 4]
+        assert lines[0]["index"] == 1
+        assert most_in_flight == 2
+        assert request.scope["state"][BILLED_ITEMS_STATE_KEY] == 2
+
+    asyncio.run(run())
@@ -0,0 +1,148 @@
+import asyncio
+
+from validation.proxy import api_key_cache as api_key_cache_module
+from validation.proxy import billing_ledger as billing_ledger_module
+from validation.proxy import sql
+from validation.proxy.api_key_cache import ApiKeyCache
+from validation.proxy.billing_ledger import BillingLedger
+from tests.validation.db.test_db_management import _make_db_manager
+
+
+def test_debits_show_in_memory_at_once_and_in_the_db_after_a_flush(tmp_path, monkeypatch):
+    async def run():
+        db_manager = await _make_db_manager(tmp_path, monkeypatch)
+        monkeypatch.setattr(api_key_cache_module, "db_manager", db_manager)
+        monkeypatch.setattr(billing_ledger_module, "db_manager", db_manager)
+        try:
+            await db_manager.storage.execute(
+                "INSERT INTO api_keys (key, name, balance, rate_limit_per_minute) VALUES ('key', 'name', 10, 60)"
+            )
+            cache = ApiKeyCache(ttl_seconds=60)
+            ledger = BillingLedger(cache)
+
+            api_key_info = await cache.get("key")
+            for _ in range(3):
+                ledger.debit(api_key_info, "/text-to-image", 1)
+            assert (await cache.get("key"))[sql.BALANCE] == 7
+            assert await db_manager.storage.fetchone("SELECT balance FROM api_keys") == (10,)
+
+            # A reload before the flush still counts the debits
+            cache.invalidate()
+            assert (await cache.get("key"))[sql.BALANCE] == 7
+
+            await ledger.flush()
+            assert await db_manager.storage.fetchone("SELECT balance FROM api_keys") == (7,)
+            assert await db_manager.storage.fetchone("SELECT COUNT(*), SUM(cost) FROM logs") == (3, 3)
+
+            cache.invalidate()
+            assert (await cache.get("key"))[sql.BALANCE] == 7
+        finally:
+            await db_manager.close()
+
+    asyncio.run(run())
+
+
+def test_flushes_keep_the_log_rollups_up_to_date(tmp_path, monkeypatch):
+    async def run():
+        db_manager = await _make_db_manager(tmp_path, monkeypatch)
+        monkeypatch.setattr(api_key_cache_module, "db_manager", db_manager)
+        monkeypatch.setattr(billing_ledger_module, "db_manager", db_manager)
+        try:
+            await db_manager.storage.execute(
+                "INSERT INTO api_keys (key, name, balance, rate_limit_per_minute) VALUES ('key', 'name', 100, 60)"
+            )
+            cache = ApiKeyCache(ttl_seconds=60)
+            ledger = BillingLedger(cache)
+            api_key_info = await cache.get("key")
+
+            ledger.debit(api_key_info, "/text-to-image", 1, latency=2.0)
+            ledger.debit(api_key_info, "/clip-embeddings", 0.2, latency=0.5)
+            await ledger.flush()
+            # A second flush lands in the same buckets, so adds to them
+            ledger.debit(api_key_info, "/text-to-image", 1, latency=4.0)
+            await ledger.flush()
+
+            for table in [sql.LOG_ROLLUPS_HOURLY_TABLE, sql.LOG_ROLLUPS_DAILY_TABLE]:
+                rows = await db_manager.storage.fetchall(
+                    f"SELECT endpoint, request_count, credits_used, total_latency, max_latency FROM {table} "
+                    "ORDER BY endpoint"
+                )
+                assert rows == [("/clip-embeddings", 1, 0.2, 0.5, 0.5), ("/text-to-image", 2, 2, 6.0, 4.0)]
+
+            async with db_manager.storage.reader() as conn:
+                usage_by_key = await sql.get_usage_by_key(conn)
+            assert usage_by_key == [
+                {
+                    "name": "key",
+                    sql.REQUEST_COUNT: 3,
+                    sql.CREDITS_USED: 2.2,
+                    "average_latency": 6.5 / 3,
+                    sql.MAX_LATENCY: 4.0,
+                }
+            ]
+        finally:
+            await db_manager.close()
+
+    asyncio.run(run())
+
+
+def test_a_key_deleted_with_bills_waiting_doesnt_stop_billing_for_the_others(tmp_path, monkeypatch):
+    async def run():
+        db_manager = await _make_db_manager(tmp_path, monkeypatch)
+        monkeypatch.setattr(api_key_cache_module, "db_manager", db_manager)
+        monkeypatch.setattr(billing_ledger_module, "db_manager", db_manager)
+        try:
+            await db_manager.storage.execute(
+                "INSERT INTO api_keys (key, name, balance, rate_limit_per_minute) "
+                "VALUES ('deleted', 'deleted', 10, 60), ('kept', 'kept', 10, 60)"
+            )
+            cache = ApiKeyCache(ttl_seconds=60)
+            ledger = BillingLedger(cache)
+
+            ledger.debit(await cache.get("deleted"), "/text-to-image", 1)
+            ledger.debit(await cache.get("kept"), "/text-to-image", 1)
+            await db_manager.storage.execute("DELETE FROM api_keys WHERE key = 'deleted'")
+
+            await ledger.flush()
+            assert ledger.stats()["failed_flushes"] == 0
+            assert ledger.stats()["logs_waiting"] == 0
+            assert await db_manager.storage.fetchall("SELECT key, balance FROM api_keys") == [("kept", 9)]
+            assert await db_manager.storage.fetchall("SELECT key FROM logs") == [("kept",)]
+            rollup_keys = await db_manager.storage.fetchall(f"SELECT key FROM {sql.LOG_ROLLUPS_HOURLY_TABLE}")
+            assert rollup_keys == [("kept",)]
+        finally:
+            await db_manager.close()
+
+    asyncio.run(run())
+
+
+def test_a_batch_that_keeps_failing_is_dropped(tmp_path, monkeypatch):
+    async def run():
+        db_manager = await _make_db_manager(tmp_path, monkeypatch)
+        monkeypatch.setattr(api_key_cache_module, "db_manager", db_manager)
+        monkeypatch.setattr(billing_ledger_module, "db_manager", db_manager)
+        try:
+            await db_manager.storage.execute(
+                "INSERT INTO api_keys (key, name, balance, rate_limit_per_minute) VALUES ('key', 'name', 10, 60)"
+            )
+            cache = ApiKeyCache(ttl_seconds=60)
+            ledger = BillingLedger(cache, max_flush_attempts=2)
+            ledger.debit(await cache.get("key"), "/text-to-image", 1)
+
+            await db_manager.storage.execute("ALTER TABLE logs RENAME TO logs_elsewhere")
+            await ledger.flush()
+            assert ledger.stats()["logs_waiting"] == 1
+            await ledger.flush()
+            assert ledger.stats()["logs_waiting"] == 0
+            assert ledger.stats()["bills_dropped"] == 1
+            assert ledger.pending_debit("key") == 0
+
+            # Later bills go through once the db is back
+            await db_manager.storage.execute("ALTER TABLE logs_elsewhere RENAME TO logs")
+            ledger.debit(await cache.get("key"), "/text-to-image", 1)
+            await ledger.flush()
+            assert await db_manager.storage.fetchone("SELECT balance FROM api_keys") == (9,)
+        finally:
+            await db_manager.close()
+
+    asyncio.run(run())
@@ -0,0 +1,63 @@
+from validation.proxy.utils.circuit_breaker import PROBE_TIMEOUT_SECONDS, BreakerState, CircuitBreaker
+from tests.validation.proxy.test_miner_selection import TASK, _result
+
+
+def test_a_miner_that_keeps_429ing_is_opened_then_probed_back():
+    breaker = CircuitBreaker(failure_threshold=3, open_seconds=30)
+    for _ in range(2):
+        breaker.record(_result(1, 429), now=0)
+    assert breaker.state(TASK, 1, now=0) == BreakerState.closed
+    breaker.record(_result(1, 503), now=0)
+    assert breaker.state(TASK, 1, now=0) == BreakerState.open
+    assert not breaker.allow_request(TASK, 1, now=10)
+    assert breaker.closed_uids(TASK, [1, 2]) == [2]
+
+    # After the back off, one probe at a time
+    assert breaker.allow_request(TASK, 1, now=31)
+    assert breaker.state(TASK, 1, now=31) == BreakerState.half_open
+    assert not breaker.allow_request(TASK, 1, now=32)
+
+    # The probe fails, so it's open again for twice as long
+    breaker.record(_result(1, 429), now=35)
+    assert breaker.state(TASK, 1, now=90) == BreakerState.open
+    assert breaker.allow_request(TASK, 1, now=96)
+
+    breaker.record(_result(1, 200), now=97)
+    assert breaker.state(TASK, 1, now=97) == BreakerState.closed
+
+    assert breaker.metrics() == {
+        "states": {"closed": 1, "open": 0, "half_open": 0},
+        "transitions": {"closed->open": 1, "open->half_open": 2, "half_open->open": 1, "half_open->closed": 1},
+    }
+
+
+def test_only_timeouts_429s_and_5xxs_count():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record(_result(1, 400), now=0)
+    breaker.record(_result(1, 422), now=0)
+    breaker.record(_result(1, 408), now=0)
+    assert breaker.state(TASK, 1, now=0) == BreakerState.closed
+
+    # A success in between starts the count again
+    breaker.record(_result(1, 200), now=0)
+    breaker.record(_result(1, 500), now=0)
+    assert breaker.state(TASK, 1, now=0) == BreakerState.closed
+    breaker.record(_result(1, 500), now=0)
+    assert breaker.state(TASK, 1, now=0) == BreakerState.open
+
+
+def test_a_lost_probe_doesnt_leave_a_miner_stuck():
+    breaker = CircuitBreaker(failure_threshold=1, open_seconds=30)
+    breaker.record(_result(1, 429), now=0)
+    assert breaker.allow_request(TASK, 1, now=30)
+    assert not breaker.allow_request(TASK, 1, now=31)
+    assert breaker.allow_request(TASK, 1, now=30 + PROBE_TIMEOUT_SECONDS)
+
+
+def test_timeouts_and_unreachable_miners_open_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=2)
+    # The dendrite's timeouts and refused connections leave the axon's status code unset
+    no_answer = _result(1, 200).copy(update={"status_code": None, "success": False, "response_time": None})
+    breaker.record(no_answer, now=0)
+    breaker.record(no_answer, now=0)
+    assert breaker.state(TASK, 1, now=0) == BreakerState.open
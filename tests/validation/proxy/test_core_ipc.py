@@ -0,0 +1,195 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.responses import JSONResponse
+
+from core import Task, constants as core_cst
+from models import base_models, synapses, utility_models
+from validation.proxy.core_ipc import FRAME_HEADER, CoreIpcClient, CoreIpcServer, CoreStreamError, read_frame
+
+
+class _FakeCore:
+    validator_uid = 2
+
+    def __init__(self) -> None:
+        self.synapses = []
+
+    def capabilities(self):
+        return {"validator_uid": self.validator_uid, "tasks": {Task.chat_llama_3.value: 3}}
+
+    async def make_organic_query(self, task, stream, outgoing_model, synapse):
+        self.synapses.append(synapse)
+        if synapse.max_tokens == 0:
+            return JSONResponse(status_code=500, content={"error": "No UIDs available"})
+        if stream:
+
+            async def _stream():
+                for token in ["a", "b", "c"]:
+                    yield token
+                if synapse.max_tokens == 1:
+                    raise RuntimeError("Miner went away")
+
+            return _stream()
+        return utility_models.QueryResult(
+            formatted_response=outgoing_model(clip_embeddings=[[0.5, 1.0]]),
+            axon_uid=7,
+            miner_hotkey="hotkey",
+            response_time=0.1,
+            error_message=None,
+            task=task,
+            status_code=200,
+            success=True,
+        )
+
+
+def _make_synapse(max_tokens: int = 10) -> synapses.Chat:
+    return synapses.Chat(
+        messages=[{"role": "user", "content": "hi"}], model="llama-3", seed=0, temperature=0.5, max_tokens=max_tokens
+    )
+
+
+def test_organic_queries_round_trip_through_the_core(tmp_path):
+    async def run():
+        socket_path = str(tmp_path / "core.sock")
+        core = _FakeCore()
+        server = CoreIpcServer(socket_path, core)
+        await server.start()
+        client = CoreIpcClient(socket_path)
+        try:
+            result = await client.make_organic_query(
+                task=Task.chat_llama_3,
+                stream=False,
+                outgoing_model=base_models.ClipEmbeddingsOutgoing,
+                synapse=_make_synapse(),
+            )
+            assert isinstance(result, utility_models.QueryResult)
+            assert result.axon_uid == 7 and result.success
+            assert result.formatted_response == base_models.ClipEmbeddingsOutgoing(clip_embeddings=[[0.5, 1.0]])
+            # The core picks the seed, from its own chunk
+            seed = core.synapses[0].seed
+            assert core_cst.SEED_CHUNK_SIZE * 2 <= seed < core_cst.SEED_CHUNK_SIZE * 3
+
+            generator = await client.make_organic_query(
+                task=Task.chat_llama_3, stream=True, outgoing_model=base_models.ChatOutgoing, synapse=_make_synapse()
+            )
+            assert [chunk async for chunk in generator] == ["a", "b", "c"]
+
+            response = await client.make_organic_query(
+                task=Task.chat_llama_3, stream=True, outgoing_model=base_models.ChatOutgoing, synapse=_make_synapse(0)
+            )
+            assert response.status_code == 500
+            assert json.loads(response.body) == {"error": "No UIDs available"}
+        finally:
+            await client.stop()
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_workers_answer_while_the_core_is_down(tmp_path):
+    async def run():
+        socket_path = str(tmp_path / "core.sock")
+        server = CoreIpcServer(socket_path, _FakeCore())
+        await server.start()
+        client = CoreIpcClient(socket_path, capabilities_poll_interval_seconds=0.01)
+        client.start()
+        try:
+            for _ in range(100):
+                if client.capabilities().get("tasks"):
+                    break
+                await asyncio.sleep(0.01)
+            assert client.is_available()
+
+            await server.stop()
+            await asyncio.sleep(0.05)
+
+            response = await client.make_organic_query(
+                task=Task.chat_llama_3, stream=False, outgoing_model=base_models.ChatOutgoing, synapse=_make_synapse()
+            )
+            assert response.status_code == 503
+            assert not client.is_available()
+            # The last capabilities we had are still served
+            assert client.capabilities()["tasks"] == {Task.chat_llama_3.value: 3}
+
+            # And it reconnects once the core is back
+            server = CoreIpcServer(socket_path, _FakeCore())
+            await server.start()
+            result = await client.make_organic_query(
+                task=Task.chat_llama_3,
+                stream=False,
+                outgoing_model=base_models.ClipEmbeddingsOutgoing,
+                synapse=_make_synapse(),
+            )
+            assert result.success
+        finally:
+            await client.stop()
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_a_stream_the_core_fails_part_way_through_raises_rather_than_ending(tmp_path):
+    async def run():
+        socket_path = str(tmp_path / "core.sock")
+        server = CoreIpcServer(socket_path, _FakeCore())
+        await server.start()
+        client = CoreIpcClient(socket_path)
+        try:
+            generator = await client.make_organic_query(
+                task=Task.chat_llama_3, stream=True, outgoing_model=base_models.ChatOutgoing, synapse=_make_synapse(1)
+            )
+            chunks = []
+            with pytest.raises(CoreStreamError):
+                async for chunk in generator:
+                    chunks.append(chunk)
+            assert chunks == ["a", "b", "c"]
+        finally:
+            await client.stop()
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_a_bad_frame_from_the_core_fails_the_pending_queries_and_reconnects(tmp_path):
+    async def run():
+        socket_path = str(tmp_path / "core.sock")
+        connections = []
+
+        async def _garbled_core(reader, writer):
+            connections.append(writer)
+            await read_frame(reader)
+            writer.write(FRAME_HEADER.pack(3) + b"{{{")
+            await writer.drain()
+
+        server = await asyncio.start_unix_server(_garbled_core, path=socket_path)
+        client = CoreIpcClient(socket_path)
+        try:
+            response = await asyncio.wait_for(
+                client.make_organic_query(
+                    task=Task.chat_llama_3,
+                    stream=False,
+                    outgoing_model=base_models.ChatOutgoing,
+                    synapse=_make_synapse(),
+                ),
+                timeout=5,
+            )
+            assert response.status_code == 503
+            assert not client.is_available()
+
+            await asyncio.wait_for(
+                client.make_organic_query(
+                    task=Task.chat_llama_3,
+                    stream=False,
+                    outgoing_model=base_models.ChatOutgoing,
+                    synapse=_make_synapse(),
+                ),
+                timeout=5,
+            )
+            assert len(connections) == 2
+        finally:
+            await client.stop()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(run())
@@ -0,0 +1,42 @@
+import base64
+
+from validation.proxy.embedding_cache import EmbeddingCache, image_key
+
+
+def test_least_recently_used_embeddings_are_evicted_first():
+    cache = EmbeddingCache(max_entries=2)
+    cache.put("a", [0.1, 0.2])
+    cache.put("b", [0.3, 0.4])
+    assert cache.get("a") == [0.1, 0.2]
+
+    cache.put("c", [0.5, 0.6])
+    assert cache.get("b") is None
+    assert cache.get("a") == [0.1, 0.2]
+    assert cache.get("c") == [0.5, 0.6]
+    assert cache.stats() == {"entries": 2, "hits": 3, "disk_hits": 0, "misses": 1}
+
+
+def test_the_disk_tier_outlives_the_memory_tier(tmp_path):
+    cache = EmbeddingCache(max_entries=1)
+    cache.open_disk_tier(str(tmp_path))
+    cache.put("a", [0.1, 0.2])
+    cache.put("b", [0.3, 0.4])
+    assert cache.get("a") == [0.1, 0.2]
+    cache.close()
+
+    restarted_cache = EmbeddingCache()
+    restarted_cache.open_disk_tier(str(tmp_path))
+    try:
+        keys, embeddings = restarted_cache.lookup([base64.b64encode(b"image").decode()])
+        assert embeddings == [None]
+        restarted_cache.put(keys[0], [1.0])
+        assert restarted_cache.get("b") == [0.3, 0.4]
+        assert restarted_cache.stats()["disk_hits"] == 1
+    finally:
+        restarted_cache.close()
+
+
+def test_images_are_keyed_on_their_bytes_not_their_encoding():
+    image_bytes = b"not really an image" * 10
+    assert image_key(base64.b64encode(image_bytes).decode()) == image_key(base64.encodebytes(image_bytes).decode())
+    assert image_key(base64.b64encode(image_bytes).decode()) != image_key(base64.b64encode(b"another").decode())
@@ -0,0 +1,73 @@
+import asyncio
+import random
+
+from models import utility_models
+from validation.proxy.utils.hedging import HedgeBudget, Hedger
+from validation.proxy.utils.miner_selection import MinerSelector
+from tests.validation.proxy.test_miner_selection import TASK, _result
+
+
+def _make_hedger(budget_share: float = 1.0) -> Hedger:
+    selector = MinerSelector(rng=random.Random(0))
+    # p95 of recent latencies is about 0.1s
+    for i in range(100):
+        selector.record(_result(1, response_time=0.001 * (i + 1)))
+    return Hedger(enabled=True, budget=HedgeBudget(share=budget_share), selector=selector)
+
+
+async def _query(uid: int, seconds: float, success: bool = True) -> utility_models.QueryResult:
+    await asyncio.sleep(seconds)
+    return _result(uid, 200 if success else 500, response_time=seconds)
+
+
+def test_the_budget_caps_hedges_at_a_share_of_requests():
+    budget = HedgeBudget(share=0.05, max_saved=2)
+    spent = 0
+    for _ in range(1000):
+        budget.earn()
+        spent += budget.try_spend()
+    assert spent == 50
+
+    for _ in range(1000):
+        budget.earn()
+    assert budget.saved == 2
+
+
+def test_a_slow_query_is_hedged_and_the_first_success_wins():
+    async def run():
+        hedger = _make_hedger()
+        hedged_uids = []
+
+        def _query_another_miner():
+            hedged_uids.append(2)
+            return _query(2, 0.05)
+
+        # The first miner is slow, so the hedge answers first
+        result = await hedger.run(TASK, _query(1, 5), _query_another_miner)
+        assert result.axon_uid == 2
+        assert hedger.hedges_sent == 1 and hedger.hedges_won == 1
+
+        # The first miner is quick, so there's no hedge
+        result = await hedger.run(TASK, _query(1, 0.01), _query_another_miner)
+        assert result.axon_uid == 1
+        assert hedged_uids == [2]
+
+        # A failed hedge doesn't beat a slower success
+        result = await hedger.run(TASK, _query(1, 0.3), lambda: _query(2, 0.01, success=False))
+        assert result.axon_uid == 1 and result.success
+
+    asyncio.run(run())
+
+
+def test_no_hedge_without_budget_or_latencies():
+    async def run():
+        hedger = _make_hedger(budget_share=0)
+        result = await hedger.run(TASK, _query(1, 0.3), lambda: _query(2, 0.01))
+        assert result.axon_uid == 1
+        assert hedger.hedges_sent == 0
+
+        new_task_hedger = Hedger(enabled=True, budget=HedgeBudget(share=1), selector=MinerSelector())
+        result = await new_task_hedger.run(TASK, _query(1, 0.3), lambda: _query(2, 0.01))
+        assert result.axon_uid == 1
+
+    asyncio.run(run())
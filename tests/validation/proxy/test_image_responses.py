@@ -0,0 +1,50 @@
+import asyncio
+import base64
+import io
+
+from fastapi import Request
+from PIL import Image
+
+from models import request_models
+from validation.proxy.api_server.image import utils
+
+
+def _image_b64(image_format: str) -> str:
+    output = io.BytesIO()
+    Image.new("RGBA", (64, 32), (255, 0, 0, 255)).save(output, format=image_format)
+    return base64.b64encode(output.getvalue()).decode()
+
+
+def _make_request(accept: str) -> Request:
+    return Request({"type": "http", "headers": [(b"accept", accept.encode())], "method": "POST", "path": "/"})
+
+
+def test_the_most_preferred_image_type_is_picked_from_the_accept_header():
+    assert utils.requested_image_media_type(None) is None
+    assert utils.requested_image_media_type("application/json") is None
+    assert utils.requested_image_media_type("image/png") == "image/png"
+    assert utils.requested_image_media_type("image/png;q=0.5, image/webp") == "image/webp"
+    assert utils.requested_image_media_type("application/json, image/jpeg;q=0.9") is None
+    assert utils.requested_image_media_type("text/html, image/jpeg;q=0.9, */*;q=0.8") == "image/jpeg"
+    assert utils.requested_image_media_type("image/png;q=0") is None
+
+
+def test_images_are_sent_as_bytes_when_asked_for():
+    async def run():
+        png_b64 = _image_b64("PNG")
+        response = request_models.TextToImageResponse(image_b64=png_b64)
+
+        assert await utils.negotiate_image_response(_make_request("application/json"), response) is response
+
+        # Already a png, so sent as it is
+        png_response = await utils.negotiate_image_response(_make_request("image/png"), response)
+        assert png_response.media_type == "image/png"
+        assert png_response.body == base64.b64decode(png_b64)
+        assert png_response.headers["x-image-width"] == "64"
+        assert png_response.headers["x-image-height"] == "32"
+
+        jpeg_response = await utils.negotiate_image_response(_make_request("image/jpeg"), response)
+        assert jpeg_response.media_type == "image/jpeg"
+        assert Image.open(io.BytesIO(jpeg_response.body)).format == "JPEG"
+
+    asyncio.run(run())
@@ -0,0 +1,96 @@
+import asyncio
+
+from validation.proxy.utils.in_flight import InFlightTracker
+from tests.validation.proxy.test_miner_selection import TASK, _result
+
+
+def test_limits_grow_with_successes_at_the_limit_and_halve_on_429s():
+    async def run():
+        tracker = InFlightTracker(initial_limit=1)
+
+        # Not at the limit, so nothing learned
+        tracker.record(_result(1, 200))
+        assert tracker.stats(TASK)[1]["limit"] == 1
+
+        for _ in range(20):
+            async with tracker.slot(TASK, 1, wait=False):
+                tracker.record(_result(1, 200))
+        # Only ever one in flight, so it never gets past 2
+        assert tracker.stats(TASK)[1]["limit"] == 2
+
+        # Two at a time takes it to 3, and no further
+        async with tracker.slot(TASK, 1, wait=False), tracker.slot(TASK, 1, wait=False):
+            for _ in range(20):
+                tracker.record(_result(1, 200))
+        limit = tracker.stats(TASK)[1]["limit"]
+        assert 3 <= limit < 4
+
+        tracker.record(_result(1, 429))
+        assert tracker.stats(TASK)[1] == {"in_flight": 0, "limit": limit / 2, "waiting": 0}
+        for _ in range(5):
+            tracker.record(_result(1, 429))
+        assert tracker.stats(TASK)[1]["limit"] == 1
+
+    asyncio.run(run())
+
+
+def test_busy_miners_are_avoided_and_synthetic_queries_wait_for_a_slot():
+    async def run():
+        tracker = InFlightTracker(initial_limit=1)
+        order = []
+
+        async def _query(name: str, seconds: float) -> None:
+            async with tracker.slot(TASK, 1, wait=True):
+                order.append(f"{name} started")
+                await asyncio.sleep(seconds)
+                order.append(f"{name} done")
+
+        first = asyncio.create_task(_query("first", 0.05))
+        await asyncio.sleep(0.01)
+        assert tracker.uids_with_free_slots(TASK, [1, 2]) == [2]
+
+        await _query("second", 0)
+        await first
+        assert order == ["first started", "first done", "second started", "second done"]
+        assert tracker.uids_with_free_slots(TASK, [1, 2]) == [1, 2]
+
+        # Organic queries don't wait, and a synthetic one only waits so long
+        tracker.max_wait_seconds = 0.01
+        async with tracker.slot(TASK, 1, wait=False):
+            async with tracker.slot(TASK, 1, wait=True):
+                assert tracker.stats(TASK)[1]["in_flight"] == 2
+
+    asyncio.run(run())
+
+
+def test_waiting_queries_never_overrun_the_limit():
+    async def run():
+        tracker = InFlightTracker(initial_limit=2)
+        in_flight = 0
+        most_in_flight = 0
+        order = []
+
+        async def _query(name: int) -> None:
+            nonlocal in_flight, most_in_flight
+            async with tracker.slot(TASK, 1, wait=True):
+                in_flight += 1
+                most_in_flight = max(most_in_flight, in_flight)
+                order.append(name)
+                await asyncio.sleep(0.01)
+                in_flight -= 1
+
+        await asyncio.gather(*[_query(name) for name in range(10)])
+        assert most_in_flight == 2
+        # First come first served
+        assert order == list(range(10))
+
+        # A waiter that's cancelled doesn't keep hold of a slot
+        async with tracker.slot(TASK, 1, wait=False), tracker.slot(TASK, 1, wait=False):
+            waiter = asyncio.create_task(_query(10))
+            await asyncio.sleep(0.01)
+            assert tracker.stats(TASK)[1]["waiting"] == 1
+            waiter.cancel()
+            await asyncio.sleep(0)
+        assert tracker.stats(TASK)[1] == {"in_flight": 0, "limit": 2, "waiting": 0}
+
+    asyncio.run(run())
@@ -0,0 +1,158 @@
+import asyncio
+import time
+from typing import List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from starlette.responses import StreamingResponse
+from starlette.types import Message
+
+from validation.proxy import sql
+from validation.proxy.api_key_cache import ApiKeyCache
+from validation.proxy.api_server.middleware import ADMIT_ITEMS_STATE_KEY, BILLED_ITEMS_STATE_KEY, ApiKeyMiddleware
+from validation.proxy.billing_ledger import BillingLedger
+from validation.proxy.rate_limiter import SlidingWindowRateLimiter
+
+
+def _make_middleware(balance: float = 10, rate_limit: int = 60):
+    app = FastAPI()
+
+    @app.post("/chat")
+    async def chat() -> StreamingResponse:
+        async def _stream():
+            for token in ["a ", "b ", "c "]:
+                yield token
+
+        return StreamingResponse(_stream(), media_type="text/plain")
+
+    @app.post("/text-to-image-batch")
+    async def batch(request: Request) -> JSONResponse:
+        rejection = getattr(request.state, ADMIT_ITEMS_STATE_KEY)(3)
+        if rejection is not None:
+            return rejection
+        setattr(request.state, BILLED_ITEMS_STATE_KEY, 3)
+        return JSONResponse(content={"results": []})
+
+    @app.post("/stats")
+    async def stats() -> JSONResponse:
+        return JSONResponse(content={"circuit_breakers": {}})
+
+    @app.post("/fails")
+    async def fails() -> JSONResponse:
+        return JSONResponse(status_code=500, content={"detail": "no"})
+
+    cache = ApiKeyCache(ttl_seconds=60)
+    cache._keys = {"key": {sql.KEY: "key", sql.BALANCE: balance, sql.RATE_LIMIT_PER_MINUTE: rate_limit}}
+    cache._loaded_at = time.monotonic()
+    ledger = BillingLedger(cache)
+    return ApiKeyMiddleware(app, cache=cache, ledger=ledger, limiter=SlidingWindowRateLimiter()), ledger
+
+
+async def _call(middleware: ApiKeyMiddleware, path: str, api_key: Optional[str], billed_at: List[int]) -> List[Message]:
+    headers = [(b"authorization", f"Bearer {api_key}".encode())] if api_key else []
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": headers,
+        "client": ("127.0.0.1", 1234),
+        "server": ("127.0.0.1", 8000),
+    }
+    messages: List[Message] = []
+    request_sent = False
+
+    async def receive() -> Message:
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.sleep(10)
+        return {"type": "http.disconnect"}
+
+    async def send(message: Message) -> None:
+        # How many requests had been billed when each message went out
+        billed_at.append(middleware.ledger.requests_billed)
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    return messages
+
+
+def test_streamed_chunks_pass_straight_through_and_are_billed_after_the_last_one():
+    async def run():
+        middleware, ledger = _make_middleware()
+        billed_at: List[int] = []
+        messages = await _call(middleware, "/chat", "key", billed_at)
+
+        bodies = [message["body"] for message in messages if message["type"] == "http.response.body"]
+        assert b"".join(bodies) == b"a b c "
+        assert len([body for body in bodies if body]) == 3
+        assert billed_at == [0] * len(messages)
+        assert ledger.requests_billed == 1
+        assert ledger.pending_debit("key") == 1
+
+    asyncio.run(run())
+
+
+def test_failed_and_unauthenticated_requests_are_not_billed():
+    async def run():
+        middleware, ledger = _make_middleware()
+
+        messages = await _call(middleware, "/fails", "key", [])
+        assert messages[0]["status"] == 500
+
+        messages = await _call(middleware, "/chat", None, [])
+        assert messages[0]["status"] == 401
+        messages = await _call(middleware, "/chat", "not-a-key", [])
+        assert messages[0]["status"] == 401
+
+        assert ledger.requests_billed == 0
+
+    asyncio.run(run())
+
+
+def test_batches_are_billed_per_item_that_worked():
+    async def run():
+        middleware, ledger = _make_middleware()
+        messages = await _call(middleware, "/text-to-image-batch", "key", [])
+        assert messages[0]["status"] == 200
+        assert ledger.pending_debit("key") == 3
+
+    asyncio.run(run())
+
+
+def test_batches_need_the_credits_and_rate_limit_for_every_item():
+    async def run():
+        middleware, ledger = _make_middleware(balance=2.5)
+        messages = await _call(middleware, "/text-to-image-batch", "key", [])
+        assert messages[0]["status"] == 429
+        assert b"credits" in messages[1]["body"]
+
+        middleware, ledger = _make_middleware(rate_limit=4)
+        messages = await _call(middleware, "/text-to-image-batch", "key", [])
+        assert messages[0]["status"] == 200
+        # Three counted already, so the next batch's three would be over the limit
+        messages = await _call(middleware, "/text-to-image-batch", "key", [])
+        assert messages[0]["status"] == 429
+        assert b"Rate limit" in messages[1]["body"]
+        assert ledger.pending_debit("key") == 3
+
+    asyncio.run(run())
+
+
+def test_stats_need_a_key_but_are_free():
+    async def run():
+        middleware, ledger = _make_middleware()
+        messages = await _call(middleware, "/stats", None, [])
+        assert messages[0]["status"] == 401
+
+        messages = await _call(middleware, "/stats", "key", [])
+        assert messages[0]["status"] == 200
+        assert ledger.pending_debit("key") == 0
+
+    asyncio.run(run())
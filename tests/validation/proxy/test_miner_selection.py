@@ -0,0 +1,56 @@
+import collections
+import random
+
+from core import Task
+from models import utility_models
+from validation.proxy.utils.miner_selection import MinerSelector
+
+TASK = Task.proteus_text_to_image
+
+
+def _result(
+    uid: int, status_code: int = 200, response_time: float = 1.0, hotkey: str = "hotkey"
+) -> utility_models.QueryResult:
+    """A query result from a miner, for the tests of what's learned from them"""
+    success = status_code == 200
+    return utility_models.QueryResult(
+        formatted_response=None,
+        axon_uid=uid,
+        miner_hotkey=hotkey,
+        response_time=response_time if success else None,
+        error_message=None,
+        task=TASK,
+        status_code=status_code,
+        success=success,
+    )
+
+
+def test_fast_reliable_miners_get_most_of_the_traffic():
+    selector = MinerSelector(exploration_share=0.1, rng=random.Random(0))
+    uids = [1, 2, 3, 4]
+    for _ in range(20):
+        selector.record(_result(1, response_time=1.0))
+        selector.record(_result(2, response_time=2.0))
+        selector.record(_result(3, response_time=8.0))
+        # Fast, but fails most of the time
+        selector.record(_result(4, 500))
+
+    picks = collections.Counter(selector.select(TASK, uids) for _ in range(10_000))
+    assert picks[1] > picks[2] > picks[3]
+    assert picks[1] > picks[4]
+    # Exploration still sends the slowest some traffic
+    assert picks[3] > 0
+
+
+def test_new_miners_are_tried_before_known_ones():
+    selector = MinerSelector(exploration_share=0, rng=random.Random(0))
+    selector.record(_result(1, response_time=1.0))
+    picks = collections.Counter(selector.select(TASK, [1, 2]) for _ in range(100))
+    assert picks == {2: 100}
+
+
+def test_excluded_and_missing_miners_are_not_picked():
+    selector = MinerSelector()
+    assert selector.select(TASK, []) is None
+    assert selector.select(TASK, [1], exclude=[1]) is None
+    assert {selector.select(TASK, [1, 2, 3], exclude=[1, 3]) for _ in range(20)} == {2}
@@ -0,0 +1,52 @@
+import asyncio
+
+from validation.proxy.utils.circuit_breaker import BreakerState, CircuitBreaker
+from validation.proxy.utils.in_flight import InFlightTracker
+from validation.proxy.utils.miner_selection import MinerSelector
+from validation.proxy.utils.miner_state import MinerStates
+from tests.validation.proxy.test_miner_selection import TASK, _result
+
+
+def _make_miner_states() -> MinerStates:
+    return MinerStates(
+        selector=MinerSelector(), breaker=CircuitBreaker(failure_threshold=1), in_flight=InFlightTracker()
+    )
+
+
+def test_results_are_learned_from_everywhere():
+    async def run():
+        miner_states = _make_miner_states()
+        async with miner_states.in_flight.slot(TASK, 1, wait=False):
+            miner_states.record(_result(1, 200))
+        miner_states.record(_result(2, 429))
+
+        assert miner_states.selector.stats(TASK)[1]["observations"] == 1
+        assert miner_states.in_flight.stats(TASK)[1]["limit"] == 2
+        assert miner_states.breaker.state(TASK, 2) == BreakerState.open
+
+    asyncio.run(run())
+
+
+def test_a_uid_with_a_new_hotkey_is_forgotten_everywhere():
+    async def run():
+        miner_states = _make_miner_states()
+        miner_states.add_uid(TASK, 1, "old")
+        async with miner_states.in_flight.slot(TASK, 1, wait=False):
+            miner_states.record(_result(1, 200, hotkey="old"))
+            miner_states.record(_result(1, 429, hotkey="old"))
+            miner_states.add_uid(TASK, 1, "old")
+            assert miner_states.breaker.state(TASK, 1) == BreakerState.open
+
+            miner_states.add_uid(TASK, 1, "new")
+            assert 1 not in miner_states.selector.stats(TASK)
+            assert miner_states.breaker.state(TASK, 1) == BreakerState.closed
+            # Queries to the old miner still count until they end
+            assert miner_states.in_flight.stats(TASK)[1] == {"in_flight": 1, "limit": 1, "waiting": 0}
+
+        # A result from the old miner that comes in late isn't put down to the new one
+        miner_states.record(_result(1, 500, hotkey="old"))
+        assert 1 not in miner_states.selector.stats(TASK)
+        miner_states.record(_result(1, 200, hotkey="new"))
+        assert miner_states.selector.stats(TASK)[1]["observations"] == 1
+
+    asyncio.run(run())
@@ -0,0 +1,139 @@
+import asyncio
+import base64
+import json
+from typing import AsyncIterator, List
+
+import pytest
+from fastapi import HTTPException, Request
+
+from models import request_models
+from validation.proxy.api_server.image import multipart
+
+BOUNDARY = b"test-boundary"
+
+
+def _multipart_body(fields: dict, files: dict) -> bytes:
+    body = b"preamble\r\n"
+    for name, value in fields.items():
+        body += b"--" + BOUNDARY + b"\r\n"
+        body += f'Content-Disposition: form-data; name="{name}"\r\n\r\n'.encode() + value.encode() + b"\r\n"
+    for name, value in files.items():
+        body += b"--" + BOUNDARY + b"\r\n"
+        body += f'Content-Disposition: form-data; name="{name}"; filename="{name}.png"\r\n'.encode()
+        body += b"Content-Type: image/png\r\n\r\n" + value + b"\r\n"
+    return body + b"--" + BOUNDARY + b"--\r\n"
+
+
+async def _in_chunks(body: bytes, chunk_size: int) -> AsyncIterator[bytes]:
+    for start in range(0, len(body), chunk_size):
+        yield body[start : start + chunk_size]
+
+
+def test_fields_and_files_are_read_whatever_the_chunking():
+    async def run():
+        # The file has bits of the delimiter in it, and the chunks split the real delimiters
+        image_bytes = b"\x89PNG\r\n--test-bound\r\n" + bytes(range(256)) * 4
+        body = _multipart_body({"steps": "10", "text_prompts": '[{"text": "a cat"}]'}, {"init_image": image_bytes})
+
+        for chunk_size in [1, 3, 7, 64, len(body)]:
+            fields, files = await multipart.read_multipart_form(
+                _in_chunks(body, chunk_size), BOUNDARY, max_file_bytes=10_000
+            )
+            assert fields == {"steps": "10", "text_prompts": '[{"text": "a cat"}]'}
+            assert files == {"init_image": image_bytes}
+
+    asyncio.run(run())
+
+
+def test_uploads_over_the_limit_are_turned_away_as_they_stream_in():
+    async def run():
+        chunks_read = 0
+
+        async def _counted(body: bytes) -> AsyncIterator[bytes]:
+            nonlocal chunks_read
+            async for chunk in _in_chunks(body, 100):
+                chunks_read += 1
+                yield chunk
+
+        body = _multipart_body({}, {"init_image": b"x" * 10_000})
+        with pytest.raises(multipart.UploadTooLargeException) as exc_info:
+            await multipart.read_multipart_form(_counted(body), BOUNDARY, max_file_bytes=1000)
+        assert exc_info.value.status_code == 413
+        assert chunks_read < 20
+
+    asyncio.run(run())
+
+
+def test_malformed_bodies_are_rejected():
+    async def run():
+        with pytest.raises(HTTPException) as exc_info:
+            await multipart.read_multipart_form(_in_chunks(b"no delimiters here", 4), BOUNDARY, max_file_bytes=100)
+        assert exc_info.value.status_code == 400
+
+        truncated = _multipart_body({"steps": "10"}, {})[:-30]
+        with pytest.raises(HTTPException) as exc_info:
+            await multipart.read_multipart_form(_in_chunks(truncated, 4), BOUNDARY, max_file_bytes=100)
+        assert exc_info.value.status_code == 400
+
+    asyncio.run(run())
+
+
+def test_only_multipart_content_is_accepted():
+    assert multipart.get_boundary('multipart/form-data; boundary="abc"') == b"abc"
+    assert multipart.get_boundary("multipart/form-data; charset=utf-8; boundary=abc") == b"abc"
+
+    with pytest.raises(HTTPException) as exc_info:
+        multipart.get_boundary("application/json")
+    assert exc_info.value.status_code == 415
+
+    with pytest.raises(HTTPException) as exc_info:
+        multipart.get_boundary("multipart/form-data")
+    assert exc_info.value.status_code == 400
+
+
+def _make_request(body: bytes, chunk_size: int = 50) -> Request:
+    messages: List[dict] = [
+        {"type": "http.request", "body": body[start : start + chunk_size], "more_body": True}
+        for start in range(0, len(body), chunk_size)
+    ]
+    messages.append({"type": "http.request", "body": b"", "more_body": False})
+
+    async def receive() -> dict:
+        return messages.pop(0)
+
+    content_type = b"multipart/form-data; boundary=" + BOUNDARY
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": [(b"content-type", content_type)]}
+    return Request(scope, receive)
+
+
+def test_an_upload_becomes_the_request_model():
+    async def run():
+        image_bytes = b"\x89PNG" + bytes(range(256))
+        body = _multipart_body(
+            {"steps": "10", "cfg_scale": "2", "text_prompts": json.dumps([{"text": "a cat"}])},
+            {"init_image": image_bytes},
+        )
+
+        upload = await multipart.read_upload(
+            _make_request(body), request_models.ImageToImageRequest, ["init_image"], 10_000
+        )
+        assert isinstance(upload, request_models.ImageToImageRequest)
+        assert upload.steps == 10
+        assert upload.text_prompts[0].text == "a cat"
+        assert base64.b64decode(upload.init_image) == image_bytes
+
+        unexpected_file = _multipart_body({"text_prompts": "[]"}, {"mask_image": image_bytes})
+        with pytest.raises(HTTPException) as exc_info:
+            await multipart.read_upload(
+                _make_request(unexpected_file), request_models.ImageToImageRequest, ["init_image"], 10_000
+            )
+        assert exc_info.value.status_code == 400
+
+        missing_image = _multipart_body({"cfg_scale": "2", "text_prompts": json.dumps([{"text": "a cat"}])}, {})
+        with pytest.raises(HTTPException) as exc_info:
+            await multipart.read_upload(
+                _make_request(missing_image), request_models.ImageToImageRequest, ["init_image"], 10_000
+            )
+        assert exc_info.value.status_code == 422
+
+    asyncio.run(run())
@@ -0,0 +1,45 @@
+import asyncio
+
+from validation.proxy.rate_limiter import SlidingWindowRateLimiter
+from tests.validation.db.test_db_management import _make_db_manager
+
+
+def test_sliding_window_counts_the_overlap_with_the_previous_window():
+    limiter = SlidingWindowRateLimiter(window_seconds=60)
+
+    assert all(limiter.allow("key", 10, now=600.0 + i) for i in range(10))
+    assert not limiter.allow("key", 10, now=630.0)
+    assert limiter.allow("other_key", 10, now=630.0)
+
+    # A quarter into the next window, 75% of the previous window still counts
+    assert [limiter.allow("key", 10, now=675.0) for _ in range(4)] == [True, True, True, False]
+
+    # Two windows on, nothing carries over
+    assert all(limiter.allow("key", 10, now=780.0) for _ in range(10))
+
+
+def test_rate_limit_windows_survive_a_restart(tmp_path, monkeypatch):
+    async def run():
+        db_manager = await _make_db_manager(tmp_path, monkeypatch)
+        try:
+            limiter = SlidingWindowRateLimiter()
+            for _ in range(5):
+                limiter.allow("key", 5, now=600.0)
+            await limiter.save(db_manager.storage)
+
+            restarted_limiter = SlidingWindowRateLimiter()
+            await restarted_limiter.load(db_manager.storage)
+            assert not restarted_limiter.allow("key", 5, now=610.0)
+        finally:
+            await db_manager.close()
+
+    asyncio.run(run())
+
+
+def test_several_requests_can_be_counted_at_once():
+    limiter = SlidingWindowRateLimiter(window_seconds=60)
+
+    assert limiter.allow("key", 10, now=600.0, count=8)
+    assert not limiter.allow("key", 10, now=601.0, count=3)
+    assert limiter.allow("key", 10, now=601.0, count=2)
+    assert not limiter.allow("key", 10, now=602.0)
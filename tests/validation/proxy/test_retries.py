@@ -0,0 +1,102 @@
+import asyncio
+import time
+from typing import List, Optional
+
+import bittensor as bt
+
+from models import synapses
+from validation.models import UIDRecord
+from validation.proxy.utils import query_utils
+from validation.proxy.utils.in_flight import in_flight_tracker
+from validation.proxy.utils.miner_selection import miner_selector
+from validation.proxy.utils.retries import query_with_retries
+from tests.validation.proxy.test_miner_selection import TASK
+
+
+def _select_in_order(uids: List[int]):
+    def _select_miner(failed_uids: List[int]) -> Optional[int]:
+        return next((uid for uid in uids if uid not in failed_uids), None)
+
+    return _select_miner
+
+
+def test_each_attempt_goes_to_a_miner_that_hasnt_failed_yet():
+    async def run():
+        attempted = []
+
+        async def _attempt(uid: int, failed_uids: List[int]) -> Optional[str]:
+            attempted.append(uid)
+            if uid == 1:
+                # A hedge that failed on another miner too
+                failed_uids.append(4)
+            return "worked" if uid == 3 else None
+
+        result, failed_uids = await query_with_retries(_select_in_order([1, 2, 3, 4]), _attempt, time.time() + 5)
+        assert result == "worked"
+        assert attempted == [1, 2, 3]
+        assert sorted(failed_uids) == [1, 2, 4]
+
+        result, failed_uids = await query_with_retries(
+            _select_in_order([1, 2, 3]), _attempt, time.time() + 5, max_attempts=2
+        )
+        assert result is None
+        assert sorted(failed_uids) == [1, 2, 4]
+
+    asyncio.run(run())
+
+
+def test_an_attempt_still_going_at_the_deadline_is_cancelled():
+    async def run():
+        cancelled = []
+
+        async def _attempt(uid: int, failed_uids: List[int]) -> Optional[str]:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(uid)
+                raise
+            return "too late"
+
+        start = time.time()
+        result, failed_uids = await query_with_retries(_select_in_order([1, 2]), _attempt, time.time() + 0.05)
+        assert result is None
+        assert failed_uids == [1] and cancelled == [1]
+        assert time.time() - start < 1
+
+    asyncio.run(run())
+
+
+class _SlowDendrite:
+    async def forward(self, **kwargs):
+        await asyncio.sleep(10)
+
+
+def test_a_cancelled_organic_query_is_recorded_as_a_timeout():
+    async def run():
+        uid = 9001
+        uid_record = UIDRecord(
+            axon_uid=uid,
+            hotkey="hotkey",
+            axon=bt.chain_data.AxonInfo(
+                version=1, ip="127.0.0.1", port=8091, ip_type=4, hotkey="hotkey", coldkey="coldkey"
+            ),
+            task=TASK,
+            synthetic_requests_still_to_make=0,
+            declared_volume=1,
+        )
+        synapse = synapses.TextToImage(
+            text_prompts=[{"text": "a cat"}], seed=0, engine="proteus", steps=8, cfg_scale=2, height=1024, width=1024
+        )
+        query = query_utils.query_miner_no_stream(
+            uid_record, synapse, synapses.TextToImage, TASK, _SlowDendrite(), synthetic_query=False
+        )
+        try:
+            await asyncio.wait_for(query, timeout=0.05)
+        except asyncio.TimeoutError:
+            pass
+
+        stats = miner_selector.stats(TASK)[uid]
+        assert stats["observations"] == 1 and stats["success_rate"] < 1
+        assert in_flight_tracker.stats(TASK)[uid]["in_flight"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,126 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from core import Task
+from core import constants as core_cst
+from models import utility_models
+from validation.db.db_management import DatabaseManager
+from validation.weight_setting import calculations
+
+TASKS = [Task.avatar, Task.jugger_inpainting, Task.proteus_text_to_image]
+HOTKEYS = [f"hotkey_{i}" for i in range(6)]
+START = datetime(2024, 6, 1)
+
+
+def _timestamp(seconds: int) -> str:
+    return (START + timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+async def _fill_db(db_manager: DatabaseManager) -> None:
+    rng = random.Random(19)
+    clock = 0
+
+    reward_rows = []
+    for hotkey in HOTKEYS:
+        # hotkey_0 has more than a full set of rewards for one task, so it's topped up with everything
+        counts = {
+            task.value: 60 if hotkey == "hotkey_0" and task == Task.avatar else rng.randint(0, 40) for task in TASKS
+        }
+        counts["a_task_that_no_longer_exists"] = rng.randint(0, 5)
+        for task, count in counts.items():
+            for _ in range(count):
+                clock += 1
+                reward_rows.append(
+                    (
+                        f"{hotkey}-{clock}",
+                        task,
+                        1,
+                        rng.random(),
+                        "vali",
+                        hotkey,
+                        1,
+                        rng.random() + 0.5,
+                        _timestamp(clock),
+                    )
+                )
+    rng.shuffle(reward_rows)
+    await db_manager.storage.executemany(
+        "INSERT INTO reward_data (id, task, axon_uid, quality_score, validator_hotkey, miner_hotkey, "
+        "synthetic_query, speed_scoring_factor, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        reward_rows,
+    )
+
+    # Period scores arrive in time order, once per period
+    uid_rows = []
+    for period in range(12):
+        clock += 100
+        for hotkey in HOTKEYS:
+            for task in TASKS:
+                if rng.random() < 0.2:
+                    continue
+                period_score = None if rng.random() < 0.1 else rng.random()
+                consumed_volume = 0 if rng.random() < 0.1 else rng.randint(1, 500)
+                uid_rows.append((1, hotkey, "vali", task.value, 1000, consumed_volume, period_score, _timestamp(clock)))
+    await db_manager.storage.executemany(
+        "INSERT INTO uid_records (axon_uid, miner_hotkey, validator_hotkey, task, declared_volume, "
+        "consumed_volume, period_score, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        uid_rows,
+    )
+
+    # Retention takes the oldest rows, deregistration everything for a hotkey
+    await db_manager.storage.execute("DELETE FROM uid_records WHERE created_at < ?", (_timestamp(clock - 700),))
+    await db_manager.storage.execute("DELETE FROM reward_data WHERE created_at < ?", (_timestamp(6),))
+    await db_manager.clean_tables_of_hotkeys(["hotkey_5"])
+
+
+def _capacities_and_uid_info():
+    uid_to_uid_info = {
+        uid: utility_models.UIDinfo.construct(uid=uid, hotkey=hotkey, axon=None) for uid, hotkey in enumerate(HOTKEYS)
+    }
+    capacities_for_tasks = {task: {uid: 100.0 + uid for uid in uid_to_uid_info} for task in TASKS}
+    task_weights = {task: 1 / len(TASKS) for task in TASKS}
+    return capacities_for_tasks, uid_to_uid_info, task_weights
+
+
+def _flatten(quality_and_period_scores):
+    return {
+        (task, hotkey, name): score
+        for (task, hotkey), scores in quality_and_period_scores.items()
+        for name, score in zip(["quality", "period"], scores)
+    }
+
+
+def test_score_aggregates_match_the_raw_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(core_cst, "VISION_DB", str(tmp_path / "test.db"))
+    db_manager = DatabaseManager()
+    monkeypatch.setattr(calculations, "db_manager", db_manager)
+
+    async def run():
+        await db_manager.initialize(read_pool_size=1)
+        try:
+            await _fill_db(db_manager)
+
+            from_aggregates = _flatten(await calculations._get_quality_and_period_scores(HOTKEYS, TASKS))
+            from_raw_rows = _flatten(await calculations._get_quality_and_period_scores_from_raw_rows(HOTKEYS, TASKS))
+            assert from_aggregates == pytest.approx(from_raw_rows)
+            assert sum(score > 0 for score in from_aggregates.values()) > len(from_aggregates) / 2
+
+            await db_manager.rebuild_score_aggregates()
+            from_rebuilt_aggregates = _flatten(await calculations._get_quality_and_period_scores(HOTKEYS, TASKS))
+            assert from_rebuilt_aggregates == pytest.approx(from_raw_rows)
+
+            capacities_for_tasks, uid_to_uid_info, task_weights = _capacities_and_uid_info()
+            scores = await calculations.calculate_scores_for_settings_weights(
+                capacities_for_tasks, uid_to_uid_info, task_weights
+            )
+            reference_scores = await calculations.calculate_scores_for_settings_weights_from_raw_rows(
+                capacities_for_tasks, uid_to_uid_info, task_weights
+            )
+            assert scores == pytest.approx(reference_scores)
+        finally:
+            await db_manager.close()
+
+    asyncio.run(run())
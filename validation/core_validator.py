@@ -3,7 +3,7 @@ import re
 import threading
 from collections import defaultdict, deque
 import time
-from typing import Dict, Tuple
+from typing import Any, Dict, Tuple
 from typing import List
 from typing import Optional
 from typing import Set
@@ -17,6 +17,9 @@ from core import TASK_TO_MAX_CAPACITY
 import bittensor as bt
 from validation.synthetic_data.synthetic_generations import SyntheticDataManager
 from validation.proxy.utils import query_utils
+from validation.proxy.utils.circuit_breaker import circuit_breaker
+from validation.proxy.utils.hedging import hedger
+from validation.proxy.utils.miner_selection import miner_selector
 from core import bittensor_overrides as bto
 from config import configuration
 from config.validator_config import config as validator_config
@@ -123,6 +126,12 @@ class CoreValidator:
         self.weight_setter = WeightSetter(subtensor=self.subtensor, config=self.config)
         self.synthetic_data_manager = SyntheticDataManager(self.validator_uid)
         self.uid_manager = None
+        miner_selector.exploration_share = validator_config.miner_exploration_share
+        hedger.enabled = validator_config.hedge_requests
+        hedger.latency_percentile = validator_config.hedge_latency_percentile
+        hedger.budget.share = validator_config.hedge_budget_share
+        circuit_breaker.failure_threshold = validator_config.circuit_breaker_failure_threshold
+        circuit_breaker.open_seconds = validator_config.circuit_breaker_open_seconds
 
     def _get_task_weights(self) -> Dict[Task, float]:
         """
@@ -174,6 +183,12 @@ class CoreValidator:
         return base_config
 
     def start_continuous_tasks(self):
+        db_manager.start_retention_worker(
+            data_retention_minutes=validator_config.data_retention_minutes,
+            task_retention_minutes=validator_config.task_retention_minutes,
+            log_retention_minutes=validator_config.log_retention_minutes,
+            interval_seconds=validator_config.retention_interval_seconds,
+        )
         self.score_task = asyncio.create_task(self.run_vali())
         self.score_task.add_done_callback(validation_utils.log_task_exception)
 
@@ -230,6 +245,7 @@ class CoreValidator:
         incentives_tensor, axon_indexes_tensor = self.metagraph.incentive.sort(descending=True)
 
         with self.threading_lock:
+            previous_hotkeys = {uid_info.hotkey for uid_info in self.uid_to_uid_info.values()}
             self.uid_to_uid_info = {}
             self.uids: List[int] = self.metagraph.uids.tolist()
             self.axon_indexes = axon_indexes_tensor.tolist()
@@ -244,6 +260,11 @@ class CoreValidator:
                     axon=axons[i],
                     hotkey=hotkeys[i],
                 )
+            deregistered_hotkeys = previous_hotkeys - set(hotkeys)
+
+        if deregistered_hotkeys:
+            bt.logging.info(f"{len(deregistered_hotkeys)} hotkeys deregistered, removing their data")
+            await db_manager.clean_tables_of_hotkeys(list(deregistered_hotkeys))
 
         bt.logging.info("Finished extraction - now to fetch the available capacities for each axon")
         await self.fetch_available_capacities_for_each_axon()
@@ -335,9 +356,6 @@ class CoreValidator:
                 data_type_to_post=post_stats.DataTypeToPost.VALIDATOR_INFO,
             )
 
-            await db_manager.delete_data_older_than_date(minutes=60 * 24 * 2)
-            await db_manager.delete_tasks_older_than_date(minutes=120)
-
             # Wait for initial syncing of metagraph
             await self.resync_metagraph()
             self.scorer.start_scoring_results_if_not_already()
@@ -381,5 +399,25 @@ class CoreValidator:
             task=task, synapse=synapse, stream=stream, outgoing_model=outgoing_model
         )
 
+    def is_available(self) -> bool:
+        return self.uid_manager is not None
+
+    def capabilities(self) -> Dict[str, Any]:
+        """
+        The tasks we can take organic queries for right now, and how many miners each has,
+        the state of the miners' circuit breakers, and how the db's write buffers and retention are keeping up
+        """
+        uids_for_tasks = {}
+        if self.uid_manager is not None:
+            uids_for_tasks = {
+                task.value: len(queue.uid_map) for task, queue in self.uid_manager.task_to_uid_queue.items()
+            }
+        return {
+            "validator_uid": self.validator_uid,
+            "tasks": uids_for_tasks,
+            "circuit_breakers": circuit_breaker.metrics(),
+            "db": {"write_buffers": db_manager.write_buffer_stats(), "retention": db_manager.retention_stats()},
+        }
+
 
 core_validator = CoreValidator()
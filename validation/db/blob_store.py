@@ -0,0 +1,55 @@
+"""
+Large strings (base64 images, mostly) in the results we store for scoring are kept once each in the
+`blobs` table, compressed and keyed by their sha256, rather than inline in every row's checking data.
+The row keeps a small reference in their place, and a json list of the hashes it uses, which the
+triggers on `tasks` use to keep the blobs' reference counts.
+"""
+
+import hashlib
+import zlib
+from typing import Any, Dict, Tuple
+
+from validation.db import constants as cst
+
+
+def _hash(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def extract_blobs(data: Any, min_size: int = cst.BLOB_MIN_SIZE) -> Tuple[Any, Dict[str, str]]:
+    """Replace every string of at least `min_size` characters with a reference. Returns the blobs by hash"""
+    blobs: Dict[str, str] = {}
+
+    def _extract(value: Any) -> Any:
+        if isinstance(value, str) and len(value) >= min_size:
+            blob_hash = _hash(value)
+            blobs[blob_hash] = value
+            return {cst.BLOB_REF_KEY: blob_hash}
+        if isinstance(value, dict):
+            return {key: _extract(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [_extract(item) for item in value]
+        return value
+
+    return _extract(data), blobs
+
+
+def restore_blobs(data: Any, blobs: Dict[str, str]) -> Any:
+    def _restore(value: Any) -> Any:
+        if isinstance(value, dict):
+            if len(value) == 1 and cst.BLOB_REF_KEY in value:
+                return blobs[value[cst.BLOB_REF_KEY]]
+            return {key: _restore(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [_restore(item) for item in value]
+        return value
+
+    return _restore(data)
+
+
+def compress(value: str) -> bytes:
+    return zlib.compress(value.encode(), cst.BLOB_COMPRESSION_LEVEL)
+
+
+def decompress(data: bytes) -> str:
+    return zlib.decompress(data).decode()
@@ -2,6 +2,7 @@
 TABLE_TASKS = "tasks"
 TABLE_REWARD_DATA = "reward_data"
 TABLE_UID_RECORDS = "uid_records"
+TABLE_LOGS = "logs"
 
 # Common column names
 COLUMN_ID = "id"
@@ -29,3 +30,57 @@ COLUMN_TOTAL_REQUESTS_MADE = "total_requests_made"
 COLUMN_REQUESTS_429 = "requests_429"
 COLUMN_REQUESTS_500 = "requests_500"
 COLUMN_PERIOD_SCORE = "period_score"
+
+# Storage engine
+DEFAULT_READ_POOL_SIZE = 4
+MAX_WRITE_JOBS_PER_TRANSACTION = 256
+JOURNAL_MODE = "WAL"
+AUTO_VACUUM_INCREMENTAL = 2
+CONNECTION_PRAGMAS = [
+    "PRAGMA synchronous = NORMAL",  # Safe with WAL - we can only lose the last commits on power loss, never corrupt
+    "PRAGMA busy_timeout = 10000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -32000",  # 32MB per connection
+    "PRAGMA mmap_size = 268435456",  # 256MB
+    "PRAGMA journal_size_limit = 67108864",  # 64MB
+]
+
+# Write behind buffers
+WRITE_BUFFER_MAX_ROWS = 500
+WRITE_BUFFER_MAX_DELAY_SECONDS = 5.0
+# After this many failed flushes in a row, the rows are written one at a time, and the ones that fail dropped
+WRITE_BUFFER_MAX_FLUSH_ATTEMPTS = 3
+# Results seen by the sampler count half as much after this long, so what's stored is a sample of recent traffic
+RESULT_SAMPLE_HALF_LIFE_SECONDS = 30 * 60
+
+# Score aggregates, maintained by triggers on reward_data and uid_records
+TABLE_REWARD_DATA_AGGREGATES = "reward_data_aggregates"
+TABLE_PERIOD_SCORE_AGGREGATES = "period_score_aggregates"
+COLUMN_REWARD_COUNT = "reward_count"
+COLUMN_COMBINED_QUALITY_SCORE_SUM = "combined_quality_score_sum"
+COLUMN_PERIOD_SCORE_COUNT = "period_score_count"
+COLUMN_DECAYED_WEIGHTED_SCORE_SUM = "decayed_weighted_score_sum"
+COLUMN_DECAYED_VOLUME_SUM = "decayed_volume_sum"
+COLUMN_OLDEST_DECAY_WEIGHT = "oldest_decay_weight"
+# Must match the decay baked into the aggregate triggers, and PERIOD_SCORE_TIME_DECAYING_FACTOR
+PERIOD_SCORE_AGGREGATE_DECAY = 0.5
+
+# Blob store for the large strings in stored results
+TABLE_BLOBS = "blobs"
+COLUMN_HASH = "hash"
+COLUMN_DATA = "data"
+COLUMN_REF_COUNT = "ref_count"
+COLUMN_BLOB_HASHES = "blob_hashes"
+BLOB_MIN_SIZE = 1024
+BLOB_REF_KEY = "__blob__"
+BLOB_COMPRESSION_LEVEL = 6
+
+# Retention
+RETENTION_CHUNK_SIZE = 1000
+RETENTION_PAUSE_BETWEEN_CHUNKS_SECONDS = 0.05
+INCREMENTAL_VACUUM_PAGES = 2000
+DEFAULT_DATA_RETENTION_MINUTES = 60 * 24 * 2
+DEFAULT_TASK_RETENTION_MINUTES = 120
+# Usage is kept in the log rollups, so the raw logs only need to go back as far as anyone would debug
+DEFAULT_LOG_RETENTION_MINUTES = 60 * 24 * 30
+DEFAULT_RETENTION_INTERVAL_SECONDS = 300
@@ -1,8 +1,8 @@
 import asyncio
+from collections import defaultdict
 from datetime import datetime, timedelta
-import random
 import json
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Tuple
 
 import aiosqlite
 from core import Task, constants as core_cst
@@ -10,32 +10,69 @@ from core import Task, constants as core_cst
 import bittensor as bt
 
 from models import utility_models
-from validation.db import sql
-from validation.models import PeriodScore, RewardData, UIDRecord
+from validation.db import blob_store, migrations, sql, constants as cst
+from validation.db.retention import RetentionWorker
+from validation.db.result_sampler import ResultSampler, StoredResult
+from validation.db.storage_engine import StorageEngine
+from validation.db.write_buffer import WriteBehindBuffer
+from validation.models import PeriodScore, PeriodScoreAggregate, RewardAggregate, RewardData, UIDRecord
 
 MAX_TASKS_IN_DB_STORE = 1000
-db_lock = asyncio.Lock()
 
 
 class DatabaseManager:
     def __init__(self):
-        self.conn = None
+        self.storage: Optional[StorageEngine] = None
+        self.reward_data_buffer: Optional[WriteBehindBuffer] = None
+        self.uid_record_buffer: Optional[WriteBehindBuffer] = None
+        self.result_sampler: Optional[ResultSampler] = None
+        self.retention_worker: Optional[RetentionWorker] = None
         self.task_weights: Dict[Task, float] = {}
 
-    async def initialize(self):
-        self.conn = await aiosqlite.connect(core_cst.VISION_DB)
+    async def initialize(self, read_pool_size: int = cst.DEFAULT_READ_POOL_SIZE):
+        await migrations.apply_migrations(core_cst.VISION_DB)
+        await self.open_storage(read_pool_size=read_pool_size, run_maintenance=True)
+
+        self.reward_data_buffer = WriteBehindBuffer(cst.TABLE_REWARD_DATA, self.storage, sql.insert_reward_data())
+        self.uid_record_buffer = WriteBehindBuffer(cst.TABLE_UID_RECORDS, self.storage, sql.insert_uid_record())
+        self.reward_data_buffer.start()
+        self.uid_record_buffer.start()
+
+        self.result_sampler = ResultSampler(self.storage)
+        self.result_sampler.start()
+        await self.result_sampler.resync_counts()
+
+        await self.rebuild_score_aggregates()
+
+    async def open_storage(
+        self, read_pool_size: int = cst.DEFAULT_READ_POOL_SIZE, run_maintenance: bool = False
+    ) -> None:
+        """
+        Just the storage engine. All an API worker needs for its api keys and billing - the core process
+        applies the migrations, sets up the db file's journal mode and auto vacuum, and runs everything else
+        """
+        self.storage = StorageEngine(core_cst.VISION_DB, read_pool_size=read_pool_size)
+        await self.storage.initialize(run_maintenance=run_maintenance)
+
+    async def flush_write_buffers(self) -> None:
+        """Make sure everything buffered is in the db - call before reading reward data or uid records"""
+        await asyncio.gather(self.reward_data_buffer.flush(), self.uid_record_buffer.flush())
+
+    def write_buffer_stats(self) -> Dict[str, Dict[str, Any]]:
+        if self.reward_data_buffer is None:
+            return {}
+        return {
+            self.reward_data_buffer.name: self.reward_data_buffer.stats(),
+            self.uid_record_buffer.name: self.uid_record_buffer.stats(),
+            cst.TABLE_TASKS: self.result_sampler.stats(),
+        }
+
+    def retention_stats(self) -> Dict[str, Any]:
+        return self.retention_worker.stats() if self.retention_worker is not None else {}
 
     async def get_tasks_and_number_of_results(self) -> Dict[str, int]:
-        async with db_lock:
-            async with self.conn.execute(sql.select_tasks_and_number_of_results()) as cursor:
-                rows = await cursor.fetchall()
-        return {row[0]: row[1] for row in rows}
-
-    async def _get_number_of_these_tasks_already_stored(self, task: Task) -> int:
-        async with db_lock:
-            async with self.conn.execute(sql.select_count_rows_of_task_stored_for_scoring(), (task.value,)) as cursor:
-                row = await cursor.fetchone()
-        return row[0]
+        # The scorer polls this, which keeps the sampler's counts in step with the db
+        return await self.result_sampler.resync_counts()
 
     async def potentially_store_result_in_sql_lite_db(
         self, result: utility_models.QueryResult, task: Task, synapse: bt.Synapse, synthetic_query: bool
@@ -43,188 +80,288 @@ class DatabaseManager:
         if task not in self.task_weights:
             bt.logging.error(f"{task} not in task weights in db_manager")
             return
-        target_percentage = self.task_weights[task]
-        target_number_of_tasks_to_store = int(MAX_TASKS_IN_DB_STORE * target_percentage)
-        number_of_these_tasks_already_stored = await self._get_number_of_these_tasks_already_stored(task)
-        if number_of_these_tasks_already_stored <= target_number_of_tasks_to_store:
-            await self.insert_task_results(task.value, result, synapse, synthetic_query)
-        else:
-            actual_percentage = number_of_these_tasks_already_stored / MAX_TASKS_IN_DB_STORE
-            probability_to_score_again = (target_percentage / actual_percentage - target_percentage) ** 4
-            if random.random() < probability_to_score_again:
-                await self.insert_task_results(task.value, result, synapse, synthetic_query)
-
-    async def insert_task_results(
-        self, task: str, result: utility_models.QueryResult, synapse: bt.Synapse, synthetic_query: bool
-    ) -> None:
-        async with db_lock:
-            async with self.conn.execute(sql.select_count_of_rows_in_tasks()) as cursor:
-                row_count = (await cursor.fetchone())[0]
-
-            if row_count >= MAX_TASKS_IN_DB_STORE + 10:
-                await self.conn.execute(sql.delete_oldest_rows_from_tasks(limit=10))
+        target_number_of_tasks_to_store = int(MAX_TASKS_IN_DB_STORE * self.task_weights[task])
 
+        def _make_row() -> StoredResult:
             data_to_store = {
-                "result": result.json(),
-                "synapse": json.dumps(synapse.dict()),
+                "result": json.loads(result.json()),
+                "synapse": synapse.dict(),
                 "synthetic_query": synthetic_query,
             }
-            hotkey = result.miner_hotkey
-            data = json.dumps(data_to_store)
-            await self.conn.execute(sql.insert_task(), (task, data, hotkey))
-            await self.conn.commit()
-
-    async def select_and_delete_task_result(self, task: Task) -> Optional[Union[List[Dict[str, Any]], str]]:
-        async with db_lock:
-            async with self.conn.execute(sql.select_task_for_deletion(), (task.value, task.value)) as cursor:
+            checking_data, blobs = blob_store.extract_blobs(data_to_store)
+            return StoredResult(task.value, json.dumps(checking_data), result.miner_hotkey, blobs)
+
+        self.result_sampler.offer(task.value, target_number_of_tasks_to_store, _make_row)
+
+    async def pop_task_result(self, task: Task) -> Optional[Tuple[Dict[str, Any], str]]:
+        """Take a stored result for the task out of the db, to be scored. Safe to call concurrently"""
+
+        async def _pop(conn: aiosqlite.Connection) -> Optional[Tuple[str, str, List[Tuple[str, bytes]]]]:
+            async with conn.execute(sql.delete_task_with_fewest_rewards_returning(), (task.value,)) as cursor:
                 row = await cursor.fetchone()
             if row is None:
                 return None
 
-            checking_data, miner_hotkey = row
-            checking_data_loaded = json.loads(checking_data)
+            checking_data, miner_hotkey, blob_hashes = row
+            # Unreferenced blobs are only removed by retention, so these are still here
+            async with conn.execute(sql.select_blobs(), (blob_hashes or "[]",)) as cursor:
+                blobs = await cursor.fetchall()
+            return checking_data, miner_hotkey, blobs
 
-            await self.conn.execute(sql.delete_specific_task(), (task.value, checking_data))
-            await self.conn.commit()
+        row = await self.storage.write(_pop)
+        if row is None:
+            return None
+        self.result_sampler.result_taken(task.value)
 
+        checking_data, miner_hotkey, blobs = row
+
+        def _load() -> Dict[str, Any]:
+            decompressed_blobs = {blob_hash: blob_store.decompress(data) for blob_hash, data in blobs}
+            return blob_store.restore_blobs(json.loads(checking_data), decompressed_blobs)
+
+        checking_data_loaded = await asyncio.to_thread(_load)
         return checking_data_loaded, miner_hotkey
 
     async def insert_reward_data(
         self,
         reward_data: RewardData,
     ) -> str:
-        async with db_lock:
-            await self.conn.execute(
-                sql.insert_reward_data(),
-                (
-                    reward_data.id,
-                    reward_data.task,
-                    reward_data.axon_uid,
-                    reward_data.quality_score,
-                    reward_data.validator_hotkey,
-                    reward_data.miner_hotkey,
-                    reward_data.synthetic_query,
-                    reward_data.speed_scoring_factor,
-                    reward_data.response_time,
-                    reward_data.volume,
-                ),
+        self.reward_data_buffer.add(
+            (
+                reward_data.id,
+                reward_data.task,
+                reward_data.axon_uid,
+                reward_data.quality_score,
+                reward_data.validator_hotkey,
+                reward_data.miner_hotkey,
+                reward_data.synthetic_query,
+                reward_data.speed_scoring_factor,
+                reward_data.response_time,
+                reward_data.volume,
             )
-            await self.conn.commit()
+        )
         return reward_data.id
 
     async def clean_tables_of_hotkeys(self, miner_hotkeys: List[str]) -> None:
-        async with db_lock:
-            for hotkey in miner_hotkeys:
-                await self.conn.execute(sql.delete_task_by_hotkey(), (hotkey,))
-                await self.conn.execute(sql.delete_reward_data_by_hotkey(), (hotkey,))
-                await self.conn.execute(sql.delete_uid_data_by_hotkey(), (hotkey,))
-            await self.conn.commit()
-
-    async def delete_tasks_older_than_date(self, minutes: int) -> None:
-        cutoff_time = datetime.now() - timedelta(minutes=minutes)
-        cutoff_time_str = cutoff_time.strftime("%Y-%m-%d %H:%M:%S")
-
-        async with db_lock:
-            await self.conn.execute(sql.delete_task_data_older_than(), (cutoff_time_str,))
-            await self.conn.commit()
-
-    async def delete_data_older_than_date(self, minutes: int) -> None:
-        cutoff_time = datetime.now() - timedelta(minutes=minutes)
-        cutoff_time_str = cutoff_time.strftime("%Y-%m-%d %H:%M:%S")
-
-        async with db_lock:
-            await self.conn.execute(sql.delete_reward_data_older_than(), (cutoff_time_str,))
-            await self.conn.execute(sql.delete_uid_data_older_than(), (cutoff_time_str,))
-            await self.conn.execute(sql.delete_task_data_older_than(), (cutoff_time_str,))
-
-            await self.conn.commit()
-
-    async def fetch_recent_most_rewards_for_uid(
-        self, task: Task, miner_hotkey: str, quality_tasks_to_fetch: int = 50
-    ) -> List[RewardData]:
-        async with db_lock:
-            async with self.conn.execute(
-                sql.select_recent_reward_data_for_a_task(),
-                (task.value, datetime.now().timestamp() - timedelta(hours=72).total_seconds(), miner_hotkey),
-            ) as cursor:
-                priority_results = await cursor.fetchall()
-
-            y = len(priority_results)
-            async with self.conn.execute(
-                sql.select_recent_reward_data(),
-                (
-                    datetime.now().timestamp() - timedelta(hours=72).total_seconds(),
-                    miner_hotkey,
-                    quality_tasks_to_fetch - y,
-                ),
-            ) as cursor:
-                fill_results = await cursor.fetchall()
-
-        reward_data_list = [
-            RewardData(
-                id=row[0],
-                task=row[1],
-                axon_uid=row[2],
-                quality_score=row[3],
-                validator_hotkey=row[4],
-                miner_hotkey=row[5],
-                synthetic_query=row[6],
-                speed_scoring_factor=row[7],
-                response_time=row[8],
-                volume=row[9],
-                created_at=row[10],
+        """Remove everything stored for these hotkeys, with one set based delete per table"""
+        if not miner_hotkeys:
+            return
+
+        # Otherwise buffered rows for these hotkeys would land after the clean
+        await self.flush_write_buffers()
+        await self.result_sampler.flush()
+
+        miner_hotkeys_json = json.dumps(miner_hotkeys)
+
+        async def _clean(conn: aiosqlite.Connection) -> None:
+            for table in [cst.TABLE_TASKS, cst.TABLE_REWARD_DATA, cst.TABLE_UID_RECORDS]:
+                await conn.execute(sql.delete_rows_of_hotkeys(table), (miner_hotkeys_json,))
+
+        await self.storage.write(_clean)
+        await self.result_sampler.resync_counts()
+
+    def start_retention_worker(
+        self,
+        data_retention_minutes: int = cst.DEFAULT_DATA_RETENTION_MINUTES,
+        task_retention_minutes: int = cst.DEFAULT_TASK_RETENTION_MINUTES,
+        log_retention_minutes: int = cst.DEFAULT_LOG_RETENTION_MINUTES,
+        interval_seconds: float = cst.DEFAULT_RETENTION_INTERVAL_SECONDS,
+    ) -> None:
+        self.retention_worker = RetentionWorker(
+            self.storage,
+            data_retention_minutes=data_retention_minutes,
+            task_retention_minutes=task_retention_minutes,
+            log_retention_minutes=log_retention_minutes,
+            interval_seconds=interval_seconds,
+            on_tasks_pruned=self.result_sampler.resync_counts,
+        )
+        self.retention_worker.start()
+
+    async def fetch_recent_most_rewards_for_hotkeys(
+        self, miner_hotkeys: List[str], tasks: List[Task], quality_tasks_to_fetch: int = 50
+    ) -> Dict[Tuple[Task, str], List[RewardData]]:
+        """
+        For each (task, hotkey): all of the hotkey's recent rewards for that task, topped up with its most
+        recent rewards for any task, up to `quality_tasks_to_fetch`. Fetched in one query for all hotkeys.
+        """
+        rows = await self.storage.fetchall(
+            sql.select_recent_reward_data_for_hotkeys(),
+            (datetime.now().timestamp() - timedelta(hours=72).total_seconds(), json.dumps(miner_hotkeys)),
+        )
+
+        hotkey_to_reward_datas: Dict[str, List[RewardData]] = defaultdict(list)
+        for row in rows:
+            hotkey_to_reward_datas[row[5]].append(
+                RewardData(
+                    id=row[0],
+                    task=row[1],
+                    axon_uid=row[2],
+                    quality_score=row[3],
+                    validator_hotkey=row[4],
+                    miner_hotkey=row[5],
+                    synthetic_query=row[6],
+                    speed_scoring_factor=row[7],
+                    response_time=row[8],
+                    volume=row[9],
+                    created_at=row[10],
+                )
             )
-            for row in priority_results + fill_results
-        ]
 
-        return reward_data_list
+        rewards_for_tasks_and_hotkeys: Dict[Tuple[Task, str], List[RewardData]] = {}
+        for miner_hotkey in miner_hotkeys:
+            all_reward_datas = hotkey_to_reward_datas.get(miner_hotkey, [])
+            for task in tasks:
+                priority_results = [reward_data for reward_data in all_reward_datas if reward_data.task == task.value]
+                number_to_fill = quality_tasks_to_fetch - len(priority_results)
+                # Mirrors sqlite's LIMIT, where a negative limit means no limit
+                fill_results = all_reward_datas if number_to_fill < 0 else all_reward_datas[:number_to_fill]
+                rewards_for_tasks_and_hotkeys[(task, miner_hotkey)] = priority_results + fill_results
+
+        return rewards_for_tasks_and_hotkeys
 
     async def insert_uid_record(
         self,
         uid_record: UIDRecord,
         validator_hotkey: str,
     ) -> None:
-        async with db_lock:
-            await self.conn.execute(
-                sql.insert_uid_record(),
-                (
-                    uid_record.axon_uid,
-                    uid_record.hotkey,
-                    validator_hotkey,
-                    uid_record.task.value,
-                    uid_record.declared_volume,
-                    uid_record.consumed_volume,
-                    uid_record.total_requests_made,
-                    uid_record.requests_429,
-                    uid_record.requests_500,
-                    uid_record.period_score,
-                ),
+        self.uid_record_buffer.add(
+            (
+                uid_record.axon_uid,
+                uid_record.hotkey,
+                validator_hotkey,
+                uid_record.task.value,
+                uid_record.declared_volume,
+                uid_record.consumed_volume,
+                uid_record.total_requests_made,
+                uid_record.requests_429,
+                uid_record.requests_500,
+                uid_record.period_score,
+            )
+        )
+
+    async def fetch_hotkey_scores_for_tasks(
+        self, miner_hotkeys: List[str]
+    ) -> Dict[Tuple[Task, str], List[PeriodScore]]:
+        """Period scores for every task of each hotkey, most recent first. Fetched in one query for all hotkeys"""
+        rows = await self.storage.fetchall(sql.select_uid_period_scores_for_hotkeys(), (json.dumps(miner_hotkeys),))
+
+        period_scores_for_tasks_and_hotkeys: Dict[Tuple[Task, str], List[PeriodScore]] = defaultdict(list)
+        value_to_task = {task.value: task for task in Task}
+        for miner_hotkey, task, period_score, consumed_volume, created_at in rows:
+            if task not in value_to_task:
+                continue
+            period_scores_for_tasks_and_hotkeys[(value_to_task[task], miner_hotkey)].append(
+                PeriodScore(
+                    hotkey=miner_hotkey,
+                    period_score=period_score,
+                    consumed_volume=consumed_volume,
+                    created_at=created_at,
+                )
             )
-            await self.conn.commit()
 
-    async def fetch_hotkey_scores_for_task(
-        self,
-        task: Task,
-        miner_hotkey: str,
-    ) -> List[PeriodScore]:
-        async with db_lock:
-            async with self.conn.execute(sql.select_uid_period_scores_for_task(), (task.value, miner_hotkey)) as cursor:
-                rows = await cursor.fetchall()
-
-        period_scores = [
-            PeriodScore(
-                hotkey=miner_hotkey,
-                period_score=row[0],
-                consumed_volume=row[1],
-                created_at=row[2],
+        for period_scores in period_scores_for_tasks_and_hotkeys.values():
+            period_scores.sort(key=lambda x: x.created_at, reverse=True)
+        return period_scores_for_tasks_and_hotkeys
+
+    async def rebuild_score_aggregates(self) -> None:
+        """
+        Recompute the score aggregates from the raw rows.
+
+        The triggers keep them in step with every insert and delete, so this is only a checkpoint on startup;
+        it throws away any floating point drift built up from adding and taking away decayed period scores.
+        """
+
+        async def _rebuild(conn: aiosqlite.Connection) -> None:
+            await conn.execute(sql.delete_all_reward_data_aggregates())
+            await conn.execute(sql.insert_reward_data_aggregates_from_reward_data())
+
+            period_score_aggregates: Dict[Tuple[str, str], List[float]] = {}
+            async with conn.execute(sql.select_period_scores_oldest_first()) as cursor:
+                async for task, miner_hotkey, period_score, consumed_volume in cursor:
+                    # Same fold as the insert trigger: [count, decayed weighted score, decayed volume, oldest weight]
+                    aggregate = period_score_aggregates.get((task, miner_hotkey))
+                    if aggregate is None:
+                        period_score_aggregates[(task, miner_hotkey)] = [
+                            1,
+                            period_score * consumed_volume,
+                            consumed_volume,
+                            1.0,
+                        ]
+                        continue
+                    aggregate[0] += 1
+                    aggregate[1] = aggregate[1] * cst.PERIOD_SCORE_AGGREGATE_DECAY + period_score * consumed_volume
+                    aggregate[2] = aggregate[2] * cst.PERIOD_SCORE_AGGREGATE_DECAY + consumed_volume
+                    aggregate[3] *= cst.PERIOD_SCORE_AGGREGATE_DECAY
+
+            await conn.execute(sql.delete_all_period_score_aggregates())
+            await conn.executemany(
+                sql.insert_period_score_aggregate(),
+                [
+                    (task, miner_hotkey, *aggregate)
+                    for (task, miner_hotkey), aggregate in period_score_aggregates.items()
+                ],
+            )
+
+        await self.storage.write(_rebuild)
+
+    async def fetch_reward_aggregates_for_hotkeys(self, miner_hotkeys: List[str]) -> Dict[str, List[RewardAggregate]]:
+        """Reward totals for every task (including any no longer in `Task`) of each hotkey"""
+        rows = await self.storage.fetchall(sql.select_reward_aggregates_for_hotkeys(), (json.dumps(miner_hotkeys),))
+
+        hotkey_to_reward_aggregates: Dict[str, List[RewardAggregate]] = defaultdict(list)
+        for task, miner_hotkey, reward_count, combined_quality_score_sum in rows:
+            hotkey_to_reward_aggregates[miner_hotkey].append(
+                RewardAggregate(
+                    task=task,
+                    miner_hotkey=miner_hotkey,
+                    reward_count=reward_count,
+                    combined_quality_score_sum=combined_quality_score_sum,
+                )
+            )
+        return hotkey_to_reward_aggregates
+
+    async def fetch_recent_combined_quality_scores_for_hotkeys(
+        self, miner_hotkeys: List[str], limit: int = 50
+    ) -> Dict[str, List[float]]:
+        """The most recent `limit` combined quality scores, for any task, of each hotkey. Most recent first"""
+        rows = await self.storage.fetchall(
+            sql.select_recent_combined_quality_scores_for_hotkeys(), (json.dumps(miner_hotkeys), limit)
+        )
+
+        hotkey_to_scores: Dict[str, List[float]] = defaultdict(list)
+        for miner_hotkey, combined_quality_score in rows:
+            hotkey_to_scores[miner_hotkey].append(combined_quality_score)
+        return hotkey_to_scores
+
+    async def fetch_period_score_aggregates_for_hotkeys(
+        self, miner_hotkeys: List[str]
+    ) -> Dict[Tuple[Task, str], PeriodScoreAggregate]:
+        rows = await self.storage.fetchall(
+            sql.select_period_score_aggregates_for_hotkeys(), (json.dumps(miner_hotkeys),)
+        )
+
+        period_score_aggregates: Dict[Tuple[Task, str], PeriodScoreAggregate] = {}
+        value_to_task = {task.value: task for task in Task}
+        for task, miner_hotkey, period_score_count, decayed_weighted_score_sum, decayed_volume_sum in rows:
+            if task not in value_to_task:
+                continue
+            period_score_aggregates[(value_to_task[task], miner_hotkey)] = PeriodScoreAggregate(
+                task=value_to_task[task],
+                miner_hotkey=miner_hotkey,
+                period_score_count=period_score_count,
+                decayed_weighted_score_sum=decayed_weighted_score_sum,
+                decayed_volume_sum=decayed_volume_sum,
             )
-            for row in rows
-        ]
-        return sorted(period_scores, key=lambda x: x.created_at, reverse=True)
+        return period_score_aggregates
 
     async def close(self):
-        async with db_lock:
-            await self.conn.close()
+        if self.retention_worker is not None:
+            await self.retention_worker.stop()
+        # Only the storage is opened in an API worker
+        for component in [self.result_sampler, self.reward_data_buffer, self.uid_record_buffer]:
+            if component is not None:
+                await component.stop()
+        await self.storage.close()
 
 
 db_manager = DatabaseManager()
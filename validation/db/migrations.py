@@ -0,0 +1,48 @@
+"""
+Applies any pending migrations in db/migrations when the validator starts up.
+
+Tracks what's been applied in dbmate's `schema_migrations` table, so databases set up with
+`dbmate up` carry on from where they are, and `dbmate` still works on databases set up by this.
+"""
+
+import os
+from typing import List, Tuple
+
+import aiosqlite
+import bittensor as bt
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "db", "migrations")
+UP_MARKER = "-- migrate:up"
+DOWN_MARKER = "-- migrate:down"
+
+
+def _load_migrations(migrations_dir: str) -> List[Tuple[str, str]]:
+    migrations = []
+    for filename in sorted(os.listdir(migrations_dir)):
+        if not filename.endswith(".sql"):
+            continue
+        version = filename.split("_", 1)[0]
+        with open(os.path.join(migrations_dir, filename)) as f:
+            contents = f.read()
+        up_sql = contents.split(UP_MARKER, 1)[-1].split(DOWN_MARKER, 1)[0]
+        migrations.append((version, up_sql))
+    return migrations
+
+
+async def apply_migrations(db_path: str, migrations_dir: str = MIGRATIONS_DIR) -> List[str]:
+    async with aiosqlite.connect(db_path, isolation_level=None) as conn:
+        await conn.execute("CREATE TABLE IF NOT EXISTS schema_migrations (version VARCHAR(128) PRIMARY KEY)")
+        async with conn.execute("SELECT version FROM schema_migrations") as cursor:
+            applied_versions = {row[0] for row in await cursor.fetchall()}
+
+        newly_applied = []
+        for version, up_sql in _load_migrations(migrations_dir):
+            if version in applied_versions:
+                continue
+            bt.logging.info(f"Applying db migration {version}")
+            await conn.executescript(
+                f"BEGIN;\n{up_sql}\nINSERT INTO schema_migrations (version) VALUES ('{version}');\nCOMMIT;"
+            )
+            newly_applied.append(version)
+
+    return newly_applied
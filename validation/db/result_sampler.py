@@ -0,0 +1,196 @@
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, NamedTuple, Optional
+
+import aiosqlite
+import bittensor as bt
+
+from validation.db import blob_store, constants as cst
+from validation.db import sql
+from validation.db.storage_engine import StorageEngine
+
+
+class StoredResult(NamedTuple):
+    task_name: str
+    # With its large strings swapped for references to `blobs`
+    checking_data: str
+    miner_hotkey: str
+    blobs: Dict[str, str]
+
+
+class ResultSampler:
+    """
+    Decides which miner results to keep for scoring, without touching the db.
+
+    Each task has a quota of stored results. Under quota, every result is kept. Once a task is full, a result
+    is kept with probability quota / results seen for the task (a reservoir sample), and replaces a random
+    result stored for that task. Kept results are written in batches, like the write behind buffers.
+
+    Results seen decays with a half life of `seen_half_life_seconds`, so the sample leans towards recent
+    traffic - otherwise after days of uptime a full task would hardly ever take a new result.
+    """
+
+    def __init__(
+        self,
+        storage: StorageEngine,
+        max_rows: int = cst.WRITE_BUFFER_MAX_ROWS,
+        max_delay_seconds: float = cst.WRITE_BUFFER_MAX_DELAY_SECONDS,
+        seen_half_life_seconds: float = cst.RESULT_SAMPLE_HALF_LIFE_SECONDS,
+    ) -> None:
+        self.storage = storage
+        self.max_rows = max_rows
+        self.max_delay_seconds = max_delay_seconds
+        self.seen_half_life_seconds = seen_half_life_seconds
+
+        # Results per task, whether they're in the db yet or not
+        self.counts: Dict[str, int] = defaultdict(int)
+        self._seen: Dict[str, float] = defaultdict(float)
+        self._seen_at: Dict[str, float] = {}
+        self._pending: Dict[str, Deque[StoredResult]] = defaultdict(deque)
+        self._evictions: Dict[str, int] = defaultdict(int)
+
+        self._flush_lock = asyncio.Lock()
+        self._timer_task: Optional[asyncio.Task] = None
+        self._size_triggered_flush: Optional[asyncio.Task] = None
+
+        self.results_offered = 0
+        self.results_kept = 0
+        self.rows_flushed = 0
+        self.failed_flushes = 0
+
+    def start(self) -> None:
+        if self._timer_task is None:
+            self._timer_task = asyncio.create_task(self._flush_periodically())
+
+    def offer(
+        self, task: str, quota: int, make_row: Callable[[], StoredResult], now: Optional[float] = None
+    ) -> bool:
+        """
+        Keep the result or not. `make_row` is only called for results we keep, so rejected
+        results are never serialised. Returns whether it was kept
+        """
+        self.results_offered += 1
+        seen = self._count_seen(task, time.monotonic() if now is None else now)
+
+        if self.counts[task] >= quota:
+            if quota <= 0 or random.random() >= quota / seen:
+                return False
+            self._evict_random(task)
+        else:
+            self.counts[task] += 1
+
+        self._pending[task].append(make_row())
+        self.results_kept += 1
+        if self.queue_depth() >= self.max_rows and (
+            self._size_triggered_flush is None or self._size_triggered_flush.done()
+        ):
+            self._size_triggered_flush = asyncio.create_task(self.flush())
+        return True
+
+    def _count_seen(self, task: str, now: float) -> float:
+        elapsed = max(now - self._seen_at.get(task, now), 0.0)
+        self._seen[task] = self._seen[task] * 0.5 ** (elapsed / self.seen_half_life_seconds) + 1
+        self._seen_at[task] = now
+        return self._seen[task]
+
+    def _evict_random(self, task: str) -> None:
+        # Each stored result, pending or in the db, is as likely to go as any other
+        pending = self._pending[task]
+        if pending and random.randrange(self.counts[task]) < len(pending):
+            del pending[random.randrange(len(pending))]
+        else:
+            self._evictions[task] += 1
+
+    def result_taken(self, task: str) -> None:
+        """A stored result was taken out of the db to be scored"""
+        self.counts[task] = max(self.counts[task] - 1, 0)
+
+    def queue_depth(self) -> int:
+        return sum(len(rows) for rows in self._pending.values())
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        if not self.queue_depth() and not any(self._evictions.values()):
+            return
+        pending, self._pending = self._pending, defaultdict(deque)
+        evictions, self._evictions = self._evictions, defaultdict(int)
+        rows = [row for task_rows in pending.values() for row in task_rows]
+        blobs = {blob_hash: blob for row in rows for blob_hash, blob in row.blobs.items()}
+        task_rows = [
+            (row.task_name, row.checking_data, row.miner_hotkey, json.dumps(sorted(row.blobs))) for row in rows
+        ]
+
+        async def _write(conn: aiosqlite.Connection) -> None:
+            # Blobs go in first, so the tasks insert trigger finds them to count the references
+            await conn.executemany(sql.insert_blob(), compressed_blobs)
+            for task, number_to_evict in evictions.items():
+                if number_to_evict > 0:
+                    await conn.execute(sql.delete_random_rows_of_task(), (task, number_to_evict))
+            await conn.executemany(sql.insert_task(), task_rows)
+
+        start_time = time.time()
+        try:
+            compressed_blobs = await asyncio.to_thread(
+                lambda: [(blob_hash, blob_store.compress(blob)) for blob_hash, blob in blobs.items()]
+            )
+            await self.storage.write(_write)
+        except Exception as e:
+            for task, task_rows in pending.items():
+                self._pending[task].extendleft(reversed(task_rows))
+            for task, number_to_evict in evictions.items():
+                self._evictions[task] += number_to_evict
+            self.failed_flushes += 1
+            bt.logging.error(f"Failed to flush {len(rows)} results to score: {repr(e)}")
+            return
+
+        self.rows_flushed += len(rows)
+        bt.logging.debug(f"Flushed {len(rows)} results to score in {(time.time() - start_time) * 1000:.1f}ms")
+
+    async def resync_counts(self) -> Dict[str, int]:
+        """
+        Write out anything pending, then reset the counts to what's in the db - results also leave the db through
+        retention and hotkey purges, which don't go through here. Returns the number of stored results per task
+        """
+        async with self._flush_lock:
+            await self._flush()
+            rows = await self.storage.fetchall(sql.select_tasks_and_number_of_results())
+
+            # Results offered while we were reading aren't in the db yet
+            stored_counts = {task: count for task, count in rows}
+            self.counts = defaultdict(int)
+            for task in set(stored_counts) | set(self._pending) | set(self._evictions):
+                self.counts[task] = max(
+                    stored_counts.get(task, 0) + len(self._pending[task]) - self._evictions[task], 0
+                )
+            # Results seen is the reservoir's denominator, so it carries on across syncs - resetting it would
+            # take the sample back to keeping nearly everything
+            for task, count in self.counts.items():
+                self._seen[task] = max(self._seen[task], count)
+            return stored_counts
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.max_delay_seconds)
+            await self.flush()
+
+    async def stop(self) -> None:
+        if self._timer_task is not None:
+            self._timer_task.cancel()
+            self._timer_task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth(),
+            "results_offered": self.results_offered,
+            "results_kept": self.results_kept,
+            "rows_flushed": self.rows_flushed,
+            "failed_flushes": self.failed_flushes,
+            "stored_per_task": dict(self.counts),
+        }
@@ -0,0 +1,117 @@
+import asyncio
+import contextlib
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiosqlite
+import bittensor as bt
+
+from validation.db import constants as cst
+from validation.db import sql
+from validation.db.storage_engine import StorageEngine
+
+
+class RetentionWorker:
+    """
+    Prunes old rows in the background.
+
+    Rows are deleted a small chunk at a time, each chunk its own write job, with a pause in between, so the
+    writer is never tied up for long and everything else queued gets a look in. After each run, unreferenced
+    blobs are removed and some free pages are handed back to the file system.
+    """
+
+    def __init__(
+        self,
+        storage: StorageEngine,
+        data_retention_minutes: int = cst.DEFAULT_DATA_RETENTION_MINUTES,
+        task_retention_minutes: int = cst.DEFAULT_TASK_RETENTION_MINUTES,
+        log_retention_minutes: int = cst.DEFAULT_LOG_RETENTION_MINUTES,
+        interval_seconds: float = cst.DEFAULT_RETENTION_INTERVAL_SECONDS,
+        chunk_size: int = cst.RETENTION_CHUNK_SIZE,
+        pause_between_chunks_seconds: float = cst.RETENTION_PAUSE_BETWEEN_CHUNKS_SECONDS,
+        on_tasks_pruned: Optional[Callable[[], Awaitable[Any]]] = None,
+    ) -> None:
+        self.storage = storage
+        self.interval_seconds = interval_seconds
+        self.chunk_size = chunk_size
+        self.pause_between_chunks_seconds = pause_between_chunks_seconds
+        self.on_tasks_pruned = on_tasks_pruned
+        self.retention_windows: List[Tuple[str, int]] = [
+            (cst.TABLE_REWARD_DATA, data_retention_minutes),
+            (cst.TABLE_UID_RECORDS, data_retention_minutes),
+            (cst.TABLE_TASKS, task_retention_minutes),
+            (cst.TABLE_LOGS, log_retention_minutes),
+        ]
+
+        self._task: Optional[asyncio.Task] = None
+
+        self.rows_pruned: Dict[str, int] = {table: 0 for table, _ in self.retention_windows}
+        self.blobs_pruned = 0
+        self.runs = 0
+        self.last_run_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_periodically())
+
+    async def _run_periodically(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                bt.logging.error(f"Retention run failed: {repr(e)}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def run_once(self) -> None:
+        start_time = time.time()
+        pruned_this_run: Dict[str, int] = {}
+        for table, retention_minutes in self.retention_windows:
+            cutoff_time_str = (datetime.now() - timedelta(minutes=retention_minutes)).strftime("%Y-%m-%d %H:%M:%S")
+            pruned_this_run[table] = await self._prune_table(table, cutoff_time_str)
+            self.rows_pruned[table] += pruned_this_run[table]
+
+        if pruned_this_run[cst.TABLE_TASKS] and self.on_tasks_pruned is not None:
+            await self.on_tasks_pruned()
+
+        self.blobs_pruned += await self._delete_rows(sql.delete_unreferenced_blobs(), ())
+        await self.storage.run_outside_transaction(f"PRAGMA incremental_vacuum({cst.INCREMENTAL_VACUUM_PAGES});")
+
+        self.runs += 1
+        self.last_run_seconds = time.time() - start_time
+        self.total_run_seconds += self.last_run_seconds
+        bt.logging.info(f"Retention pruned {pruned_this_run} rows in {self.last_run_seconds:.2f}s")
+
+    async def _prune_table(self, table: str, cutoff_time_str: str) -> int:
+        total_deleted = 0
+        while True:
+            deleted = await self._delete_rows(sql.delete_chunk_older_than(table), (cutoff_time_str, self.chunk_size))
+            total_deleted += deleted
+            if deleted < self.chunk_size:
+                return total_deleted
+            await asyncio.sleep(self.pause_between_chunks_seconds)
+
+    async def _delete_rows(self, query: str, params: Tuple[Any, ...]) -> int:
+        async def _delete(conn: aiosqlite.Connection) -> int:
+            async with conn.execute(query, params) as cursor:
+                return cursor.rowcount
+
+        return await self.storage.write(_delete)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            # So nothing is still pruning once the db is closed
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rows_pruned": dict(self.rows_pruned),
+            "blobs_pruned": self.blobs_pruned,
+            "runs": self.runs,
+            "last_run_seconds": self.last_run_seconds,
+            "total_run_seconds": self.total_run_seconds,
+        }
@@ -27,136 +27,226 @@ def insert_uid_record() -> str:
 
 def insert_task() -> str:
     return f"""
-    INSERT INTO {cst.TABLE_TASKS} ({cst.COLUMN_TASK_NAME}, {cst.COLUMN_CHECKING_DATA}, {cst.COLUMN_MINER_HOTKEY}) VALUES (?, ?, ?)
+    INSERT INTO {cst.TABLE_TASKS} (
+        {cst.COLUMN_TASK_NAME}, {cst.COLUMN_CHECKING_DATA}, {cst.COLUMN_MINER_HOTKEY}, {cst.COLUMN_BLOB_HASHES}
+    ) VALUES (?, ?, ?, ?)
+    """
+
+
+def insert_blob() -> str:
+    return f"""
+    INSERT INTO {cst.TABLE_BLOBS} ({cst.COLUMN_HASH}, {cst.COLUMN_DATA}) VALUES (?, ?)
+    ON CONFLICT ({cst.COLUMN_HASH}) DO NOTHING
     """
 
 
 ##### Delete stuff
-def delete_task_by_hotkey() -> str:
+def delete_rows_of_hotkeys(table: str = cst.TABLE_TASKS) -> str:
+    """Hotkeys are passed in as a json list"""
     return f"""
-    DELETE FROM {cst.TABLE_TASKS} WHERE {cst.COLUMN_MINER_HOTKEY} = ?
+    DELETE FROM {table} WHERE {cst.COLUMN_MINER_HOTKEY} IN (SELECT value FROM json_each(?))
     """
 
 
-def delete_reward_data_by_hotkey() -> str:
+def delete_chunk_older_than(table: str = cst.TABLE_TASKS) -> str:
+    """At most `?` of the table's oldest rows, created before `?`. Oldest first, which the aggregate triggers need"""
     return f"""
-    DELETE FROM {cst.TABLE_REWARD_DATA} WHERE {cst.COLUMN_MINER_HOTKEY} = ?
+    DELETE FROM {table}
+    WHERE rowid IN (
+        SELECT rowid FROM {table} WHERE {cst.COLUMN_CREATED_AT} < ? ORDER BY {cst.COLUMN_CREATED_AT} ASC LIMIT ?
+    )
     """
 
 
-def delete_uid_data_by_hotkey() -> str:
+def delete_random_rows_of_task() -> str:
     return f"""
-    DELETE FROM {cst.TABLE_UID_RECORDS} WHERE {cst.COLUMN_MINER_HOTKEY} = ?
+    DELETE FROM {cst.TABLE_TASKS}
+    WHERE {cst.COLUMN_ID} IN (
+        SELECT {cst.COLUMN_ID} FROM {cst.TABLE_TASKS} WHERE {cst.COLUMN_TASK_NAME} = ? ORDER BY RANDOM() LIMIT ?
+    )
     """
 
 
-def delete_task_data_older_than() -> str:
+def delete_task_with_fewest_rewards_returning() -> str:
+    """
+    Pop a result for the task: from the hotkey with the fewest rewards for it (an indexed lookup into
+    the reward aggregates), oldest first. The delete and the select are one statement, so concurrent
+    callers always get different results
+    """
     return f"""
-    DELETE FROM {cst.TABLE_TASKS} WHERE {cst.COLUMN_CREATED_AT} < ?
+    DELETE FROM {cst.TABLE_TASKS}
+    WHERE {cst.COLUMN_ID} = (
+        SELECT t.{cst.COLUMN_ID}
+        FROM {cst.TABLE_TASKS} t
+        LEFT JOIN {cst.TABLE_REWARD_DATA_AGGREGATES} r
+            ON r.{cst.COLUMN_TASK} = t.{cst.COLUMN_TASK_NAME}
+            AND r.{cst.COLUMN_MINER_HOTKEY} = t.{cst.COLUMN_MINER_HOTKEY}
+        WHERE t.{cst.COLUMN_TASK_NAME} = ?
+        ORDER BY COALESCE(r.{cst.COLUMN_REWARD_COUNT}, 0) ASC, t.{cst.COLUMN_ID} ASC
+        LIMIT 1
+    )
+    RETURNING {cst.COLUMN_CHECKING_DATA}, {cst.COLUMN_MINER_HOTKEY}, {cst.COLUMN_BLOB_HASHES}
     """
 
 
-def delete_reward_data_older_than() -> str:
+def delete_unreferenced_blobs() -> str:
     return f"""
-    DELETE FROM {cst.TABLE_REWARD_DATA} WHERE {cst.COLUMN_CREATED_AT} < ?
+    DELETE FROM {cst.TABLE_BLOBS} WHERE {cst.COLUMN_REF_COUNT} <= 0
     """
 
 
-def delete_uid_data_older_than() -> str:
+#### Select
+def select_tasks_and_number_of_results() -> str:
     return f"""
-    DELETE FROM {cst.TABLE_UID_RECORDS} WHERE {cst.COLUMN_CREATED_AT} < ?
+    SELECT {cst.COLUMN_TASK_NAME}, COUNT(*) FROM {cst.TABLE_TASKS} GROUP BY {cst.COLUMN_TASK_NAME}
     """
 
 
-def delete_oldest_rows_from_tasks(limit: int = 10) -> str:
+def select_blobs() -> str:
+    """Hashes are passed in as a json list"""
     return f"""
-    DELETE FROM {cst.TABLE_TASKS} 
-    WHERE {cst.COLUMN_ID} IN (
-        SELECT {cst.COLUMN_ID} FROM {cst.TABLE_TASKS} ORDER BY {cst.COLUMN_CREATED_AT} ASC LIMIT {limit}
-    )
+    SELECT {cst.COLUMN_HASH}, {cst.COLUMN_DATA} FROM {cst.TABLE_BLOBS}
+    WHERE {cst.COLUMN_HASH} IN (SELECT value FROM json_each(?))
     """
 
 
-def delete_specific_task() -> str:
+def select_recent_reward_data_for_hotkeys() -> str:
+    """Hotkeys are passed in as a json list"""
     return f"""
-    DELETE FROM {cst.TABLE_TASKS} WHERE {cst.COLUMN_TASK_NAME} = ? AND {cst.COLUMN_CHECKING_DATA} = ?
+    SELECT
+        {cst.COLUMN_ID},
+        {cst.COLUMN_TASK},
+        {cst.COLUMN_AXON_UID},
+        {cst.COLUMN_QUALITY_SCORE},
+        {cst.COLUMN_VALIDATOR_HOTKEY},
+        {cst.COLUMN_MINER_HOTKEY},
+        {cst.COLUMN_SYNTHETIC_QUERY},
+        {cst.COLUMN_SPEED_SCORING_FACTOR},
+        {cst.COLUMN_RESPONSE_TIME},
+        {cst.COLUMN_VOLUME},
+        {cst.COLUMN_CREATED_AT}
+    FROM {cst.TABLE_REWARD_DATA}
+    WHERE {cst.COLUMN_CREATED_AT} > ?
+    AND {cst.COLUMN_MINER_HOTKEY} IN (SELECT value FROM json_each(?))
+    ORDER BY {cst.COLUMN_MINER_HOTKEY}, {cst.COLUMN_CREATED_AT} DESC
     """
 
 
-#### Select
-def select_tasks_and_number_of_results() -> str:
+def select_uid_period_scores_for_hotkeys() -> str:
+    """Hotkeys are passed in as a json list"""
     return f"""
-    SELECT {cst.COLUMN_TASK_NAME}, COUNT(*) FROM {cst.TABLE_TASKS} GROUP BY {cst.COLUMN_TASK_NAME}
+    SELECT
+        {cst.COLUMN_MINER_HOTKEY},
+        {cst.COLUMN_TASK},
+        {cst.COLUMN_PERIOD_SCORE},
+        {cst.COLUMN_CONSUMED_VOLUME},
+        {cst.COLUMN_CREATED_AT}
+    FROM {cst.TABLE_UID_RECORDS}
+    WHERE {cst.COLUMN_MINER_HOTKEY} IN (SELECT value FROM json_each(?))
     """
 
 
-def select_count_of_rows_in_tasks() -> str:
+def select_reward_aggregates_for_hotkeys() -> str:
+    """Hotkeys are passed in as a json list"""
     return f"""
-    SELECT COUNT(*) FROM {cst.TABLE_TASKS}
+    SELECT
+        {cst.COLUMN_TASK},
+        {cst.COLUMN_MINER_HOTKEY},
+        {cst.COLUMN_REWARD_COUNT},
+        {cst.COLUMN_COMBINED_QUALITY_SCORE_SUM}
+    FROM {cst.TABLE_REWARD_DATA_AGGREGATES}
+    WHERE {cst.COLUMN_MINER_HOTKEY} IN (SELECT value FROM json_each(?))
     """
 
 
-def select_count_rows_of_task_stored_for_scoring() -> str:
+def select_period_score_aggregates_for_hotkeys() -> str:
+    """Hotkeys are passed in as a json list"""
     return f"""
-    SELECT COUNT(*) FROM {cst.TABLE_TASKS} WHERE {cst.COLUMN_TASK_NAME} = ?
+    SELECT
+        {cst.COLUMN_TASK},
+        {cst.COLUMN_MINER_HOTKEY},
+        {cst.COLUMN_PERIOD_SCORE_COUNT},
+        {cst.COLUMN_DECAYED_WEIGHTED_SCORE_SUM},
+        {cst.COLUMN_DECAYED_VOLUME_SUM}
+    FROM {cst.TABLE_PERIOD_SCORE_AGGREGATES}
+    WHERE {cst.COLUMN_MINER_HOTKEY} IN (SELECT value FROM json_each(?))
     """
 
-def select_task_for_deletion() -> str:
+
+def select_recent_combined_quality_scores_for_hotkeys() -> str:
+    """
+    The most recent `?` combined quality scores of each hotkey, most recent first.
+    Hotkeys are passed in as a json list. Each hotkey is a bounded index range scan.
+    """
     return f"""
-    SELECT t.{cst.COLUMN_CHECKING_DATA}, t.{cst.COLUMN_MINER_HOTKEY}
-    FROM {cst.TABLE_TASKS} t
-    LEFT JOIN (
-        SELECT {cst.COLUMN_MINER_HOTKEY}, COUNT(*) as reward_count
-        FROM {cst.TABLE_REWARD_DATA}
-        WHERE {cst.COLUMN_TASK} = ?
-        GROUP BY {cst.COLUMN_MINER_HOTKEY}
-    ) r ON t.{cst.COLUMN_MINER_HOTKEY} = r.{cst.COLUMN_MINER_HOTKEY}
-    WHERE t.{cst.COLUMN_TASK_NAME} = ?
-    ORDER BY COALESCE(r.reward_count, 0) ASC
-    LIMIT 1
+    SELECT
+        h.value,
+        COALESCE(r.{cst.COLUMN_QUALITY_SCORE} * r.{cst.COLUMN_SPEED_SCORING_FACTOR}, 0)
+    FROM json_each(?) h
+    JOIN {cst.TABLE_REWARD_DATA} r ON r.rowid IN (
+        SELECT rowid FROM {cst.TABLE_REWARD_DATA}
+        WHERE {cst.COLUMN_MINER_HOTKEY} = h.value
+        ORDER BY {cst.COLUMN_CREATED_AT} DESC
+        LIMIT ?
+    )
+    ORDER BY h.value, r.{cst.COLUMN_CREATED_AT} DESC
     """
 
 
+#### Score aggregate rebuilds
+
 
-def select_recent_reward_data_for_a_task():
+def delete_all_reward_data_aggregates() -> str:
     return f"""
-    SELECT * FROM {cst.TABLE_REWARD_DATA}
-    WHERE {cst.COLUMN_TASK} = ?
-    AND {cst.COLUMN_CREATED_AT} > ?
-    AND {cst.COLUMN_MINER_HOTKEY} = ?
-    ORDER BY {cst.COLUMN_CREATED_AT} DESC
+    DELETE FROM {cst.TABLE_REWARD_DATA_AGGREGATES}
     """
 
 
-def select_recent_reward_data():
+def delete_all_period_score_aggregates() -> str:
     return f"""
+    DELETE FROM {cst.TABLE_PERIOD_SCORE_AGGREGATES}
+    """
+
+
+def insert_reward_data_aggregates_from_reward_data() -> str:
+    return f"""
+    INSERT INTO {cst.TABLE_REWARD_DATA_AGGREGATES} (
+        {cst.COLUMN_TASK},
+        {cst.COLUMN_MINER_HOTKEY},
+        {cst.COLUMN_REWARD_COUNT},
+        {cst.COLUMN_COMBINED_QUALITY_SCORE_SUM}
+    )
     SELECT
-        id,
-        task,
-        axon_uid,
-        quality_score,
-        validator_hotkey,
-        miner_hotkey,
-        synthetic_query,
-        speed_scoring_factor,
-        response_time,
-        volume,
-        created_at
+        {cst.COLUMN_TASK},
+        {cst.COLUMN_MINER_HOTKEY},
+        COUNT(*),
+        TOTAL(COALESCE({cst.COLUMN_QUALITY_SCORE} * {cst.COLUMN_SPEED_SCORING_FACTOR}, 0))
     FROM {cst.TABLE_REWARD_DATA}
-    WHERE {cst.COLUMN_CREATED_AT} > ?
-    AND {cst.COLUMN_MINER_HOTKEY} = ?
-    ORDER BY {cst.COLUMN_CREATED_AT} DESC
-    LIMIT ?
+    GROUP BY {cst.COLUMN_TASK}, {cst.COLUMN_MINER_HOTKEY}
     """
 
 
-def select_uid_period_scores_for_task():
+def select_period_scores_oldest_first() -> str:
     return f"""
     SELECT
+        {cst.COLUMN_TASK},
+        {cst.COLUMN_MINER_HOTKEY},
         {cst.COLUMN_PERIOD_SCORE},
-        {cst.COLUMN_CONSUMED_VOLUME},
-        {cst.COLUMN_CREATED_AT}
+        {cst.COLUMN_CONSUMED_VOLUME}
     FROM {cst.TABLE_UID_RECORDS}
-    WHERE {cst.COLUMN_TASK} = ?
-    AND {cst.COLUMN_MINER_HOTKEY} = ?
+    WHERE {cst.COLUMN_PERIOD_SCORE} IS NOT NULL
+    ORDER BY {cst.COLUMN_TASK}, {cst.COLUMN_MINER_HOTKEY}, {cst.COLUMN_CREATED_AT}
+    """
+
+
+def insert_period_score_aggregate() -> str:
+    return f"""
+    INSERT INTO {cst.TABLE_PERIOD_SCORE_AGGREGATES} (
+        {cst.COLUMN_TASK},
+        {cst.COLUMN_MINER_HOTKEY},
+        {cst.COLUMN_PERIOD_SCORE_COUNT},
+        {cst.COLUMN_DECAYED_WEIGHTED_SCORE_SUM},
+        {cst.COLUMN_DECAYED_VOLUME_SUM},
+        {cst.COLUMN_OLDEST_DECAY_WEIGHT}
+    ) VALUES (?, ?, ?, ?, ?, ?)
     """
@@ -0,0 +1,238 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, List, Optional, Tuple
+
+import aiosqlite
+import bittensor as bt
+
+from validation.db import constants as cst
+
+WriteJob = Callable[[aiosqlite.Connection], Awaitable[Any]]
+# The job, the future for its result, and whether it has to run outside of a transaction
+QueuedWriteJob = Tuple[WriteJob, asyncio.Future, bool]
+
+
+class StorageEngine:
+    """
+    SQLite in WAL mode, with a pool of read connections and a single writer task.
+
+    In WAL mode readers don't block the writer and the writer doesn't block readers, so reads are
+    served straight from a pool of connections. Writes are pushed onto a queue and applied by one
+    writer task, which drains everything queued and commits it in a single transaction. Each job
+    runs in its own savepoint, so one failing job doesn't roll back its neighbours.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        read_pool_size: int = cst.DEFAULT_READ_POOL_SIZE,
+        max_jobs_per_transaction: int = cst.MAX_WRITE_JOBS_PER_TRANSACTION,
+    ) -> None:
+        self.db_path = db_path
+        self.read_pool_size = max(read_pool_size, 1)
+        self.max_jobs_per_transaction = max_jobs_per_transaction
+
+        self._readers: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self._all_readers: List[aiosqlite.Connection] = []
+        self._write_queue: asyncio.Queue[Optional[QueuedWriteJob]] = asyncio.Queue()
+        self._writer_conn: Optional[aiosqlite.Connection] = None
+        self._writer_task: Optional[asyncio.Task] = None
+
+    async def initialize(self, run_maintenance: bool = True) -> None:
+        """
+        Open the connections. With `run_maintenance`, also puts the db in WAL mode and incremental auto vacuum,
+        which are kept in the file - so only one process should, while it has the db to itself
+        """
+        self._writer_conn = await self._connect()
+        if run_maintenance:
+            await self._run_pragma(self._writer_conn, f"PRAGMA journal_mode = {cst.JOURNAL_MODE}")
+            await self._ensure_incremental_auto_vacuum()
+
+        for _ in range(self.read_pool_size):
+            reader = await self._connect()
+            await self._run_pragma(reader, "PRAGMA query_only = ON")
+            self._all_readers.append(reader)
+            self._readers.put_nowait(reader)
+
+        self._writer_task = asyncio.create_task(self._run_writer())
+        bt.logging.info(f"Storage engine ready on {self.db_path} with {self.read_pool_size} readers and one writer")
+
+    async def _connect(self) -> aiosqlite.Connection:
+        # isolation_level=None so we control transactions explicitly, rather than sqlite3's implicit BEGINs
+        conn = await aiosqlite.connect(self.db_path, isolation_level=None)
+        for pragma in cst.CONNECTION_PRAGMAS:
+            await self._run_pragma(conn, pragma)
+        return conn
+
+    async def _ensure_incremental_auto_vacuum(self) -> None:
+        # So retention can hand free pages back a few at a time, rather than the file only ever growing
+        async with self._writer_conn.execute("PRAGMA auto_vacuum") as cursor:
+            auto_vacuum = (await cursor.fetchone())[0]
+        if auto_vacuum == cst.AUTO_VACUUM_INCREMENTAL:
+            return
+        bt.logging.info("Switching the db to incremental auto vacuum. This is a one off VACUUM, and can take a while")
+        await self._run_pragma(self._writer_conn, f"PRAGMA auto_vacuum = {cst.AUTO_VACUUM_INCREMENTAL}")
+        await self._writer_conn.execute("VACUUM")
+
+    @staticmethod
+    async def _run_pragma(conn: aiosqlite.Connection, pragma: str) -> None:
+        # Some pragmas return a row, so make sure the statement is finished before moving on
+        async with conn.execute(pragma) as cursor:
+            await cursor.fetchall()
+
+    ##### Reads
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    async def fetchall(self, query: str, params: Iterable[Any] = ()) -> List[Tuple[Any, ...]]:
+        async with self.reader() as conn:
+            async with conn.execute(query, tuple(params)) as cursor:
+                return await cursor.fetchall()
+
+    async def fetchone(self, query: str, params: Iterable[Any] = ()) -> Optional[Tuple[Any, ...]]:
+        async with self.reader() as conn:
+            async with conn.execute(query, tuple(params)) as cursor:
+                return await cursor.fetchone()
+
+    ##### Writes
+
+    async def write(self, job: WriteJob) -> Any:
+        """
+        Run `job(conn)` on the writer connection, inside a transaction.
+
+        Returns whatever the job returns, once the transaction it ran in has been committed.
+        Jobs must not commit or rollback themselves.
+        """
+        return await self._queue_write(job, outside_transaction=False)
+
+    async def run_outside_transaction(self, script: str) -> None:
+        """
+        Run `script` on the writer connection between transactions, for statements that can't run inside
+        one (e.g. `PRAGMA incremental_vacuum`, which only frees all its pages when run as a script)
+        """
+
+        async def _job(conn: aiosqlite.Connection) -> None:
+            await conn.executescript(script)
+
+        await self._queue_write(_job, outside_transaction=True)
+
+    async def _queue_write(self, job: WriteJob, outside_transaction: bool) -> Any:
+        if self._writer_task is None:
+            raise RuntimeError("Storage engine not initialized")
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((job, future, outside_transaction))
+        return await future
+
+    async def execute(self, query: str, params: Iterable[Any] = ()) -> None:
+        async def _job(conn: aiosqlite.Connection) -> None:
+            await conn.execute(query, tuple(params))
+
+        await self.write(_job)
+
+    async def executemany(self, query: str, params: Iterable[Iterable[Any]]) -> None:
+        async def _job(conn: aiosqlite.Connection) -> None:
+            await conn.executemany(query, params)
+
+        await self.write(_job)
+
+    def write_queue_depth(self) -> int:
+        return self._write_queue.qsize()
+
+    async def _run_writer(self) -> None:
+        stop = False
+        while not stop:
+            item = await self._write_queue.get()
+            if item is None:
+                break
+            if item[2]:
+                await self._apply_outside_transaction(item)
+                continue
+
+            batch = [item]
+            outside_transaction_item = None
+            while len(batch) < self.max_jobs_per_transaction and not self._write_queue.empty():
+                item = self._write_queue.get_nowait()
+                if item is None:
+                    stop = True
+                    break
+                if item[2]:
+                    outside_transaction_item = item
+                    break
+                batch.append(item)
+            await self._apply_batch(batch)
+            if outside_transaction_item is not None:
+                await self._apply_outside_transaction(outside_transaction_item)
+
+    async def _apply_outside_transaction(self, item: QueuedWriteJob) -> None:
+        job, future, _ = item
+        if future.cancelled():
+            return
+        try:
+            result = await job(self._writer_conn)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        future.set_result(result)
+
+    async def _apply_batch(self, batch: List[QueuedWriteJob]) -> None:
+        conn = self._writer_conn
+        outcomes: List[Tuple[asyncio.Future, Optional[BaseException], Any]] = []
+        try:
+            await conn.execute("BEGIN IMMEDIATE")
+            for job, future, _ in batch:
+                if future.cancelled():
+                    continue
+                await conn.execute("SAVEPOINT write_job")
+                try:
+                    result = await job(conn)
+                except Exception as e:
+                    await conn.execute("ROLLBACK TO write_job")
+                    await conn.execute("RELEASE write_job")
+                    outcomes.append((future, e, None))
+                    continue
+                await conn.execute("RELEASE write_job")
+                outcomes.append((future, None, result))
+            await conn.execute("COMMIT")
+        except Exception as e:
+            bt.logging.error(f"Write transaction of {len(batch)} jobs failed, rolling back: {repr(e)}")
+            try:
+                if conn.in_transaction:
+                    await conn.execute("ROLLBACK")
+            except Exception as rollback_error:
+                # The jobs still have to hear about it, and the writer has to keep going
+                bt.logging.error(f"Rolling back the failed write transaction failed too: {repr(rollback_error)}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, exception, result in outcomes:
+            if future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+    async def close(self) -> None:
+        if self._writer_task is not None:
+            # Anything queued before the sentinel is still written
+            await self._write_queue.put(None)
+            await self._writer_task
+            self._writer_task = None
+
+        if self._writer_conn is not None:
+            await self._run_pragma(self._writer_conn, "PRAGMA optimize")
+            await self._writer_conn.close()
+            self._writer_conn = None
+
+        for reader in self._all_readers:
+            await reader.close()
+        self._all_readers = []
+        self._readers = asyncio.Queue()
@@ -0,0 +1,134 @@
+import asyncio
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import aiosqlite
+import bittensor as bt
+
+from validation.db import constants as cst
+from validation.db.storage_engine import StorageEngine
+
+
+class WriteBehindBuffer:
+    """
+    Buffers rows for one INSERT statement and writes them with a single `executemany`.
+
+    A flush happens when `max_rows` rows are waiting, every `max_delay_seconds` otherwise, and whenever
+    someone asks for one (on shutdown, and before anything that needs the rows reads the table).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        storage: StorageEngine,
+        insert_query: str,
+        max_rows: int = cst.WRITE_BUFFER_MAX_ROWS,
+        max_delay_seconds: float = cst.WRITE_BUFFER_MAX_DELAY_SECONDS,
+        max_flush_attempts: int = cst.WRITE_BUFFER_MAX_FLUSH_ATTEMPTS,
+    ) -> None:
+        self.name = name
+        self.storage = storage
+        self.insert_query = insert_query
+        self.max_rows = max_rows
+        self.max_delay_seconds = max_delay_seconds
+        self.max_flush_attempts = max_flush_attempts
+
+        self._rows: List[Sequence[Any]] = []
+        self._flush_lock = asyncio.Lock()
+        self._timer_task: Optional[asyncio.Task] = None
+        self._size_triggered_flush: Optional[asyncio.Task] = None
+        self._failed_flushes_in_a_row = 0
+
+        self.rows_flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rows_dropped = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+    def start(self) -> None:
+        if self._timer_task is None:
+            self._timer_task = asyncio.create_task(self._flush_periodically())
+
+    def add(self, row: Sequence[Any]) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= self.max_rows and (
+            self._size_triggered_flush is None or self._size_triggered_flush.done()
+        ):
+            self._size_triggered_flush = asyncio.create_task(self.flush())
+
+    def queue_depth(self) -> int:
+        return len(self._rows)
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._rows:
+                return
+            rows, self._rows = self._rows, []
+
+            start_time = time.time()
+            try:
+                if self._failed_flushes_in_a_row >= self.max_flush_attempts:
+                    await self._write_rows_one_at_a_time(rows)
+                else:
+                    await self.storage.executemany(self.insert_query, rows)
+            except Exception as e:
+                self.failed_flushes += 1
+                self._failed_flushes_in_a_row += 1
+                if self._failed_flushes_in_a_row > self.max_flush_attempts:
+                    self.rows_dropped += len(rows)
+                    self._failed_flushes_in_a_row = 0
+                    bt.logging.error(f"Dropping {len(rows)} rows from the {self.name} buffer: {repr(e)}")
+                else:
+                    # Put them back at the front, so they go out with the next flush
+                    self._rows = rows + self._rows
+                    bt.logging.error(f"Failed to flush {len(rows)} rows from the {self.name} buffer: {repr(e)}")
+                return
+            self._failed_flushes_in_a_row = 0
+
+            self.last_flush_latency = time.time() - start_time
+            self.max_flush_latency = max(self.max_flush_latency, self.last_flush_latency)
+            self.rows_flushed += len(rows)
+            self.flushes += 1
+            bt.logging.debug(
+                f"Flushed {len(rows)} rows from the {self.name} buffer in {self.last_flush_latency * 1000:.1f}ms; "
+                f"{self.queue_depth()} rows waiting"
+            )
+
+    async def _write_rows_one_at_a_time(self, rows: List[Sequence[Any]]) -> None:
+        """So a bad row can't hold the rest back for ever - it's dropped, and the others written"""
+
+        async def _write(conn: aiosqlite.Connection) -> int:
+            dropped = 0
+            for row in rows:
+                try:
+                    await conn.execute(self.insert_query, row)
+                except sqlite3.Error as e:
+                    dropped += 1
+                    bt.logging.error(f"Dropping a row from the {self.name} buffer that can't be written: {repr(e)}")
+            return dropped
+
+        self.rows_dropped += await self.storage.write(_write)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.max_delay_seconds)
+            await self.flush()
+
+    async def stop(self) -> None:
+        if self._timer_task is not None:
+            self._timer_task.cancel()
+            self._timer_task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth(),
+            "rows_flushed": self.rows_flushed,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "rows_dropped": self.rows_dropped,
+            "last_flush_latency": self.last_flush_latency,
+            "max_flush_latency": self.max_flush_latency,
+        }
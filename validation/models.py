@@ -96,3 +96,22 @@ class RewardData(BaseModel):
             "volume": self.volume,
             "created_at": self.created_at.isoformat(),  # Convert datetime to ISO string
         }
+
+
+class RewardAggregate(BaseModel):
+    """Running totals of a hotkey's reward data for one task"""
+
+    task: str
+    miner_hotkey: str
+    reward_count: int
+    combined_quality_score_sum: float
+
+
+class PeriodScoreAggregate(BaseModel):
+    """Running, time decayed totals of a hotkey's period scores for one task"""
+
+    task: Task
+    miner_hotkey: str
+    period_score_count: int
+    decayed_weighted_score_sum: float
+    decayed_volume_sum: float
@@ -0,0 +1,60 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, Optional
+
+from validation.db.db_management import db_manager
+from validation.proxy import sql
+
+# Keys are managed by vision.py in another process, so changes are picked up by the cache going stale
+API_KEY_CACHE_TTL_SECONDS = 5
+
+
+class ApiKeyCache:
+    """
+    Every API key, held in memory and reloaded in full once it's older than the TTL.
+
+    There are few enough keys that loading all of them is one cheap query, and it means unknown keys are
+    turned away without touching the db either.
+    """
+
+    def __init__(self, ttl_seconds: float = API_KEY_CACHE_TTL_SECONDS) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._keys: Dict[str, Dict[str, Any]] = {}
+        self._loaded_at: Optional[float] = None
+        self._refresh_lock = asyncio.Lock()
+        # Debits made but not yet in the db, for a key
+        self.pending_debits: Callable[[str], float] = lambda api_key: 0
+
+    def _is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_seconds
+
+    async def get(self, api_key: str) -> Optional[Dict[str, Any]]:
+        if self._is_stale():
+            await self._refresh()
+        return self._keys.get(api_key)
+
+    async def _refresh(self) -> None:
+        async with self._refresh_lock:
+            # Someone else may have refreshed while we waited for the lock
+            if not self._is_stale():
+                return
+            async with db_manager.storage.reader() as conn:
+                api_keys = await sql.get_all_api_keys(conn)
+            for api_key_info in api_keys:
+                if api_key_info[sql.BALANCE] is not None:
+                    api_key_info[sql.BALANCE] -= self.pending_debits(api_key_info[sql.KEY])
+            self._keys = {api_key_info[sql.KEY]: api_key_info for api_key_info in api_keys}
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        """The next lookup reloads every key"""
+        self._loaded_at = None
+
+    def adjust_balance(self, api_key: str, amount: float) -> None:
+        """Keep the cached balance up to date between reloads, as requests are billed"""
+        api_key_info = self._keys.get(api_key)
+        if api_key_info is not None and api_key_info[sql.BALANCE] is not None:
+            api_key_info[sql.BALANCE] += amount
+
+
+api_key_cache = ApiKeyCache()
@@ -1,95 +1,109 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
-from starlette import status
+from fastapi import FastAPI
 import uvicorn
 import asyncio
-import aiosqlite
+import signal
 from config.validator_config import config as validator_config
+from core import constants as core_cst
 from validation.proxy.api_server.image.endpoints import router as image_router
 from validation.proxy.api_server.text.endpoints import router as text_router
-from validation.core_validator import core_validator
-from validation.proxy import sql
+from validation.proxy.api_server.status.endpoints import router as status_router
+from validation.proxy.api_server.middleware import ApiKeyMiddleware
+from validation.proxy.billing_ledger import billing_ledger
+from validation.proxy.core_ipc import CoreIpcServer, get_core
+from validation.proxy.embedding_cache import embedding_cache
+from validation.proxy.rate_limiter import rate_limiter
 from validation.db.db_management import db_manager
 
+IS_WORKER = validator_config.api_role == core_cst.API_ROLE_WORKER
+
 app = FastAPI(debug=False)
 
 app.include_router(image_router)
 app.include_router(text_router)
+app.include_router(status_router)
+app.state.max_upload_image_bytes = validator_config.max_upload_image_bytes
+app.add_middleware(ApiKeyMiddleware, rate_limit_share=1 / validator_config.api_workers if IS_WORKER else 1)
 
 
-async def main():
-    await db_manager.initialize()
-    core_validator.start_continuous_tasks()
+def _configure_embedding_cache() -> None:
+    embedding_cache.max_entries = validator_config.clip_embedding_cache_size
+    if validator_config.clip_embedding_disk_cache_dir:
+        embedding_cache.open_disk_tier(validator_config.clip_embedding_disk_cache_dir)
 
-    port = validator_config.api_server_port
-
-    if port:
-        uvicorn.run(app, host="0.0.0.0", port=int(port), loop="asyncio")
-    else:
-        while True:
-            await asyncio.sleep(10)
 
+@app.on_event("startup")
+async def startup() -> None:
+    # The combined process sets everything up in main, before the server starts
+    if IS_WORKER:
+        await db_manager.open_storage(read_pool_size=validator_config.db_read_pool_size)
+        billing_ledger.start()
+        _configure_embedding_cache()
+        get_core().start()
 
-def _get_api_key(request: Request):
-    auth_header = request.headers.get("Authorization")
-    if not auth_header:
-        return None
-    if auth_header.startswith("Bearer "):
-        return auth_header.split(" ")[1]
-    else:
-        return auth_header
 
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    await billing_ledger.stop()
+    if IS_WORKER:
+        await get_core().stop()
+    # Each worker only counts its own share of the limits, so there's nothing sensible to save
+    elif validator_config.persist_rate_limits:
+        await rate_limiter.save(db_manager.storage)
+    embedding_cache.close()
+    # Flushes anything still buffered to the db
+    await db_manager.close()
 
-ENDPOINT_TO_CREDITS_USED = {
-    "clip-embeddings": 0.2,
-    "text-to-image": 1,
-    "image-to-image": 1,
-    "inpaint": 1,
-    "scribble": 1,
-    "upscale": 1,
-}
 
+async def _run_until_stopped() -> None:
+    """Returns on SIGTERM or SIGINT, so whatever's buffered can be flushed on the way out"""
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signal_number, stopped.set)
+    await stopped.wait()
 
-@app.middleware("http")
-async def api_key_validator(request: Request, call_next):
-    if request.url.path in ["/docs", "/openapi.json", "/favicon.ico", "/redoc"]:
-        return await call_next(request)
-
-    api_key = _get_api_key(request)
-    if not api_key:
-        return JSONResponse(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            content={"detail": "API key is missing"},
-        )
 
-    async with aiosqlite.connect(sql.DATABASE_PATH) as conn:
-        api_key_info = await sql.get_api_key_info(conn, api_key)
-        if api_key_info is None:
-            return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"detail": "Invalid API key"})
-        endpoint = request.url.path.split("/")[-1]
-        credits_required = ENDPOINT_TO_CREDITS_USED.get(endpoint, 1)
-
-        if api_key_info[sql.BALANCE] is not None and api_key_info[sql.BALANCE] <= credits_required:
-            return JSONResponse(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS, content={"detail": "Insufficient credits - sorry!"}
-            )
-
-        rate_limit_exceeded = await sql.rate_limit_exceeded(conn, api_key_info)
-        if rate_limit_exceeded:
-            return JSONResponse(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS, content={"detail": "Rate limit exceeded - sorry!"}
-            )
+async def main():
+    await db_manager.initialize(read_pool_size=validator_config.db_read_pool_size)
+    core_validator = get_core()
+    core_validator.start_continuous_tasks()
 
-    response = await call_next(request)
+    if validator_config.api_role == core_cst.API_ROLE_CORE:
+        # The API workers serve the public API, and bill for it
+        core_ipc_server = CoreIpcServer(validator_config.core_socket_path, core_validator)
+        await core_ipc_server.start()
+        try:
+            await _run_until_stopped()
+        finally:
+            await core_ipc_server.stop()
+            await db_manager.close()
+        return
+
+    if validator_config.persist_rate_limits:
+        await rate_limiter.load(db_manager.storage)
+    billing_ledger.start()
+    _configure_embedding_cache()
 
-    if response.status_code == 200:
-        async with aiosqlite.connect(sql.DATABASE_PATH) as conn:
-            await sql.update_requests_and_credits(conn, api_key_info, credits_required)
-            await sql.log_request(conn, api_key_info, request.url.path, credits_required)
-            await conn.commit()
+    port = validator_config.api_server_port
 
-    return response
+    if port:
+        uvicorn.run(app, host="0.0.0.0", port=int(port), loop="asyncio")
+    else:
+        try:
+            await _run_until_stopped()
+        finally:
+            await shutdown()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if IS_WORKER:
+        # Each worker process imports the app afresh, and sets itself up on startup
+        uvicorn.run(
+            "validation.proxy.api_server.asgi:app",
+            host="0.0.0.0",
+            port=int(validator_config.api_server_port),
+            workers=validator_config.api_workers,
+            loop="asyncio",
+        )
+    else:
+        asyncio.run(main())
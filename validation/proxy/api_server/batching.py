@@ -0,0 +1,80 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Union
+
+import bittensor as bt
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from starlette.responses import StreamingResponse
+
+from core import constants as core_cst
+from models import request_models
+from validation.proxy.api_server.middleware import ADMIT_ITEMS_STATE_KEY, BILLED_ITEMS_STATE_KEY
+
+ImageHandler = Callable[[Any], Awaitable[Union[BaseModel, JSONResponse]]]
+
+
+async def _run_one(index: int, body: BaseModel, handle_one: ImageHandler) -> request_models.BatchImageResult:
+    """Whatever happens to one request, it's a result - one failing never fails the batch"""
+    try:
+        response = await handle_one(body)
+    except HTTPException as e:
+        return request_models.BatchImageResult(index=index, status_code=e.status_code, error=str(e.detail))
+    except Exception as e:
+        bt.logging.error(f"Request {index} of a batch failed: {repr(e)}")
+        return request_models.BatchImageResult(index=index, status_code=500, error="Internal error")
+
+    if isinstance(response, JSONResponse):
+        return request_models.BatchImageResult(
+            index=index, status_code=response.status_code, error=response.body.decode()
+        )
+    return request_models.BatchImageResult(index=index, status_code=200, image_b64=response.image_b64)
+
+
+async def run_batch(
+    request: Request,
+    bodies: List[BaseModel],
+    handle_one: ImageHandler,
+    stream: bool,
+    max_concurrency: int = core_cst.BATCH_MAX_CONCURRENCY,
+) -> Union[request_models.BatchImageResponse, StreamingResponse, JSONResponse]:
+    """
+    Run each request as it would be on its own, up to `max_concurrency` at a time. Each goes to the next miner
+    for its task, so a batch is spread over several.
+
+    Streamed, each result is a line of json sent as soon as it's done, so in the order they finish. Otherwise
+    they're all returned at the end, in request order. Only the ones that worked are billed, but the key needs
+    the credits and rate limit for all of them up front.
+    """
+    admit_items = getattr(request.state, ADMIT_ITEMS_STATE_KEY, None)
+    if admit_items is not None:
+        rejection = admit_items(len(bodies))
+        if rejection is not None:
+            return rejection
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    setattr(request.state, BILLED_ITEMS_STATE_KEY, 0)
+
+    async def _run_limited(index: int, body: BaseModel) -> request_models.BatchImageResult:
+        async with semaphore:
+            result = await _run_one(index, body, handle_one)
+        if result.status_code == 200:
+            setattr(request.state, BILLED_ITEMS_STATE_KEY, getattr(request.state, BILLED_ITEMS_STATE_KEY) + 1)
+        return result
+
+    if not stream:
+        results = await asyncio.gather(*[_run_limited(index, body) for index, body in enumerate(bodies)])
+        return request_models.BatchImageResponse(results=results)
+
+    async def _stream_results():
+        tasks = [asyncio.create_task(_run_limited(index, body)) for index, body in enumerate(bodies)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                yield result.json() + "\n"
+        finally:
+            # If the client goes away, there's no one to send the rest to
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(_stream_results(), media_type="application/x-ndjson")
@@ -1,28 +1,48 @@
+from typing import Union
+
 from core import Task
 import fastapi
 from fastapi.responses import JSONResponse
 from models import base_models, synapses, utility_models, request_models
 from validation.proxy import get_synapse, validation_utils
 from fastapi import HTTPException, routing
-from validation.proxy.api_server.image import utils
-from validation.core_validator import core_validator
+from validation.proxy.api_server import batching
+from validation.proxy.api_server.image import multipart, utils
+from validation.proxy.core_ipc import get_core
+from validation.proxy.embedding_cache import embedding_cache
 
 from validation.proxy import dependencies
 
 router = routing.APIRouter(tags=["image"])
 
 
-@router.post("/text-to-image")
+@router.post("/text-to-image", responses=utils.IMAGE_RESPONSES)
 async def text_to_image(
     body: request_models.TextToImageRequest,
+    request: fastapi.Request,
     _: None = fastapi.Depends(dependencies.get_token),
 ) -> request_models.TextToImageResponse:
+    return await utils.negotiate_image_response(request, await _text_to_image(body))
+
+
+@router.post("/text-to-image-batch")
+async def text_to_image_batch(
+    body: request_models.TextToImageBatchRequest,
+    request: fastapi.Request,
+    _: None = fastapi.Depends(dependencies.get_token),
+) -> request_models.BatchImageResponse:
+    return await batching.run_batch(request, body.requests, _text_to_image, stream=body.stream)
+
+
+async def _text_to_image(
+    body: request_models.TextToImageRequest,
+) -> Union[request_models.TextToImageResponse, JSONResponse]:
     synapse: synapses.TextToImage = get_synapse.get_synapse_from_body(
         body=body,
         synapse_model=synapses.TextToImage,
     )
 
-    result: utility_models.QueryResult = await core_validator.make_organic_query(
+    result: utility_models.QueryResult = await get_core().make_organic_query(
         synapse=synapse,
         outgoing_model=base_models.TextToImageOutgoing,
         task=Task(synapse.engine + "-text-to-image"),
@@ -38,17 +58,33 @@ async def text_to_image(
     return request_models.TextToImageResponse(image_b64=formatted_response.image_b64)
 
 
-@router.post("/image-to-image")
+@router.post("/image-to-image", responses=utils.IMAGE_RESPONSES)
 async def image_to_image(
     body: request_models.ImageToImageRequest,
+    request: fastapi.Request,
     _: None = fastapi.Depends(dependencies.get_token),
 ) -> request_models.ImageToImageResponse:
+    return await utils.negotiate_image_response(request, await _image_to_image(body))
+
+
+@router.post("/image-to-image-batch")
+async def image_to_image_batch(
+    body: request_models.ImageToImageBatchRequest,
+    request: fastapi.Request,
+    _: None = fastapi.Depends(dependencies.get_token),
+) -> request_models.BatchImageResponse:
+    return await batching.run_batch(request, body.requests, _image_to_image, stream=body.stream)
+
+
+async def _image_to_image(
+    body: request_models.ImageToImageRequest,
+) -> Union[request_models.ImageToImageResponse, JSONResponse]:
     synapse: synapses.ImageToImage = get_synapse.get_synapse_from_body(
         body=body,
         synapse_model=synapses.ImageToImage,
     )
 
-    result: utility_models.QueryResult = await core_validator.make_organic_query(
+    result: utility_models.QueryResult = await get_core().make_organic_query(
         synapse=synapse,
         outgoing_model=base_models.ImageToImageOutgoing,
         task=Task(synapse.engine + "-image-to-image"),
@@ -64,17 +100,22 @@ async def image_to_image(
     return request_models.ImageToImageResponse(image_b64=formatted_response.image_b64)
 
 
-@router.post("/inpaint")
+@router.post("/inpaint", responses=utils.IMAGE_RESPONSES)
 async def inpaint(
     body: request_models.InpaintRequest,
+    request: fastapi.Request,
     _: None = fastapi.Depends(dependencies.get_token),
 ) -> request_models.InpaintResponse:
+    return await utils.negotiate_image_response(request, await _inpaint(body))
+
+
+async def _inpaint(body: request_models.InpaintRequest) -> Union[request_models.InpaintResponse, JSONResponse]:
     synapse = get_synapse.get_synapse_from_body(
         body=body,
         synapse_model=synapses.Inpaint,
     )
 
-    result = await core_validator.make_organic_query(
+    result = await get_core().make_organic_query(
         synapse=synapse, outgoing_model=base_models.InpaintOutgoing, task=Task("inpaint"), stream=False
     )
     if isinstance(result, JSONResponse):
@@ -88,17 +129,22 @@ async def inpaint(
     return request_models.InpaintResponse(image_b64=formatted_response.image_b64)
 
 
-@router.post("/avatar")
+@router.post("/avatar", responses=utils.IMAGE_RESPONSES)
 async def avatar(
     body: request_models.AvatarRequest,
+    request: fastapi.Request,
     _: None = fastapi.Depends(dependencies.get_token),
 ) -> request_models.AvatarResponse:
+    return await utils.negotiate_image_response(request, await _avatar(body))
+
+
+async def _avatar(body: request_models.AvatarRequest) -> Union[request_models.AvatarResponse, JSONResponse]:
     synapse = get_synapse.get_synapse_from_body(
         body=body,
         synapse_model=synapses.Avatar,
     )
 
-    result = await core_validator.make_organic_query(
+    result = await get_core().make_organic_query(
         synapse=synapse, outgoing_model=base_models.AvatarOutgoing, task=Task("avatar"), stream=False
     )
     if isinstance(result, JSONResponse):
@@ -112,6 +158,47 @@ async def avatar(
     return request_models.AvatarResponse(image_b64=formatted_response.image_b64)
 
 
+##### Multipart uploads
+# The same as the endpoints above, but with the images uploaded as raw files in a multipart/form-data body,
+# rather than base64 in json. `text_prompts` is a json string field, everything else a plain field
+
+
+@router.post("/image-to-image-upload", responses=utils.IMAGE_RESPONSES)
+async def image_to_image_upload(
+    request: fastapi.Request,
+    _: None = fastapi.Depends(dependencies.get_token),
+) -> request_models.ImageToImageResponse:
+    body = await multipart.read_upload(
+        request, request_models.ImageToImageRequest, ["init_image"], request.app.state.max_upload_image_bytes
+    )
+    return await utils.negotiate_image_response(request, await _image_to_image(body))
+
+
+@router.post("/inpaint-upload", responses=utils.IMAGE_RESPONSES)
+async def inpaint_upload(
+    request: fastapi.Request,
+    _: None = fastapi.Depends(dependencies.get_token),
+) -> request_models.InpaintResponse:
+    body = await multipart.read_upload(
+        request,
+        request_models.InpaintRequest,
+        ["init_image", "mask_image"],
+        request.app.state.max_upload_image_bytes,
+    )
+    return await utils.negotiate_image_response(request, await _inpaint(body))
+
+
+@router.post("/avatar-upload", responses=utils.IMAGE_RESPONSES)
+async def avatar_upload(
+    request: fastapi.Request,
+    _: None = fastapi.Depends(dependencies.get_token),
+) -> request_models.AvatarResponse:
+    body = await multipart.read_upload(
+        request, request_models.AvatarRequest, ["init_image"], request.app.state.max_upload_image_bytes
+    )
+    return await utils.negotiate_image_response(request, await _avatar(body))
+
+
 # @router.post("/upscale")
 # async def upscale(
 #     body: request_models.UpscaleRequest,
@@ -122,7 +209,7 @@ async def avatar(
 #         synapse_model=synapses.Upscale,
 #     )
 
-#     result = await core_validator.make_organic_query(
+#     result = await get_core().make_organic_query(
 #         synapse=synapse, outgoing_model=base_models.UpscaleOutgoing, task=Task("upscale"), stream=False
 #     )
 #     if isinstance(result, JSONResponse):
@@ -141,13 +228,21 @@ async def clip_embeddings(
     body: request_models.ClipEmbeddingsRequest,
     _: None = fastapi.Depends(dependencies.get_token),
 ) -> request_models.ClipEmbeddingsResponse:
+    # Keyed on the images as they were sent, before they're altered for the miners
+    image_keys, clip_embeddings = embedding_cache.lookup(body.image_b64s or [])
+    uncached_indexes = [i for i, clip_embedding in enumerate(clip_embeddings) if clip_embedding is None]
+    if not uncached_indexes:
+        return request_models.ClipEmbeddingsResponse(clip_embeddings=clip_embeddings)
+
+    # Only the images we don't have go to a miner
+    body.image_b64s = [body.image_b64s[i] for i in uncached_indexes]
     altered_clip_body = validation_utils.alter_clip_body(body)
     synapse = get_synapse.get_synapse_from_body(
         body=altered_clip_body,
         synapse_model=synapses.ClipEmbeddings,
     )
 
-    result = await core_validator.make_organic_query(
+    result = await get_core().make_organic_query(
         synapse=synapse,
         outgoing_model=base_models.ClipEmbeddingsOutgoing,
         task=Task("clip-image-embeddings"),
@@ -163,6 +258,14 @@ async def clip_embeddings(
 
     formatted_response: base_models.ClipEmbeddingsOutgoing = result.formatted_response
 
-    return request_models.ClipEmbeddingsResponse(
-        clip_embeddings=formatted_response.clip_embeddings,
-    )
+    new_clip_embeddings = formatted_response.clip_embeddings
+    if new_clip_embeddings is None or len(new_clip_embeddings) != len(uncached_indexes):
+        raise HTTPException(
+            status_code=fastapi.status.HTTP_400_BAD_REQUEST,
+            detail="I'm sorry, no valid response was possible from the miners :/",
+        )
+    for i, clip_embedding in zip(uncached_indexes, new_clip_embeddings):
+        clip_embeddings[i] = clip_embedding
+        embedding_cache.put(image_keys[i], clip_embedding)
+
+    return request_models.ClipEmbeddingsResponse(clip_embeddings=clip_embeddings)
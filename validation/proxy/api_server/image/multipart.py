@@ -0,0 +1,171 @@
+"""
+A small streaming multipart/form-data reader, for the image upload endpoints.
+
+Starlette's form parsing needs python-multipart, and only checks sizes once a whole file has been spooled.
+This reads the body as it arrives, so an upload over its limit is turned away as soon as it goes over,
+and only ever holds the raw bytes of each part - never the whole body, or base64 of it, on top.
+"""
+
+import asyncio
+import base64
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Type
+
+import fastapi
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+
+MAX_PART_HEADERS_BYTES = 16 * 1024
+MAX_FIELD_BYTES = 64 * 1024
+MAX_PARTS = 32
+
+
+class UploadTooLargeException(HTTPException):
+    def __init__(self, detail: str):
+        super().__init__(status_code=fastapi.status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
+
+
+def _bad_request(detail: str) -> HTTPException:
+    return HTTPException(status_code=fastapi.status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+def get_boundary(content_type: Optional[str]) -> bytes:
+    media_type, *params = [part.strip() for part in (content_type or "").split(";")]
+    if media_type.lower() != "multipart/form-data":
+        raise HTTPException(
+            status_code=fastapi.status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Expected multipart/form-data"
+        )
+    for param in params:
+        key, _, value = param.partition("=")
+        if key.strip().lower() == "boundary" and value:
+            return value.strip().strip('"').encode()
+    raise _bad_request("No boundary in the multipart content type")
+
+
+def _parse_part_headers(raw_headers: bytes) -> Tuple[str, Optional[str]]:
+    """The form field name, and the file name if it's a file"""
+    for line in raw_headers.decode("latin-1").split("\r\n"):
+        header_name, _, value = line.partition(":")
+        if header_name.strip().lower() != "content-disposition":
+            continue
+        params: Dict[str, str] = {}
+        for param in value.split(";")[1:]:
+            key, _, param_value = param.strip().partition("=")
+            params[key.lower()] = param_value.strip('"')
+        if "name" in params:
+            return params["name"], params.get("filename")
+    raise _bad_request("A multipart part has no name")
+
+
+class _Buffer:
+    """Bytes read from the body but not used yet"""
+
+    def __init__(self, chunks: AsyncIterator[bytes]) -> None:
+        self._chunks = chunks
+        self.data = bytearray()
+        self.finished = False
+
+    async def read_more(self) -> None:
+        try:
+            self.data += await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self.finished = True
+
+    def take(self, size: int) -> bytes:
+        taken = bytes(self.data[:size])
+        del self.data[:size]
+        return taken
+
+
+async def read_multipart_form(
+    chunks: AsyncIterator[bytes],
+    boundary: bytes,
+    max_file_bytes: int,
+    max_field_bytes: int = MAX_FIELD_BYTES,
+) -> Tuple[Dict[str, str], Dict[str, bytes]]:
+    """The text fields and the files in a multipart body, read as it streams in"""
+    fields: Dict[str, str] = {}
+    files: Dict[str, bytes] = {}
+    buffer = _Buffer(chunks)
+    delimiter = b"--" + boundary
+    part_end = b"\r\n" + delimiter
+
+    # Anything before the first delimiter is ignored
+    while (start := buffer.data.find(delimiter)) == -1:
+        if buffer.finished:
+            raise _bad_request("No multipart delimiter in the body")
+        del buffer.data[: max(len(buffer.data) - len(delimiter), 0)]
+        await buffer.read_more()
+    buffer.take(start + len(delimiter))
+
+    for part_number in range(MAX_PARTS + 1):
+        while len(buffer.data) < 2 and not buffer.finished:
+            await buffer.read_more()
+        if buffer.data.startswith(b"--"):
+            return fields, files
+        if part_number == MAX_PARTS:
+            break
+        if not buffer.data.startswith(b"\r\n"):
+            raise _bad_request("Malformed multipart body")
+        buffer.take(2)
+
+        while (headers_end := buffer.data.find(b"\r\n\r\n")) == -1:
+            if buffer.finished:
+                raise _bad_request("Multipart body ended in a part's headers")
+            if len(buffer.data) > MAX_PART_HEADERS_BYTES:
+                raise _bad_request("Multipart part headers too large")
+            await buffer.read_more()
+        name, filename = _parse_part_headers(buffer.take(headers_end))
+        buffer.take(4)
+
+        is_file = filename is not None
+        max_bytes = max_file_bytes if is_file else max_field_bytes
+        content = bytearray()
+        while (end := buffer.data.find(part_end)) == -1:
+            if buffer.finished:
+                raise _bad_request("Multipart body ended part way through a part")
+            # Keep enough back that a delimiter split across chunks is still found
+            safe_length = max(len(buffer.data) - len(part_end), 0)
+            content += buffer.take(safe_length)
+            if len(content) > max_bytes:
+                raise UploadTooLargeException(f"{name} is over the limit of {max_bytes} bytes")
+            await buffer.read_more()
+        content += buffer.take(end)
+        if len(content) > max_bytes:
+            raise UploadTooLargeException(f"{name} is over the limit of {max_bytes} bytes")
+        buffer.take(len(part_end))
+
+        if is_file:
+            files[name] = bytes(content)
+        else:
+            fields[name] = content.decode()
+
+    raise _bad_request(f"Too many multipart parts, the most is {MAX_PARTS}")
+
+
+async def read_upload(
+    request: fastapi.Request, model: Type[BaseModel], image_fields: List[str], max_image_bytes: int
+) -> BaseModel:
+    """
+    A request model from a multipart upload: the images as files, `text_prompts` as json, and everything else
+    as plain fields. Each image is base64 encoded once, in a thread, for the synapse
+    """
+    boundary = get_boundary(request.headers.get("content-type"))
+    fields, files = await read_multipart_form(request.stream(), boundary, max_image_bytes)
+
+    body: Dict[str, Any] = dict(fields)
+    if "text_prompts" in body:
+        try:
+            body["text_prompts"] = json.loads(body["text_prompts"])
+        except json.JSONDecodeError:
+            raise _bad_request("text_prompts should be a json list")
+
+    for name, image_bytes in files.items():
+        if name not in image_fields:
+            raise _bad_request(f"Unexpected file {name}, expected files are {image_fields}")
+        body[name] = (await asyncio.to_thread(base64.b64encode, image_bytes)).decode()
+
+    try:
+        return model(**body)
+    except ValidationError as e:
+        raise HTTPException(status_code=fastapi.status.HTTP_422_UNPROCESSABLE_ENTITY, detail=e.errors())
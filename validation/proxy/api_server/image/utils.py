@@ -1,9 +1,22 @@
+import asyncio
+import base64
+import io
+from typing import Any, Optional, Tuple
+
 import fastapi
+from PIL import Image
 from pydantic import BaseModel
 import bittensor as bt
 from fastapi import HTTPException
+from starlette.responses import Response
 from models import utility_models
 
+# Media types we'll send images back as, instead of base64 in json, when asked for with the Accept header
+IMAGE_MEDIA_TYPE_TO_FORMAT = {"image/jpeg": "JPEG", "image/png": "PNG", "image/webp": "WEBP"}
+JSON_MEDIA_TYPES = {"application/json", "*/*", "application/*"}
+# So the docs show the image types too
+IMAGE_RESPONSES = {200: {"content": {media_type: {} for media_type in IMAGE_MEDIA_TYPE_TO_FORMAT}}}
+
 
 class NSFWContentException(fastapi.HTTPException):
     def __init__(self, detail: str = "NSFW content detected"):
@@ -20,3 +33,62 @@ def do_formatted_response_image_checks(formatted_response: BaseModel, result: ut
         # return a 500 internal server error and intenrally log it
         bt.logging.error(f"Received a None result for some reason; Result error message: {result.error_message}")
         raise HTTPException(status_code=500, detail=result.error_message)
+
+
+def requested_image_media_type(accept: Optional[str]) -> Optional[str]:
+    """The image type the client would most like back, or None if json is at least as good for them"""
+    if not accept:
+        return None
+    preferences = []
+    for position, media_range in enumerate(accept.split(",")):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        preferences.append((-quality, position, media_type.lower()))
+
+    for negative_quality, _, media_type in sorted(preferences):
+        if negative_quality == 0:
+            return None
+        if media_type in IMAGE_MEDIA_TYPE_TO_FORMAT:
+            return media_type
+        if media_type in JSON_MEDIA_TYPES:
+            return None
+    return None
+
+
+def _to_image_bytes(image_b64: str, media_type: str) -> Tuple[bytes, int, int]:
+    image_bytes = base64.b64decode(image_b64)
+    image = Image.open(io.BytesIO(image_bytes))
+    image_format = IMAGE_MEDIA_TYPE_TO_FORMAT[media_type]
+    width, height = image.size
+    # Already what they want, so send it as it is
+    if image.format == image_format:
+        return image_bytes, width, height
+
+    if image_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    output = io.BytesIO()
+    image.save(output, format=image_format)
+    return output.getvalue(), width, height
+
+
+async def negotiate_image_response(request: fastapi.Request, response: Any) -> Any:
+    """
+    The raw image bytes, if the client asked for an image type with the Accept header - otherwise the response
+    as it is. Decoding (and re-encoding, if the miner's image is a different type) is done in a thread.
+    """
+    media_type = requested_image_media_type(request.headers.get("accept"))
+    if media_type is None or getattr(response, "image_b64", None) is None:
+        return response
+
+    image_bytes, width, height = await asyncio.to_thread(_to_image_bytes, response.image_b64, media_type)
+    return Response(
+        content=image_bytes,
+        media_type=media_type,
+        headers={"X-Image-Width": str(width), "X-Image-Height": str(height)},
+    )
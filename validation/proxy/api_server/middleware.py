@@ -0,0 +1,147 @@
+import math
+import time
+from typing import Optional
+
+from starlette import status
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from validation.proxy import sql
+from validation.proxy.api_key_cache import ApiKeyCache, api_key_cache
+from validation.proxy.billing_ledger import BillingLedger, billing_ledger
+from validation.proxy.rate_limiter import SlidingWindowRateLimiter, rate_limiter
+
+UNAUTHENTICATED_PATHS = {"/docs", "/openapi.json", "/favicon.ico", "/redoc", "/health", "/capabilities"}
+
+ENDPOINT_TO_CREDITS_USED = {
+    "clip-embeddings": 0.2,
+    "text-to-image": 1,
+    "image-to-image": 1,
+    "inpaint": 1,
+    "scribble": 1,
+    "upscale": 1,
+    # Per image that worked
+    "text-to-image-batch": 1,
+    "image-to-image-batch": 1,
+    "image-to-image-upload": 1,
+    "inpaint-upload": 1,
+    # Needs a key, but it's free
+    "stats": 0,
+}
+
+# Set in the request state by an endpoint that bills per item, rather than once per request
+BILLED_ITEMS_STATE_KEY = "billed_items"
+# Set in the request state for the endpoint: a function that checks the credits and rate limit for all of a
+# request's items, not just the one it was let in for, and gives the response to send if they're not there
+ADMIT_ITEMS_STATE_KEY = "admit_items"
+
+
+def _get_api_key(headers: Headers) -> Optional[str]:
+    auth_header = headers.get("Authorization")
+    if not auth_header:
+        return None
+    if auth_header.startswith("Bearer "):
+        return auth_header.split(" ")[1]
+    else:
+        return auth_header
+
+
+def _has_credits(api_key_info: dict, credits_required: float) -> bool:
+    return api_key_info[sql.BALANCE] is None or api_key_info[sql.BALANCE] > credits_required
+
+
+def _insufficient_credits() -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS, content={"detail": "Insufficient credits - sorry!"}
+    )
+
+
+def _rate_limit_exceeded() -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS, content={"detail": "Rate limit exceeded - sorry!"}
+    )
+
+
+class ApiKeyMiddleware:
+    """
+    Checks the API key, its credits and its rate limit, then bills the request once it has succeeded.
+
+    Plain ASGI rather than `@app.middleware("http")`: the response's messages are passed straight through to
+    the server, so a streamed response isn't copied chunk by chunk through an extra task and memory stream.
+    The bill goes in when the final body message has been sent.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        cache: ApiKeyCache = api_key_cache,
+        ledger: BillingLedger = billing_ledger,
+        limiter: SlidingWindowRateLimiter = rate_limiter,
+        rate_limit_share: float = 1.0,
+    ) -> None:
+        self.app = app
+        self.cache = cache
+        self.ledger = ledger
+        self.limiter = limiter
+        # With several API workers, each counts its own requests, so gets its share of every key's limit
+        self.rate_limit_share = rate_limit_share
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in UNAUTHENTICATED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        api_key = _get_api_key(Headers(scope=scope))
+        if not api_key:
+            response = JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"detail": "API key is missing"})
+            await response(scope, receive, send)
+            return
+
+        api_key_info = await self.cache.get(api_key)
+        if api_key_info is None:
+            response = JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"detail": "Invalid API key"})
+            await response(scope, receive, send)
+            return
+
+        path = scope["path"]
+        credits_required = ENDPOINT_TO_CREDITS_USED.get(path.split("/")[-1], 1)
+
+        if not _has_credits(api_key_info, credits_required):
+            await _insufficient_credits()(scope, receive, send)
+            return
+
+        rate_limit = api_key_info[sql.RATE_LIMIT_PER_MINUTE]
+        if rate_limit is not None and self.rate_limit_share < 1:
+            rate_limit = max(math.ceil(rate_limit * self.rate_limit_share), 1)
+        if not self.limiter.allow(api_key_info[sql.KEY], rate_limit):
+            await _rate_limit_exceeded()(scope, receive, send)
+            return
+
+        def admit_items(items: int) -> Optional[JSONResponse]:
+            # The request itself has been checked and counted as the first item
+            if not _has_credits(api_key_info, credits_required * items):
+                return _insufficient_credits()
+            if items > 1 and not self.limiter.allow(api_key_info[sql.KEY], rate_limit, count=items - 1):
+                return _rate_limit_exceeded()
+            return None
+
+        scope.setdefault("state", {})[ADMIT_ITEMS_STATE_KEY] = admit_items
+
+        start_time = time.time()
+        status_code: Optional[int] = None
+
+        async def send_and_bill(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+            if (
+                message["type"] == "http.response.body"
+                and not message.get("more_body", False)
+                and status_code == status.HTTP_200_OK
+            ):
+                billed_items = scope.get("state", {}).get(BILLED_ITEMS_STATE_KEY, 1)
+                self.ledger.debit(api_key_info, path, credits_required * billed_items, time.time() - start_time)
+
+        await self.app(scope, receive, send_and_bill)
@@ -0,0 +1,38 @@
+from typing import Any, Dict
+
+import fastapi
+from fastapi import routing
+
+from config.validator_config import config as validator_config
+from validation.proxy import dependencies
+from validation.proxy.core_ipc import get_core
+
+router = routing.APIRouter(tags=["status"])
+
+
+@router.get("/health")
+async def health() -> Dict[str, Any]:
+    """Answered by this process alone, so it still works while the core is restarting"""
+    return {"status": "ok", "role": validator_config.api_role, "core_available": get_core().is_available()}
+
+
+# The rest of the core's capabilities - its uid, the miners' circuit breakers, the db - need a key, from /stats
+PUBLIC_CAPABILITIES = ("tasks", "updated_seconds_ago")
+
+
+@router.get("/capabilities")
+async def capabilities() -> Dict[str, Any]:
+    """The tasks organic queries can be made for. From a worker, it's the last copy it got from the core"""
+    core = get_core()
+    core_capabilities = core.capabilities()
+    return {
+        **{key: core_capabilities[key] for key in PUBLIC_CAPABILITIES if key in core_capabilities},
+        "core_available": core.is_available(),
+    }
+
+
+@router.get("/stats")
+async def stats(_: None = fastapi.Depends(dependencies.get_token)) -> Dict[str, Any]:
+    """Everything the core reports about itself, including how the miners and the db are doing"""
+    core = get_core()
+    return {**core.capabilities(), "core_available": core.is_available()}
@@ -0,0 +1,162 @@
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiosqlite
+import bittensor as bt
+
+from validation.db.db_management import db_manager
+from validation.proxy import sql
+from validation.proxy.api_key_cache import ApiKeyCache, api_key_cache
+
+BILLING_FLUSH_INTERVAL_SECONDS = 1.0
+BILLING_FLUSH_MAX_LOGS = 500
+# A batch that fails this many flushes in a row is dropped, rather than holding up every bill after it
+BILLING_FLUSH_MAX_ATTEMPTS = 3
+HOURLY_BUCKET_FORMAT = "%Y-%m-%d %H:00:00"
+DAILY_BUCKET_FORMAT = "%Y-%m-%d 00:00:00"
+
+
+def _rollup(logs: List[Tuple[Any, ...]], bucket_format: str) -> List[Tuple[Any, ...]]:
+    """Request count, credits used, total and max latency per key, endpoint and time bucket"""
+    rollups: Dict[Tuple[str, str, str], List[Any]] = {}
+    for api_key, path, _, created_at, cost, latency in logs:
+        rollup = rollups.setdefault((api_key, path, created_at.strftime(bucket_format)), [0, 0.0, 0.0, None])
+        rollup[0] += 1
+        rollup[1] += cost
+        if latency is not None:
+            rollup[2] += latency
+            rollup[3] = latency if rollup[3] is None else max(rollup[3], latency)
+    return [(*bucket, *rollup, bucket[0]) for bucket, rollup in rollups.items()]
+
+
+class BillingLedger:
+    """
+    Bills requests in memory, and writes the bills out in batches.
+
+    A debit comes straight off the cached balance, so the next credit check sees it, and is added to the
+    key's running delta. Every `flush_interval_seconds` (or `max_logs` requests), the deltas are applied
+    with one UPDATE per key, the log rows inserted, and the hourly and daily rollups updated, all in one
+    transaction.
+
+    If the process dies, the bills since the last flush are lost - at most `flush_interval_seconds` of
+    requests go unbilled. We undercharge, never double charge. Shutdown flushes everything. Likewise a batch
+    that can't be written `max_flush_attempts` times in a row is dropped. Bills for keys that have since
+    been deleted are dropped when they're flushed.
+    """
+
+    def __init__(
+        self,
+        cache: ApiKeyCache,
+        flush_interval_seconds: float = BILLING_FLUSH_INTERVAL_SECONDS,
+        max_logs: int = BILLING_FLUSH_MAX_LOGS,
+        max_flush_attempts: int = BILLING_FLUSH_MAX_ATTEMPTS,
+    ) -> None:
+        self.cache = cache
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_logs = max_logs
+        self.max_flush_attempts = max_flush_attempts
+
+        self._balance_deltas: Dict[str, float] = defaultdict(float)
+        self._in_flight_deltas: Dict[str, float] = {}
+        self._logs: List[Tuple[Any, ...]] = []
+
+        self._flush_lock = asyncio.Lock()
+        self._timer_task: Optional[asyncio.Task] = None
+        self._size_triggered_flush: Optional[asyncio.Task] = None
+        self._failed_flushes_in_a_row = 0
+
+        self.requests_billed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.bills_dropped = 0
+
+        # So reloading the cache doesn't forget debits that aren't in the db yet
+        self.cache.pending_debits = self.pending_debit
+
+    def start(self) -> None:
+        if self._timer_task is None:
+            self._timer_task = asyncio.create_task(self._flush_periodically())
+
+    def debit(self, api_key_info: Dict[str, Any], path: str, cost: float, latency: Optional[float] = None) -> None:
+        api_key = api_key_info[sql.KEY]
+        # Logged with the balance from before this request, as it always has been
+        self._logs.append((api_key, path, api_key_info[sql.BALANCE], datetime.now(), cost, latency))
+        self._balance_deltas[api_key] += cost
+        self.cache.adjust_balance(api_key, -cost)
+        self.requests_billed += 1
+
+        if len(self._logs) >= self.max_logs and (
+            self._size_triggered_flush is None or self._size_triggered_flush.done()
+        ):
+            self._size_triggered_flush = asyncio.create_task(self.flush())
+
+    def pending_debit(self, api_key: str) -> float:
+        return self._balance_deltas.get(api_key, 0) + self._in_flight_deltas.get(api_key, 0)
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._logs:
+                return
+            logs, self._logs = self._logs, []
+            self._in_flight_deltas, self._balance_deltas = self._balance_deltas, defaultdict(float)
+            balance_deltas = [(cost, api_key) for api_key, cost in self._in_flight_deltas.items()]
+
+            hourly_rollups = _rollup(logs, HOURLY_BUCKET_FORMAT)
+            daily_rollups = _rollup(logs, DAILY_BUCKET_FORMAT)
+
+            async def _write(conn: aiosqlite.Connection) -> None:
+                await conn.executemany(sql.debit_api_key_balance(), balance_deltas)
+                await conn.executemany(sql.insert_log(), [(*log, log[0]) for log in logs])
+                await conn.executemany(sql.upsert_log_rollup(sql.LOG_ROLLUPS_HOURLY_TABLE), hourly_rollups)
+                await conn.executemany(sql.upsert_log_rollup(sql.LOG_ROLLUPS_DAILY_TABLE), daily_rollups)
+
+            start_time = time.time()
+            try:
+                await db_manager.storage.write(_write)
+            except Exception as e:
+                self.failed_flushes += 1
+                self._failed_flushes_in_a_row += 1
+                if self._failed_flushes_in_a_row >= self.max_flush_attempts:
+                    self._failed_flushes_in_a_row = 0
+                    self.bills_dropped += len(logs)
+                    bt.logging.error(
+                        f"Dropping {len(logs)} bills after {self.max_flush_attempts} failed flushes: {repr(e)}"
+                    )
+                else:
+                    self._logs = logs + self._logs
+                    for api_key, cost in self._in_flight_deltas.items():
+                        self._balance_deltas[api_key] += cost
+                    bt.logging.error(f"Failed to flush {len(logs)} bills: {repr(e)}")
+                return
+            finally:
+                self._in_flight_deltas = {}
+            self._failed_flushes_in_a_row = 0
+
+            self.flushes += 1
+            bt.logging.debug(f"Flushed {len(logs)} bills in {(time.time() - start_time) * 1000:.1f}ms")
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval_seconds)
+            await self.flush()
+
+    async def stop(self) -> None:
+        if self._timer_task is not None:
+            self._timer_task.cancel()
+            self._timer_task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests_billed": self.requests_billed,
+            "logs_waiting": len(self._logs),
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "bills_dropped": self.bills_dropped,
+        }
+
+
+billing_ledger = BillingLedger(api_key_cache)
@@ -0,0 +1,379 @@
+"""
+Organic queries from the API worker processes to the core validator process, over a unix socket.
+
+Each frame is a 4 byte big endian length followed by that many bytes of compact json. A worker keeps one
+connection open and multiplexes its requests over it by id. A streamed query comes back as `chunk` frames
+and an `end`, or an `error_response` if the core fails part way; everything else gets a single reply frame.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import struct
+import time
+from typing import Any, AsyncGenerator, Dict, Optional, Set, Union
+
+import bittensor as bt
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from core import Task, constants as core_cst, utils as core_utils
+from models import base_models, synapses, utility_models
+
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+CAPABILITIES_POLL_INTERVAL_SECONDS = 5.0
+CAPABILITIES_TIMEOUT_SECONDS = 5.0
+
+OP_QUERY = "query"
+OP_CANCEL = "cancel"
+OP_CAPABILITIES = "capabilities"
+OP_RESULT = "result"
+OP_ERROR_RESPONSE = "error_response"
+OP_CHUNK = "chunk"
+OP_END = "end"
+OP_DISCONNECTED = "disconnected"
+
+
+class CoreStreamError(Exception):
+    """The core failed, or went away, part way through a stream"""
+
+
+async def write_frame(writer: asyncio.StreamWriter, message: Dict[str, Any]) -> None:
+    payload = json.dumps(message, separators=(",", ":")).encode()
+    writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+    await writer.drain()
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+    """The next frame, or None once the other end has gone"""
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+        (length,) = FRAME_HEADER.unpack(header)
+        if length > MAX_FRAME_SIZE:
+            raise ValueError(f"Frame of {length} bytes is over the limit of {MAX_FRAME_SIZE}")
+        return json.loads(await reader.readexactly(length))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+def _synapse_fields(synapse: bt.Synapse) -> Dict[str, Any]:
+    """Just the fields from the request body - the bittensor ones are filled in by the dendrite"""
+    own_fields = set(type(synapse).__fields__) - set(bt.Synapse.__fields__)
+    return json.loads(synapse.json(include=own_fields))
+
+
+##### Core side
+
+
+class CoreIpcServer:
+    """Serves organic queries and capabilities to the API workers, from the core validator"""
+
+    def __init__(self, socket_path: str, core: Any) -> None:
+        self.socket_path = socket_path
+        self.core = core
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.StreamWriter] = set()
+
+    async def start(self) -> None:
+        # Left behind if the last core process died
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path)
+        bt.logging.info(f"Serving organic queries to the API workers on {self.socket_path}")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Closing the server doesn't close the connections the workers already have
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(writer)
+        write_lock = asyncio.Lock()
+        in_progress: Dict[int, asyncio.Task] = {}
+
+        async def send(message: Dict[str, Any]) -> None:
+            async with write_lock:
+                await write_frame(writer, message)
+
+        try:
+            while True:
+                try:
+                    frame = await read_frame(reader)
+                except ValueError as e:
+                    bt.logging.error(f"Bad frame from an API worker, dropping its connection: {repr(e)}")
+                    break
+                if frame is None:
+                    break
+                request_id = frame["id"]
+                if frame["op"] == OP_CANCEL:
+                    if request_id in in_progress:
+                        in_progress[request_id].cancel()
+                    continue
+                task = asyncio.create_task(self._handle_request(frame, send))
+                in_progress[request_id] = task
+                task.add_done_callback(lambda _, request_id=request_id: in_progress.pop(request_id, None))
+        finally:
+            for task in in_progress.values():
+                task.cancel()
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _handle_request(self, frame: Dict[str, Any], send) -> None:
+        request_id = frame["id"]
+        try:
+            if frame["op"] == OP_CAPABILITIES:
+                await send({"id": request_id, "op": OP_CAPABILITIES, "capabilities": self.core.capabilities()})
+            elif frame["op"] == OP_QUERY:
+                await self._handle_query(frame, send)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            bt.logging.error(f"Failed to handle a request from an API worker: {repr(e)}")
+            await send(
+                {"id": request_id, "op": OP_ERROR_RESPONSE, "status_code": 500, "content": {"message": "Core error"}}
+            )
+
+    async def _handle_query(self, frame: Dict[str, Any], send) -> None:
+        request_id = frame["id"]
+        stream = frame["stream"]
+        synapse_fields = frame["synapse"]
+        # The workers don't know our uid for certain, so the seed is always ours to pick
+        synapse_fields["seed"] = core_utils.get_seed(core_cst.SEED_CHUNK_SIZE, self.core.validator_uid)
+        synapse = getattr(synapses, frame["synapse_model"])(**synapse_fields)
+
+        result = await self.core.make_organic_query(
+            task=Task(frame["task"]),
+            stream=stream,
+            outgoing_model=getattr(base_models, frame["outgoing_model"]),
+            synapse=synapse,
+        )
+
+        if isinstance(result, JSONResponse):
+            await send(
+                {
+                    "id": request_id,
+                    "op": OP_ERROR_RESPONSE,
+                    "status_code": result.status_code,
+                    "content": json.loads(result.body),
+                }
+            )
+        elif stream:
+            async for chunk in result:
+                await send({"id": request_id, "op": OP_CHUNK, "data": chunk})
+            await send({"id": request_id, "op": OP_END})
+        else:
+            query_result = json.loads(result.json()) if result is not None else None
+            await send({"id": request_id, "op": OP_RESULT, "result": query_result})
+
+
+##### Worker side
+
+
+class CoreIpcClient:
+    """
+    Stands in for the core validator in the API workers, passing organic queries on to the core process.
+
+    If the core is down - restarting, say - queries get a 503 straight away, and capabilities are served from
+    the last copy we got, marked as such. The connection is remade on the next query.
+    """
+
+    def __init__(
+        self, socket_path: str, capabilities_poll_interval_seconds: float = CAPABILITIES_POLL_INTERVAL_SECONDS
+    ) -> None:
+        self.socket_path = socket_path
+        self.capabilities_poll_interval_seconds = capabilities_poll_interval_seconds
+
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        self._request_ids = itertools.count()
+        self._pending: Dict[int, asyncio.Queue] = {}
+
+        self._capabilities: Dict[str, Any] = {}
+        self._capabilities_updated_at: Optional[float] = None
+        self._poll_task: Optional[asyncio.Task] = None
+
+    @property
+    def validator_uid(self) -> int:
+        # Only used for the seed, which the core replaces with its own
+        return self._capabilities.get("validator_uid") or 0
+
+    def start(self) -> None:
+        if self._poll_task is None:
+            self._poll_task = asyncio.create_task(self._poll_capabilities())
+
+    async def stop(self) -> None:
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+        if self._writer is not None:
+            self._writer.close()
+
+    def is_available(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    def capabilities(self) -> Dict[str, Any]:
+        updated_seconds_ago = (
+            time.monotonic() - self._capabilities_updated_at if self._capabilities_updated_at is not None else None
+        )
+        return {**self._capabilities, "updated_seconds_ago": updated_seconds_ago}
+
+    async def _poll_capabilities(self) -> None:
+        while True:
+            try:
+                request_id, responses = await self._send_request({"op": OP_CAPABILITIES})
+                try:
+                    frame = await asyncio.wait_for(responses.get(), CAPABILITIES_TIMEOUT_SECONDS)
+                finally:
+                    self._pending.pop(request_id, None)
+                if frame["op"] == OP_CAPABILITIES:
+                    self._capabilities = frame["capabilities"]
+                    self._capabilities_updated_at = time.monotonic()
+            except (OSError, asyncio.TimeoutError) as e:
+                bt.logging.debug(f"Couldn't get capabilities from the core: {repr(e)}")
+            await asyncio.sleep(self.capabilities_poll_interval_seconds)
+
+    async def _ensure_connected(self) -> None:
+        async with self._connect_lock:
+            if self.is_available():
+                return
+            self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+            self._read_task = asyncio.create_task(self._read_frames(self._reader))
+
+    async def _read_frames(self, reader: asyncio.StreamReader) -> None:
+        while True:
+            try:
+                frame = await read_frame(reader)
+            except ValueError as e:
+                # We can't tell where the next frame starts, so start over on a new connection
+                bt.logging.error(f"Bad frame from the core, reconnecting: {repr(e)}")
+                break
+            if frame is None:
+                break
+            responses = self._pending.get(frame["id"])
+            if responses is not None:
+                responses.put_nowait(frame)
+
+        if self._writer is not None:
+            self._writer.close()
+        for request_id, responses in self._pending.items():
+            responses.put_nowait({"id": request_id, "op": OP_DISCONNECTED})
+
+    async def _send_request(self, message: Dict[str, Any]):
+        await self._ensure_connected()
+        request_id = next(self._request_ids)
+        responses: asyncio.Queue = asyncio.Queue()
+        self._pending[request_id] = responses
+        try:
+            async with self._write_lock:
+                await write_frame(self._writer, {**message, "id": request_id})
+        except Exception:
+            self._pending.pop(request_id, None)
+            raise
+        return request_id, responses
+
+    async def _cancel(self, request_id: int) -> None:
+        try:
+            async with self._write_lock:
+                await write_frame(self._writer, {"id": request_id, "op": OP_CANCEL})
+        except (OSError, AttributeError):
+            pass
+
+    async def make_organic_query(
+        self, task: Task, stream: bool, outgoing_model: BaseModel, synapse: bt.Synapse
+    ) -> Union[JSONResponse, utility_models.QueryResult, AsyncGenerator, None]:
+        try:
+            request_id, responses = await self._send_request(
+                {
+                    "op": OP_QUERY,
+                    "task": task.value,
+                    "stream": stream,
+                    "synapse_model": type(synapse).__name__,
+                    "synapse": _synapse_fields(synapse),
+                    "outgoing_model": outgoing_model.__name__,
+                }
+            )
+        except OSError:
+            return _core_unavailable()
+
+        try:
+            frame = await responses.get()
+        except asyncio.CancelledError:
+            self._pending.pop(request_id, None)
+            await self._cancel(request_id)
+            raise
+
+        if frame["op"] != OP_CHUNK:
+            self._pending.pop(request_id, None)
+
+        if frame["op"] == OP_DISCONNECTED:
+            return _core_unavailable()
+        if frame["op"] == OP_ERROR_RESPONSE:
+            return JSONResponse(status_code=frame["status_code"], content=frame["content"])
+        if frame["op"] == OP_CHUNK:
+            return self._stream(request_id, responses, frame["data"])
+        if frame["op"] == OP_END:
+            return self._stream(request_id, responses, None)
+
+        if frame["result"] is None:
+            return None
+        query_result = utility_models.QueryResult(**frame["result"])
+        if query_result.formatted_response is not None:
+            query_result.formatted_response = outgoing_model.parse_obj(query_result.formatted_response)
+        return query_result
+
+    async def _stream(self, request_id: int, responses: asyncio.Queue, first_chunk: Optional[str]) -> AsyncGenerator:
+        finished = first_chunk is None
+        try:
+            if first_chunk is not None:
+                yield first_chunk
+            while not finished:
+                frame = await responses.get()
+                if frame["op"] == OP_CHUNK:
+                    yield frame["data"]
+                    continue
+                finished = True
+                if frame["op"] != OP_END:
+                    # Ending quietly would pass a truncated response off as the whole thing
+                    raise CoreStreamError(f"Stream from the core ended with {frame['op']}: {frame.get('content')}")
+        finally:
+            self._pending.pop(request_id, None)
+            if not finished:
+                # The client went away part way through, so the core can stop too
+                await self._cancel(request_id)
+
+
+def _core_unavailable() -> JSONResponse:
+    return JSONResponse(status_code=503, content={"message": "Core validator unavailable, one sec"})
+
+
+##### Which core this process queries
+
+_core: Optional[Any] = None
+
+
+def get_core() -> Any:
+    """
+    The core validator itself, or in an API worker, a client for the core process.
+
+    Imported lazily, as creating the core validator connects to the chain - the workers must never do that.
+    """
+    global _core
+    if _core is None:
+        from config.validator_config import config as validator_config
+
+        if validator_config.api_role == core_cst.API_ROLE_WORKER:
+            _core = CoreIpcClient(validator_config.core_socket_path)
+        else:
+            from validation.core_validator import core_validator
+
+            _core = core_validator
+    return _core
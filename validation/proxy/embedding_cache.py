@@ -0,0 +1,102 @@
+import array
+import base64
+import binascii
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import bittensor as bt
+import diskcache
+
+EMBEDDING_CACHE_MAX_ENTRIES = 5000
+EMBEDDING_DISK_CACHE_SIZE_LIMIT_BYTES = 1024**3
+
+
+def image_key(image_b64: str) -> str:
+    """sha256 of the decoded image, so the same image always has the same key however it was encoded"""
+    try:
+        image_bytes = base64.b64decode(image_b64)
+    except binascii.Error:
+        image_bytes = image_b64.encode()
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Clip embeddings by image, so an image we've embedded before isn't sent to a miner again.
+
+    An LRU of `max_entries` in memory, optionally backed by a diskcache on disk, which outlives restarts
+    and is shared by the API workers. Embeddings are held as arrays of doubles rather than lists of floats,
+    which is about a quarter of the memory, and gives back exactly what the miner sent.
+    """
+
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._embeddings: OrderedDict[str, array.array] = OrderedDict()
+        self._disk_cache: Optional[diskcache.Cache] = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def open_disk_tier(self, directory: str, size_limit_bytes: int = EMBEDDING_DISK_CACHE_SIZE_LIMIT_BYTES) -> None:
+        self._disk_cache = diskcache.Cache(directory, size_limit=size_limit_bytes)
+
+    def close(self) -> None:
+        if self._disk_cache is not None:
+            self._disk_cache.close()
+            self._disk_cache = None
+
+    def get(self, key: str) -> Optional[List[float]]:
+        embedding = self._embeddings.get(key)
+        if embedding is not None:
+            self._embeddings.move_to_end(key)
+            self.hits += 1
+            return embedding.tolist()
+
+        if self._disk_cache is not None:
+            try:
+                embedding_bytes = self._disk_cache.get(key)
+            except Exception as e:
+                bt.logging.warning(f"Couldn't read from the clip embedding disk cache: {repr(e)}")
+                embedding_bytes = None
+            if embedding_bytes is not None:
+                embedding = array.array("d")
+                embedding.frombytes(embedding_bytes)
+                self._remember(key, embedding)
+                self.disk_hits += 1
+                return embedding.tolist()
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, embedding: List[float]) -> None:
+        embedding_array = array.array("d", embedding)
+        self._remember(key, embedding_array)
+        if self._disk_cache is not None:
+            try:
+                self._disk_cache.set(key, embedding_array.tobytes())
+            except Exception as e:
+                bt.logging.warning(f"Couldn't write to the clip embedding disk cache: {repr(e)}")
+
+    def _remember(self, key: str, embedding: array.array) -> None:
+        self._embeddings[key] = embedding
+        self._embeddings.move_to_end(key)
+        while len(self._embeddings) > self.max_entries:
+            self._embeddings.popitem(last=False)
+
+    def lookup(self, image_b64s: List[str]) -> Tuple[List[str], List[Optional[List[float]]]]:
+        """The key for each image, and its embedding if we have it"""
+        keys = [image_key(image_b64) for image_b64 in image_b64s]
+        return keys, [self.get(key) for key in keys]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._embeddings),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,76 @@
+import time
+from typing import Dict, List, Optional
+
+import aiosqlite
+
+from validation.db.storage_engine import StorageEngine
+from validation.proxy import sql
+
+RATE_LIMIT_WINDOW_SECONDS = 60
+
+
+class _Window:
+    __slots__ = ("index", "count", "previous_count")
+
+    def __init__(self, index: int, count: int = 0, previous_count: int = 0) -> None:
+        self.index = index
+        self.count = count
+        self.previous_count = previous_count
+
+
+class SlidingWindowRateLimiter:
+    """
+    Per API key sliding window counter.
+
+    Requests are counted in fixed one minute windows. The number made in the last minute is estimated as
+    everything in the current window, plus the previous window's count scaled by how much of it is still
+    inside the last minute. Two counters per key, O(1) per check.
+    """
+
+    def __init__(self, window_seconds: int = RATE_LIMIT_WINDOW_SECONDS) -> None:
+        self.window_seconds = window_seconds
+        self._windows: Dict[str, _Window] = {}
+
+    def _current_window(self, api_key: str, now: float) -> _Window:
+        index = int(now // self.window_seconds)
+        window = self._windows.get(api_key)
+        if window is None:
+            window = self._windows[api_key] = _Window(index)
+        elif window.index != index:
+            window.previous_count = window.count if window.index == index - 1 else 0
+            window.count = 0
+            window.index = index
+        return window
+
+    def allow(self, api_key: str, limit_per_window: int, now: Optional[float] = None, count: int = 1) -> bool:
+        """Count `count` requests and return True, or return False if they would take the key over its limit"""
+        now = time.time() if now is None else now
+        window = self._current_window(api_key, now)
+        elapsed_fraction = (now % self.window_seconds) / self.window_seconds
+        estimated_count = window.previous_count * (1 - elapsed_fraction) + window.count
+        if estimated_count + count - 1 >= limit_per_window:
+            return False
+        window.count += count
+        return True
+
+    ##### Persistence, so a restart doesn't hand every key a fresh minute
+
+    async def save(self, storage: StorageEngine) -> None:
+        rows: List[tuple] = [
+            (api_key, window.index, window.count, window.previous_count) for api_key, window in self._windows.items()
+        ]
+
+        async def _save(conn: aiosqlite.Connection) -> None:
+            await conn.execute(sql.delete_rate_limit_windows())
+            await conn.executemany(sql.insert_rate_limit_window(), rows)
+
+        await storage.write(_save)
+
+    async def load(self, storage: StorageEngine) -> None:
+        rows = await storage.fetchall(sql.select_rate_limit_windows())
+        self._windows = {
+            api_key: _Window(index, count, previous_count) for api_key, index, count, previous_count in rows
+        }
+
+
+rate_limiter = SlidingWindowRateLimiter()
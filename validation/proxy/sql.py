@@ -1,7 +1,6 @@
 import aiosqlite
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, List, Any, Optional
-from validation.db.db_management import db_lock
 
 BALANCE = "balance"
 KEY = "key"
@@ -13,6 +12,15 @@ ENDPOINT = "endpoint"
 RATE_LIMIT_PER_MINUTE = "rate_limit_per_minute"
 API_KEYS_TABLE = "api_keys"
 LOGS_TABLE = "logs"
+RATE_LIMIT_WINDOWS_TABLE = "rate_limit_windows"
+LOG_ROLLUPS_HOURLY_TABLE = "log_rollups_hourly"
+LOG_ROLLUPS_DAILY_TABLE = "log_rollups_daily"
+LATENCY = "latency"
+BUCKET_START = "bucket_start"
+REQUEST_COUNT = "request_count"
+CREDITS_USED = "credits_used"
+TOTAL_LATENCY = "total_latency"
+MAX_LATENCY = "max_latency"
 CREATED_AT = "created_at"
 
 DATABASE_PATH = "vision_database.db"
@@ -24,73 +32,96 @@ async def get_db_connection():
     return conn
 
 
+def get_read_only_db_connection() -> aiosqlite.Connection:
+    """For reporting. Read only, so it never takes a write lock, and in WAL mode the validator's writes carry on"""
+    return aiosqlite.connect(f"file:{DATABASE_PATH}?mode=ro", uri=True)
+
+
 async def get_api_key_info(conn: aiosqlite.Connection, api_key: str) -> Optional[Dict[str, Any]]:
-    async with db_lock:
-        async with conn.execute(
-            f"SELECT {KEY}, {BALANCE}, {RATE_LIMIT_PER_MINUTE} FROM {API_KEYS_TABLE} WHERE {KEY} = ?", (api_key,)
-        ) as cursor:
-            row = await cursor.fetchone()
-            return (
-                {
-                    KEY: row[0],
-                    BALANCE: row[1],
-                    RATE_LIMIT_PER_MINUTE: row[2],
-                }
-                if row
-                else None
-            )
+    async with conn.execute(
+        f"SELECT {KEY}, {BALANCE}, {RATE_LIMIT_PER_MINUTE} FROM {API_KEYS_TABLE} WHERE {KEY} = ?", (api_key,)
+    ) as cursor:
+        row = await cursor.fetchone()
+        return (
+            {
+                KEY: row[0],
+                BALANCE: row[1],
+                RATE_LIMIT_PER_MINUTE: row[2],
+            }
+            if row
+            else None
+        )
 
 
 async def get_all_api_keys(conn: aiosqlite.Connection) -> List[Dict[str, Any]]:
-    async with db_lock:
-        async with conn.execute(f"SELECT {KEY}, {BALANCE}, {RATE_LIMIT_PER_MINUTE} FROM {API_KEYS_TABLE}") as cursor:
-            return [
-                {
-                    KEY: row[0],
-                    BALANCE: row[1],
-                    RATE_LIMIT_PER_MINUTE: row[2],
-                }
-                if row
-                else None
-                for row in await cursor.fetchall()
-            ]
+    async with conn.execute(f"SELECT {KEY}, {BALANCE}, {RATE_LIMIT_PER_MINUTE} FROM {API_KEYS_TABLE}") as cursor:
+        return [
+            {
+                KEY: row[0],
+                BALANCE: row[1],
+                RATE_LIMIT_PER_MINUTE: row[2],
+            }
+            if row
+            else None
+            for row in await cursor.fetchall()
+        ]
 
 
 async def get_all_logs_for_key(conn: aiosqlite.Connection, api_key: str) -> List[Dict[str, Any]]:
-    async with db_lock:
-        async with conn.execute(
-            f"SELECT {KEY}, {ENDPOINT}, {COST}, {BALANCE}, {CREATED_AT} FROM {LOGS_TABLE} WHERE {KEY} = ? ORDER BY {CREATED_AT} DESC LIMIT 100",
-            (api_key,),
-        ) as cursor:
-            rows = await cursor.fetchall()
-            return [
-                {
-                    KEY: row[0],
-                    ENDPOINT: row[1],
-                    COST: row[2],
-                    BALANCE: row[3],
-                    CREATED_AT: row[4],
-                }
-                for row in rows
-            ]
-
-
-async def get_all_logs(conn: aiosqlite.Connection) -> List[Dict[str, Any]]:
-    async with db_lock:
-        async with conn.execute(
-            f"SELECT {KEY}, {ENDPOINT}, {COST}, {BALANCE}, {CREATED_AT} FROM {LOGS_TABLE}"
-        ) as cursor:
-            rows = await cursor.fetchall()
-            return [
-                {
-                    KEY: row[0],
-                    ENDPOINT: row[1],
-                    COST: row[2],
-                    BALANCE: row[3],
-                    CREATED_AT: row[4],
-                }
-                for row in rows
-            ]
+    async with conn.execute(
+        f"SELECT {KEY}, {ENDPOINT}, {COST}, {BALANCE}, {CREATED_AT} FROM {LOGS_TABLE} "
+        f"WHERE {KEY} = ? ORDER BY {CREATED_AT} DESC LIMIT 100",
+        (api_key,),
+    ) as cursor:
+        rows = await cursor.fetchall()
+        return [
+            {
+                KEY: row[0],
+                ENDPOINT: row[1],
+                COST: row[2],
+                BALANCE: row[3],
+                CREATED_AT: row[4],
+            }
+            for row in rows
+        ]
+
+
+async def get_usage_by_key(conn: aiosqlite.Connection, since: Optional[str] = None) -> List[Dict[str, Any]]:
+    """From the daily rollups, so it's quick whatever the range, and still there after the raw logs expire"""
+    async with conn.execute(
+        f"""
+        SELECT {KEY}, SUM({REQUEST_COUNT}), SUM({CREDITS_USED}), SUM({TOTAL_LATENCY}), MAX({MAX_LATENCY})
+        FROM {LOG_ROLLUPS_DAILY_TABLE}
+        WHERE {BUCKET_START} >= ?
+        GROUP BY {KEY}
+        """,
+        (since or "",),
+    ) as cursor:
+        return [_usage_row(row) for row in await cursor.fetchall()]
+
+
+async def get_usage_by_endpoint(conn: aiosqlite.Connection, since: Optional[str] = None) -> List[Dict[str, Any]]:
+    async with conn.execute(
+        f"""
+        SELECT {ENDPOINT}, SUM({REQUEST_COUNT}), SUM({CREDITS_USED}), SUM({TOTAL_LATENCY}), MAX({MAX_LATENCY})
+        FROM {LOG_ROLLUPS_DAILY_TABLE}
+        WHERE {BUCKET_START} >= ?
+        GROUP BY {ENDPOINT}
+        """,
+        (since or "",),
+    ) as cursor:
+        return [_usage_row(row) for row in await cursor.fetchall()]
+
+
+def _usage_row(row: tuple) -> Dict[str, Any]:
+    name, request_count, credits_used, total_latency, max_latency = row
+    return {
+        "name": name,
+        REQUEST_COUNT: request_count,
+        CREDITS_USED: credits_used,
+        "average_latency": total_latency / request_count if request_count else None,
+        MAX_LATENCY: max_latency,
+    }
 
 
 async def add_api_key(
@@ -100,68 +131,85 @@ async def add_api_key(
     rate_limit_per_minute: int,
     name: str,
 ) -> None:
-    async with db_lock:
-        await conn.execute(
-            f"INSERT INTO {API_KEYS_TABLE} VALUES (?, ?, ?, ?, ?)",
-            (api_key, name, balance, rate_limit_per_minute, datetime.now()),
-        )
-        await conn.commit()
+    await conn.execute(
+        f"INSERT INTO {API_KEYS_TABLE} VALUES (?, ?, ?, ?, ?)",
+        (api_key, name, balance, rate_limit_per_minute, datetime.now()),
+    )
+    await conn.commit()
 
 
 async def update_api_key_balance(conn: aiosqlite.Connection, key: str, balance: float):
-    async with db_lock:
-        await conn.execute(f"UPDATE {API_KEYS_TABLE} SET {BALANCE} = ? WHERE {KEY} = ?", (balance, key))
-        await conn.commit()
+    await conn.execute(f"UPDATE {API_KEYS_TABLE} SET {BALANCE} = ? WHERE {KEY} = ?", (balance, key))
+    await conn.commit()
 
 
 async def update_api_key_rate_limit(conn: aiosqlite.Connection, key: str, rate: int):
-    async with db_lock:
-        await conn.execute(
-            f"UPDATE {API_KEYS_TABLE} SET {RATE_LIMIT_PER_MINUTE} = ? WHERE {KEY} = ?",
-            (rate, key),
-        )
-        await conn.commit()
+    await conn.execute(
+        f"UPDATE {API_KEYS_TABLE} SET {RATE_LIMIT_PER_MINUTE} = ? WHERE {KEY} = ?",
+        (rate, key),
+    )
+    await conn.commit()
 
 
 async def update_api_key_name(conn: aiosqlite.Connection, key: str, name: str):
-    async with db_lock:
-        await conn.execute(f"UPDATE {API_KEYS_TABLE} SET {NAME} = ? WHERE {KEY} = ?", (name, key))
-        await conn.commit()
+    await conn.execute(f"UPDATE {API_KEYS_TABLE} SET {NAME} = ? WHERE {KEY} = ?", (name, key))
+    await conn.commit()
 
 
 async def delete_api_key(conn: aiosqlite.Connection, api_key: str) -> None:
-    async with db_lock:
-        await conn.execute(f"DELETE FROM {API_KEYS_TABLE} WHERE {KEY} = ?", (api_key,))
-        await conn.commit()
+    await conn.execute(f"DELETE FROM {API_KEYS_TABLE} WHERE {KEY} = ?", (api_key,))
+    await conn.commit()
+
+
+# Billing is batched by the billing ledger, which runs these with executemany. A key can be deleted while it
+# still has bills waiting, so logs and rollups are only written for keys that still exist - the key goes
+# on the end of each row's params a second time, for the check
+
+
+def debit_api_key_balance() -> str:
+    return f"""
+    UPDATE {API_KEYS_TABLE} SET {BALANCE} = {BALANCE} - ? WHERE {KEY} = ?
+    """
+
+
+def insert_log() -> str:
+    return f"""
+    INSERT INTO {LOGS_TABLE} ({KEY}, {ENDPOINT}, {BALANCE}, {CREATED_AT}, {COST}, {LATENCY})
+    SELECT ?, ?, ?, ?, ?, ?
+    WHERE EXISTS (SELECT 1 FROM {API_KEYS_TABLE} WHERE {KEY} = ?)
+    """
+
+
+def upsert_log_rollup(table: str) -> str:
+    return f"""
+    INSERT INTO {table} (
+        {KEY}, {ENDPOINT}, {BUCKET_START}, {REQUEST_COUNT}, {CREDITS_USED}, {TOTAL_LATENCY}, {MAX_LATENCY}
+    )
+    SELECT ?, ?, ?, ?, ?, ?, ?
+    WHERE EXISTS (SELECT 1 FROM {API_KEYS_TABLE} WHERE {KEY} = ?)
+    ON CONFLICT ({KEY}, {ENDPOINT}, {BUCKET_START}) DO UPDATE SET
+        {REQUEST_COUNT} = {REQUEST_COUNT} + excluded.{REQUEST_COUNT},
+        {CREDITS_USED} = {CREDITS_USED} + excluded.{CREDITS_USED},
+        {TOTAL_LATENCY} = {TOTAL_LATENCY} + excluded.{TOTAL_LATENCY},
+        {MAX_LATENCY} = MAX(
+            COALESCE({MAX_LATENCY}, excluded.{MAX_LATENCY}), COALESCE(excluded.{MAX_LATENCY}, {MAX_LATENCY})
+        )
+    """
 
 
-async def update_requests_and_credits(conn: aiosqlite.Connection, api_key_info: Dict[str, Any], cost: float) -> None:
-    async with db_lock:
-        await conn.execute(
-            f"UPDATE api_keys SET {BALANCE} = {BALANCE} - ? WHERE {KEY} = ?",
-            (cost, api_key_info[KEY]),
-        )
-        await conn.commit()
+def insert_rate_limit_window() -> str:
+    return f"""
+    INSERT INTO {RATE_LIMIT_WINDOWS_TABLE} ({KEY}, window_index, count, previous_count) VALUES (?, ?, ?, ?)
+    """
 
 
-async def log_request(conn: aiosqlite.Connection, api_key_info: Dict[str, Any], path: str, cost: float) -> None:
-    async with db_lock:
-        balance = api_key_info[BALANCE]
-        await conn.execute(
-            f"INSERT INTO {LOGS_TABLE} ({KEY}, {ENDPOINT}, {BALANCE}, {CREATED_AT}, cost) VALUES (?, ?, ?, ?, ?)",
-            (api_key_info[KEY], path, balance, datetime.now(), cost),
-        )
-        await conn.commit()
-
-
-async def rate_limit_exceeded(conn: aiosqlite.Connection, api_key_info: Dict[str, Any]) -> bool:
-    async with db_lock:
-        one_minute_ago = datetime.now() - timedelta(minutes=1)
-        query = f"""
-            SELECT *
-            FROM {LOGS_TABLE}
-            WHERE {KEY} = ? AND {CREATED_AT} >= ?
-        """
-        async with conn.execute(query, (api_key_info[KEY], one_minute_ago.strftime("%Y-%m-%d %H:%M:%S"))) as cursor:
-            recent_logs = await cursor.fetchall()
-            return len(recent_logs) >= api_key_info[RATE_LIMIT_PER_MINUTE]
+def select_rate_limit_windows() -> str:
+    return f"""
+    SELECT {KEY}, window_index, count, previous_count FROM {RATE_LIMIT_WINDOWS_TABLE}
+    """
+
+
+def delete_rate_limit_windows() -> str:
+    return f"""
+    DELETE FROM {RATE_LIMIT_WINDOWS_TABLE}
+    """
@@ -0,0 +1,140 @@
+import collections
+import enum
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import bittensor as bt
+
+from core import Task
+from models import utility_models
+from validation.models import axon_uid
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_OPEN_SECONDS = 30.0
+MAX_OPEN_SECONDS = 60 * 10
+# A probe we never hear back about (e.g. a cancelled hedge) doesn't hold the breaker half open forever
+PROBE_TIMEOUT_SECONDS = 60.0
+
+# Timeouts, 'enhance your calm' and the miner's own errors. A failure with no status code at all is the
+# dendrite timing out or not reaching the miner - it only sets its own status code, not the axon's
+_BREAKING_STATUS_CODES = {408, 429}
+
+
+class BreakerState(str, enum.Enum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+def _is_breaking_failure(query_result: utility_models.QueryResult) -> bool:
+    status_code = query_result.status_code
+    return status_code is None or status_code in _BREAKING_STATUS_CODES or status_code >= 500
+
+
+class _Breaker:
+    __slots__ = ("state", "consecutive_failures", "times_opened", "opened_at", "probe_started_at")
+
+    def __init__(self) -> None:
+        self.state = BreakerState.closed
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self.opened_at = 0.0
+        self.probe_started_at: Optional[float] = None
+
+
+class CircuitBreaker:
+    """
+    A breaker per (task, uid), which stops traffic to a miner that keeps timing out, 429ing or 5xxing.
+
+    Closed, a miner takes traffic as normal. After `failure_threshold` such failures in a row it opens, and gets
+    no traffic for `open_seconds`, doubled each time it opens again without recovering, up to `MAX_OPEN_SECONDS`.
+    Then it's half open: a single probe request is let through, and the breaker closes if it works, or opens
+    again if not. Organic queries only go to closed miners; the synthetic queries are the probes.
+    """
+
+    def __init__(
+        self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, open_seconds: float = DEFAULT_OPEN_SECONDS
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._breakers: Dict[Tuple[Task, axon_uid], _Breaker] = {}
+        self.transitions: collections.Counter = collections.Counter()
+
+    def _breaker_for(self, task: Task, uid: axon_uid) -> _Breaker:
+        breaker = self._breakers.get((task, uid))
+        if breaker is None:
+            breaker = self._breakers[(task, uid)] = _Breaker()
+        return breaker
+
+    def _move(self, task: Task, uid: axon_uid, breaker: _Breaker, state: BreakerState, now: float) -> None:
+        self.transitions[f"{breaker.state.value}->{state.value}"] += 1
+        bt.logging.info(f"Circuit breaker for uid {uid} and task {task} is now {state.value}")
+        breaker.state = state
+        breaker.probe_started_at = None
+        if state == BreakerState.open:
+            breaker.opened_at = now
+            breaker.times_opened += 1
+        elif state == BreakerState.closed:
+            breaker.times_opened = 0
+            breaker.consecutive_failures = 0
+
+    def _open_duration(self, breaker: _Breaker) -> float:
+        return min(self.open_seconds * 2 ** max(breaker.times_opened - 1, 0), MAX_OPEN_SECONDS)
+
+    def forget(self, task: Task, uid: axon_uid) -> None:
+        self._breakers.pop((task, uid), None)
+
+    def state(self, task: Task, uid: axon_uid, now: Optional[float] = None) -> BreakerState:
+        now = time.time() if now is None else now
+        breaker = self._breakers.get((task, uid))
+        if breaker is None:
+            return BreakerState.closed
+        if breaker.state == BreakerState.open and now - breaker.opened_at >= self._open_duration(breaker):
+            self._move(task, uid, breaker, BreakerState.half_open, now)
+        return breaker.state
+
+    def closed_uids(self, task: Task, uids: List[axon_uid]) -> List[axon_uid]:
+        return [uid for uid in uids if self.state(task, uid) == BreakerState.closed]
+
+    def allow_request(self, task: Task, uid: axon_uid, now: Optional[float] = None) -> bool:
+        """Whether a request can go to the miner. If it's half open, this request is the probe"""
+        now = time.time() if now is None else now
+        state = self.state(task, uid, now)
+        if state == BreakerState.closed:
+            return True
+        if state == BreakerState.open:
+            return False
+        breaker = self._breakers[(task, uid)]
+        if breaker.probe_started_at is not None and now - breaker.probe_started_at < PROBE_TIMEOUT_SECONDS:
+            return False
+        breaker.probe_started_at = now
+        return True
+
+    def record(self, query_result: utility_models.QueryResult, now: Optional[float] = None) -> None:
+        if query_result.axon_uid is None:
+            return
+        now = time.time() if now is None else now
+        task, uid = query_result.task, query_result.axon_uid
+        breaker = self._breaker_for(task, uid)
+
+        if query_result.success:
+            breaker.consecutive_failures = 0
+            if breaker.state != BreakerState.closed:
+                self._move(task, uid, breaker, BreakerState.closed, now)
+        elif _is_breaking_failure(query_result):
+            breaker.consecutive_failures += 1
+            if breaker.state == BreakerState.half_open or (
+                breaker.state == BreakerState.closed and breaker.consecutive_failures >= self.failure_threshold
+            ):
+                self._move(task, uid, breaker, BreakerState.open, now)
+
+    def metrics(self) -> Dict[str, Any]:
+        """How many breakers are in each state, and how many times they've moved between them"""
+        states = collections.Counter(breaker.state.value for breaker in self._breakers.values())
+        return {
+            "states": {state.value: states.get(state.value, 0) for state in BreakerState},
+            "transitions": dict(self.transitions),
+        }
+
+
+circuit_breaker = CircuitBreaker()
@@ -28,6 +28,11 @@ OPERATION_TIMEOUTS: Dict[str, float] = {
     "Chat": 60,
 }
 
+MAX_ORGANIC_QUERY_ATTEMPTS = 3
+# All attempts at an organic query, each on a different miner, have to be done within this many of its
+# operation's timeout
+ORGANIC_QUERY_DEADLINE_TIMEOUTS = 1.5
+
 # FOR PHASE 1 - where synthetic only validators may have a distribution different to organic ones
 AVAILABLE_TASKS_MULTIPLIER = {
     0: 0,
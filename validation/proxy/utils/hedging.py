@@ -0,0 +1,101 @@
+import asyncio
+from typing import Any, Callable, Coroutine, List, Optional
+
+from core import Task
+from models import utility_models
+from validation.proxy.utils.miner_selection import MinerSelector, miner_selector
+
+DEFAULT_HEDGE_LATENCY_PERCENTILE = 0.95
+DEFAULT_HEDGE_BUDGET_SHARE = 0.05
+# Hedges that can be saved up while traffic is quiet, and spent in one go
+MAX_SAVED_HEDGES = 10.0
+
+Query = Coroutine[Any, Any, Optional[utility_models.QueryResult]]
+
+
+class HedgeBudget:
+    """
+    Caps hedges at a share of requests. Every request earns `share` of a hedge, up to `max_saved`,
+    and each hedge spends a whole one - so over any stretch, hedges are at most `share` extra requests,
+    plus the few saved beforehand.
+    """
+
+    def __init__(self, share: float = DEFAULT_HEDGE_BUDGET_SHARE, max_saved: float = MAX_SAVED_HEDGES) -> None:
+        self.share = share
+        self.max_saved = max_saved
+        self.saved = 0.0
+
+    def earn(self) -> None:
+        self.saved = min(self.saved + self.share, self.max_saved)
+
+    def try_spend(self) -> bool:
+        if self.saved < 1:
+            return False
+        self.saved -= 1
+        return True
+
+
+class Hedger:
+    """
+    Sends a slow non streaming organic query to a second miner as well.
+
+    If the first miner hasn't answered by the task's `latency_percentile` of recent latencies, the query goes
+    to another miner too, if the budget allows. Whichever succeeds first is used and the other is cancelled.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        latency_percentile: float = DEFAULT_HEDGE_LATENCY_PERCENTILE,
+        budget: Optional[HedgeBudget] = None,
+        selector: MinerSelector = miner_selector,
+    ) -> None:
+        self.enabled = enabled
+        self.latency_percentile = latency_percentile
+        self.budget = budget or HedgeBudget()
+        self.selector = selector
+
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    async def run(
+        self, task: Task, query: Query, query_another_miner: Callable[[], Optional[Query]]
+    ) -> Optional[utility_models.QueryResult]:
+        """
+        The result of `query`, hedged with `query_another_miner()` if it's slow - which gives None if there's no
+        other miner to ask. The first success is returned, otherwise the last failure
+        """
+        queries: List[asyncio.Task] = [asyncio.ensure_future(query)]
+        try:
+            hedge_delay = self._hedge_delay(task)
+            if hedge_delay is not None:
+                await asyncio.wait(queries, timeout=hedge_delay)
+                if not queries[0].done():
+                    hedge = query_another_miner()
+                    if hedge is not None and self.budget.try_spend():
+                        self.hedges_sent += 1
+                        queries.append(asyncio.ensure_future(hedge))
+                    elif hedge is not None:
+                        hedge.close()
+
+            query_result = None
+            for next_query in asyncio.as_completed(queries):
+                query_result = await next_query
+                if query_result is not None and query_result.success:
+                    break
+            if len(queries) > 1 and queries[1].done() and not queries[0].done():
+                self.hedges_won += 1
+            return query_result
+        finally:
+            for pending_query in queries:
+                pending_query.cancel()
+
+    def _hedge_delay(self, task: Task) -> Optional[float]:
+        """Seconds to wait for the first miner before hedging, or None not to hedge this query"""
+        if not self.enabled:
+            return None
+        self.budget.earn()
+        return self.selector.latency_percentile(task, self.latency_percentile)
+
+
+hedger = Hedger()
@@ -0,0 +1,137 @@
+import asyncio
+import collections
+import contextlib
+from typing import AsyncIterator, Deque, Dict, List, Tuple
+
+from core import Task
+from models import utility_models
+from validation.models import axon_uid
+
+# The miners' default for most tasks is one at a time, so start there, and learn if they can take more
+DEFAULT_INITIAL_LIMIT = 1.0
+MAX_LIMIT = 32.0
+# Synthetic queries wait this long at most for a free slot, then go anyway
+MAX_SLOT_WAIT_SECONDS = 60.0
+
+
+class _Slots:
+    __slots__ = ("in_flight", "limit", "waiters")
+
+    def __init__(self, limit: float) -> None:
+        self.in_flight = 0
+        self.limit = limit
+        # Resolved in order as slots come free, with the slot already taken for them
+        self.waiters: Deque[asyncio.Future] = collections.deque()
+
+    def is_full(self) -> bool:
+        return self.in_flight >= int(self.limit)
+
+
+class InFlightTracker:
+    """
+    How many queries we have open to each miner for each task, against how many it seems to handle at once.
+
+    Miners don't tell us their concurrency limits, so they're learned from query results, AIMD style: a 429
+    halves the limit, and a success while the miner was at its limit raises it by 1 / limit, so about one
+    more per limit's worth of successes. Organic queries prefer miners with a free slot, and synthetic queries
+    wait for one, first come first served, rather than overrunning the miner and getting 429s.
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = DEFAULT_INITIAL_LIMIT,
+        max_limit: float = MAX_LIMIT,
+        max_wait_seconds: float = MAX_SLOT_WAIT_SECONDS,
+    ) -> None:
+        self.initial_limit = initial_limit
+        self.max_limit = max_limit
+        self.max_wait_seconds = max_wait_seconds
+        self._slots: Dict[Tuple[Task, axon_uid], _Slots] = {}
+
+    def _slots_for(self, task: Task, uid: axon_uid) -> _Slots:
+        slots = self._slots.get((task, uid))
+        if slots is None:
+            slots = self._slots[(task, uid)] = _Slots(self.initial_limit)
+        return slots
+
+    def forget(self, task: Task, uid: axon_uid) -> None:
+        """Start learning the limit again. Queries still open are counted until they end"""
+        slots = self._slots.get((task, uid))
+        if slots is not None:
+            slots.limit = self.initial_limit
+
+    def has_free_slot(self, task: Task, uid: axon_uid) -> bool:
+        slots = self._slots.get((task, uid))
+        return slots is None or not slots.is_full()
+
+    def uids_with_free_slots(self, task: Task, uids: List[axon_uid]) -> List[axon_uid]:
+        return [uid for uid in uids if self.has_free_slot(task, uid)]
+
+    @contextlib.asynccontextmanager
+    async def slot(self, task: Task, uid: axon_uid, wait: bool) -> AsyncIterator[None]:
+        """
+        Counts a query to the miner while it's open. With `wait`, first waits up to `max_wait_seconds` for a free
+        slot, then goes anyway
+        """
+        slots = self._slots_for(task, uid)
+        if wait:
+            await self._claim(slots)
+        else:
+            slots.in_flight += 1
+        try:
+            yield
+        finally:
+            self._release(slots)
+
+    async def _claim(self, slots: _Slots) -> None:
+        if not slots.waiters and not slots.is_full():
+            slots.in_flight += 1
+            return
+        claimed = asyncio.get_running_loop().create_future()
+        slots.waiters.append(claimed)
+        try:
+            await asyncio.wait_for(claimed, timeout=self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            slots.in_flight += 1
+        except asyncio.CancelledError:
+            # The slot can have been handed over just as we were cancelled
+            if claimed.done() and not claimed.cancelled():
+                self._release(slots)
+            raise
+        finally:
+            if claimed in slots.waiters:
+                slots.waiters.remove(claimed)
+
+    def _release(self, slots: _Slots) -> None:
+        slots.in_flight -= 1
+        self._hand_over_free_slots(slots)
+
+    @staticmethod
+    def _hand_over_free_slots(slots: _Slots) -> None:
+        # Taken here, rather than by the waiter once it wakes, so no one can take a slot in between
+        while slots.waiters and not slots.is_full():
+            claimed = slots.waiters.popleft()
+            if not claimed.done():
+                slots.in_flight += 1
+                claimed.set_result(None)
+
+    def record(self, query_result: utility_models.QueryResult) -> None:
+        """Learn from a result, while its query is still counted as in flight"""
+        if query_result.axon_uid is None:
+            return
+        slots = self._slots_for(query_result.task, query_result.axon_uid)
+        if query_result.status_code == 429:
+            slots.limit = max(slots.limit / 2, 1.0)
+        elif query_result.success and slots.is_full():
+            slots.limit = min(slots.limit + 1 / slots.limit, self.max_limit)
+            self._hand_over_free_slots(slots)
+
+    def stats(self, task: Task) -> Dict[axon_uid, Dict[str, float]]:
+        return {
+            uid: {"in_flight": slots.in_flight, "limit": slots.limit, "waiting": len(slots.waiters)}
+            for (slots_task, uid), slots in self._slots.items()
+            if slots_task == task
+        }
+
+
+in_flight_tracker = InFlightTracker()
@@ -0,0 +1,125 @@
+import collections
+import math
+import random
+from typing import Any, Collection, Deque, Dict, Optional, Tuple
+
+from core import Task
+from models import utility_models
+from validation.models import axon_uid
+
+LATENCY_EWMA_ALPHA = 0.2
+SUCCESS_EWMA_ALPHA = 0.1
+DEFAULT_EXPLORATION_SHARE = 0.1
+# So a miner that's failed a lot is still comparable, rather than infinitely bad
+MIN_SUCCESS_RATE = 0.05
+# Recent successful latencies kept per task, across all its miners, for latency percentiles
+TASK_LATENCY_WINDOW = 1000
+MIN_LATENCIES_FOR_PERCENTILE = 20
+
+
+class _MinerStats:
+    __slots__ = ("latency", "success_rate", "observations")
+
+    def __init__(self) -> None:
+        self.latency: Optional[float] = None
+        self.success_rate = 1.0
+        self.observations = 0
+
+    def expected_cost(self) -> float:
+        """Roughly the seconds a request takes to succeed, counting the ones that have to be retried"""
+        if self.latency is None:
+            # Untried miners go first. One that's never succeeded only gets exploration traffic
+            return 0.0 if self.observations == 0 else math.inf
+        return self.latency / max(self.success_rate, MIN_SUCCESS_RATE)
+
+
+class MinerSelector:
+    """
+    Picks the miner for each organic query, favouring the fast and reliable ones.
+
+    Keeps an EWMA of latency and success rate per (task, uid), from every query result, synthetic or organic.
+    A pick is power of two choices: two miners at random, and the one with the lower latency / success rate wins.
+    That sends most traffic to the best miners without piling all of it onto one, and the slowest miners
+    rarely win. Miners we haven't heard from yet win every comparison until they've been tried, and a share of
+    picks is uniformly random, so every miner keeps getting some traffic and a miner that improves is noticed.
+    """
+
+    def __init__(
+        self,
+        exploration_share: float = DEFAULT_EXPLORATION_SHARE,
+        latency_alpha: float = LATENCY_EWMA_ALPHA,
+        success_alpha: float = SUCCESS_EWMA_ALPHA,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.exploration_share = exploration_share
+        self.latency_alpha = latency_alpha
+        self.success_alpha = success_alpha
+        self._rng = rng or random.Random()
+        self._stats: Dict[Tuple[Task, axon_uid], _MinerStats] = {}
+        self._task_latencies: Dict[Task, Deque[float]] = collections.defaultdict(
+            lambda: collections.deque(maxlen=TASK_LATENCY_WINDOW)
+        )
+
+    def _stats_for(self, task: Task, uid: axon_uid) -> _MinerStats:
+        stats = self._stats.get((task, uid))
+        if stats is None:
+            stats = self._stats[(task, uid)] = _MinerStats()
+        return stats
+
+    def forget(self, task: Task, uid: axon_uid) -> None:
+        self._stats.pop((task, uid), None)
+
+    def record(self, query_result: utility_models.QueryResult) -> None:
+        if query_result.axon_uid is None:
+            return
+        stats = self._stats_for(query_result.task, query_result.axon_uid)
+        stats.observations += 1
+        stats.success_rate += self.success_alpha * (float(query_result.success) - stats.success_rate)
+        if query_result.success and query_result.response_time is not None:
+            self._task_latencies[query_result.task].append(query_result.response_time)
+            if stats.latency is None:
+                stats.latency = query_result.response_time
+            else:
+                stats.latency += self.latency_alpha * (query_result.response_time - stats.latency)
+
+    def select(
+        self, task: Task, uids: Collection[axon_uid], exclude: Collection[axon_uid] = ()
+    ) -> Optional[axon_uid]:
+        candidates = [uid for uid in uids if uid not in exclude]
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        if self._rng.random() < self.exploration_share:
+            return self._rng.choice(candidates)
+
+        first, second = self._rng.sample(candidates, 2)
+        first_cost = self._cost(task, first)
+        second_cost = self._cost(task, second)
+        return first if first_cost <= second_cost else second
+
+    def _cost(self, task: Task, uid: axon_uid) -> float:
+        stats = self._stats.get((task, uid))
+        return 0.0 if stats is None else stats.expected_cost()
+
+    def latency_percentile(self, task: Task, percentile: float) -> Optional[float]:
+        """The latency `percentile` (0 to 1) of recent successes for the task, or None if there are too few yet"""
+        latencies = self._task_latencies.get(task)
+        if latencies is None or len(latencies) < MIN_LATENCIES_FOR_PERCENTILE:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(int(percentile * len(ordered)), len(ordered) - 1)]
+
+    def stats(self, task: Task) -> Dict[axon_uid, Dict[str, Any]]:
+        return {
+            uid: {
+                "latency": stats.latency,
+                "success_rate": stats.success_rate,
+                "observations": stats.observations,
+            }
+            for (stats_task, uid), stats in self._stats.items()
+            if stats_task == task
+        }
+
+
+miner_selector = MinerSelector()
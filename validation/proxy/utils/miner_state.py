@@ -0,0 +1,57 @@
+from typing import Dict, Optional, Tuple
+
+from core import Task
+from models import utility_models
+from validation.models import axon_uid
+from validation.proxy.utils.circuit_breaker import CircuitBreaker, circuit_breaker
+from validation.proxy.utils.in_flight import InFlightTracker, in_flight_tracker
+from validation.proxy.utils.miner_selection import MinerSelector, miner_selector
+
+
+class MinerStates:
+    """
+    Everything the proxy learns about each miner, per (task, uid): its latency and success rate for picking it,
+    its circuit breaker, and how many queries it can take at once.
+
+    Every query result goes to all of them from here. A uid that's changed hands is a different miner, so when
+    it's added with a new hotkey they all forget the old one, and any results from the old one still to come in
+    are ignored.
+    """
+
+    def __init__(
+        self,
+        selector: MinerSelector = miner_selector,
+        breaker: CircuitBreaker = circuit_breaker,
+        in_flight: InFlightTracker = in_flight_tracker,
+    ) -> None:
+        self.selector = selector
+        self.breaker = breaker
+        self.in_flight = in_flight
+        self._hotkeys: Dict[Tuple[Task, axon_uid], str] = {}
+
+    def add_uid(self, task: Task, uid: axon_uid, hotkey: Optional[str]) -> None:
+        if hotkey is None:
+            return
+        known_hotkey = self._hotkeys.get((task, uid))
+        if known_hotkey is not None and known_hotkey != hotkey:
+            self.selector.forget(task, uid)
+            self.breaker.forget(task, uid)
+            self.in_flight.forget(task, uid)
+        self._hotkeys[(task, uid)] = hotkey
+
+    def record(self, query_result: utility_models.QueryResult) -> None:
+        if query_result.axon_uid is None:
+            return
+        key = (query_result.task, query_result.axon_uid)
+        known_hotkey = self._hotkeys.get(key)
+        if known_hotkey is None and query_result.miner_hotkey is not None:
+            self._hotkeys[key] = query_result.miner_hotkey
+        elif query_result.miner_hotkey is not None and query_result.miner_hotkey != known_hotkey:
+            # A query to the uid's last miner that finished after it changed hands
+            return
+        self.selector.record(query_result)
+        self.breaker.record(query_result)
+        self.in_flight.record(query_result)
+
+
+miner_states = MinerStates()
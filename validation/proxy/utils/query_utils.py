@@ -6,6 +6,7 @@ from core import Task
 from models import base_models, utility_models
 import bittensor as bt
 from validation.proxy.utils import constants as cst
+from validation.proxy.utils.miner_state import miner_states
 from validation.models import UIDRecord, axon_uid
 from core import bittensor_overrides as bto
 from collections import OrderedDict
@@ -128,6 +129,26 @@ async def query_miner_stream(
     task: Task,
     dendrite: bto.dendrite,
     synthetic_query: bool,
+) -> AsyncIterator[str]:
+    # Synthetic queries wait for the miner to have a free slot, organic ones go straight away
+    async with miner_states.in_flight.slot(task, uid_record.axon_uid, wait=synthetic_query):
+        try:
+            async for chunk in _query_miner_stream(
+                uid_record, synapse, outgoing_model, task, dendrite, synthetic_query
+            ):
+                yield chunk
+        except asyncio.CancelledError:
+            _record_cancelled_query(uid_record, task, synthetic_query)
+            raise
+
+
+async def _query_miner_stream(
+    uid_record: UIDRecord,
+    synapse: bt.Synapse,
+    outgoing_model: BaseModel,
+    task: Task,
+    dendrite: bto.dendrite,
+    synthetic_query: bool,
 ) -> AsyncIterator[str]:
     axon_uid = uid_record.axon_uid
     axon = uid_record.axon
@@ -184,9 +205,31 @@ async def query_miner_stream(
         create_scoring_adjustment_task(query_result, synapse, uid_record, synthetic_query)
 
 
+def _record_cancelled_query(uid_record: UIDRecord, task: Task, synthetic_query: bool) -> None:
+    """
+    An organic query cancelled part way - at its deadline, or beaten by a hedge - never gets a result, so it's
+    recorded as a timeout; otherwise a miner that's always too slow would look like it had never been tried
+    """
+    if synthetic_query:
+        # Only cancelled when the validator stops
+        return
+    query_result = utility_models.QueryResult(
+        formatted_response=None,
+        axon_uid=uid_record.axon_uid,
+        response_time=None,
+        error_message="Cancelled before the miner answered",
+        task=task,
+        status_code=408,
+        success=False,
+        miner_hotkey=uid_record.hotkey,
+    )
+    miner_states.record(query_result)
+
+
 def create_scoring_adjustment_task(
     query_result: utility_models.QueryResult, synapse: bt.Synapse, uid_record: UIDRecord, synthetic_query: bool
 ):
+    miner_states.record(query_result)
     asyncio.create_task(
         scoring_utils.adjust_uid_record_from_result(query_result, synapse, uid_record, synthetic_query=synthetic_query)
     )
@@ -199,6 +242,22 @@ async def query_miner_no_stream(
     task: Task,
     dendrite: bto.dendrite,
     synthetic_query: bool,
+) -> utility_models.QueryResult:
+    async with miner_states.in_flight.slot(task, uid_record.axon_uid, wait=synthetic_query):
+        try:
+            return await _query_miner_no_stream(uid_record, synapse, outgoing_model, task, dendrite, synthetic_query)
+        except asyncio.CancelledError:
+            _record_cancelled_query(uid_record, task, synthetic_query)
+            raise
+
+
+async def _query_miner_no_stream(
+    uid_record: UIDRecord,
+    synapse: bt.Synapse,
+    outgoing_model: BaseModel,
+    task: Task,
+    dendrite: bto.dendrite,
+    synthetic_query: bool,
 ) -> utility_models.QueryResult:
     axon_uid = uid_record.axon_uid
     axon = uid_record.axon
@@ -0,0 +1,43 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+from validation.models import axon_uid
+from validation.proxy.utils import constants as cst
+
+T = TypeVar("T")
+
+# Given the miners that have failed the query so far, the next one to try, or None if there are none left
+SelectMiner = Callable[[List[axon_uid]], Optional[axon_uid]]
+# Tries the query on a miner, giving None if it failed. It can add to the failed miners itself, e.g. a hedge
+Attempt = Callable[[axon_uid, List[axon_uid]], Awaitable[Optional[T]]]
+
+
+async def query_with_retries(
+    select_miner: SelectMiner,
+    attempt: Attempt,
+    deadline: float,
+    max_attempts: int = cst.MAX_ORGANIC_QUERY_ATTEMPTS,
+) -> Tuple[Optional[T], List[axon_uid]]:
+    """
+    Tries an organic query on up to `max_attempts` miners, each one that hasn't failed it yet, until one works.
+    All of them have to be done by `deadline` (a unix time) - an attempt still going then is cancelled.
+
+    Returns the first result, or None if every attempt failed, along with the uids that failed
+    """
+    failed_uids: List[axon_uid] = []
+    for _ in range(max_attempts):
+        uid = select_miner(failed_uids)
+        time_left = deadline - time.time()
+        if uid is None or time_left <= 0:
+            break
+        try:
+            result = await asyncio.wait_for(attempt(uid, failed_uids), timeout=time_left)
+        except asyncio.TimeoutError:
+            failed_uids.append(uid)
+            break
+        if result is not None:
+            return result, failed_uids
+        if uid not in failed_uids:
+            failed_uids.append(uid)
+    return None, failed_uids
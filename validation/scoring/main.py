@@ -89,7 +89,7 @@ class Scorer:
         i = 0
         bt.logging.info(f"Checking some results for task {task}")
         while i < cst.MAX_RESULTS_TO_SCORE_FOR_TASK:
-            data_and_hotkey = await db_manager.select_and_delete_task_result(task)  # noqa
+            data_and_hotkey = await db_manager.pop_task_result(task)
             if data_and_hotkey is None:
                 bt.logging.warning(f"No data left to score for task {task}; iteration {i}")
                 return
@@ -99,9 +99,10 @@ class Scorer:
                 checking_data["synthetic_query"],
                 checking_data["synapse"],
             )
-            results_json: Dict[str, Any] = json.loads(results)
+            # Results stored before the blob store are json strings inside the json
+            results_json: Dict[str, Any] = json.loads(results) if isinstance(results, str) else results
 
-            synapse = json.loads(synapse_dict_str)
+            synapse = json.loads(synapse_dict_str) if isinstance(synapse_dict_str, str) else synapse_dict_str
 
             data = {
                 "synapse": synapse,
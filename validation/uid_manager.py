@@ -1,7 +1,8 @@
 import asyncio
 import collections
 import random
-from typing import AsyncGenerator, Dict, List, Union
+import time
+from typing import AsyncGenerator, Dict, List, Optional, Union
 
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
@@ -10,7 +11,9 @@ import bittensor as bt
 from validation.models import UIDRecord, axon_uid
 from validation.synthetic_data import synthetic_generations
 from core import tasks, constants as core_cst
-from validation.proxy.utils import query_utils
+from validation.proxy.utils import constants as proxy_cst, query_utils, retries
+from validation.proxy.utils.hedging import Hedger, Query, hedger as default_hedger
+from validation.proxy.utils.miner_state import MinerStates, miner_states as default_miner_states
 from models import base_models, utility_models
 from validation.db.db_management import db_manager
 
@@ -47,6 +50,8 @@ class UidManager:
         uid_to_uid_info: Dict[axon_uid, utility_models.UIDinfo],
         synthetic_data_manager: synthetic_generations.SyntheticDataManager,
         is_testnet: bool,
+        miner_states: MinerStates = default_miner_states,
+        hedger: Hedger = default_hedger,
     ) -> None:
         self.capacities_for_tasks = capacities_for_tasks
         self.dendrite = dendrite
@@ -57,6 +62,11 @@ class UidManager:
         self.synthetic_scoring_tasks: List[asyncio.Task] = []
         self.task_to_uid_queue: Dict[Task, query_utils.UIDQueue] = {}
         self.synthetic_data_manager = synthetic_data_manager
+        self.miner_states = miner_states
+        self.selector = miner_states.selector
+        self.breaker = miner_states.breaker
+        self.in_flight = miner_states.in_flight
+        self.hedger = hedger
 
         self.is_testnet = is_testnet
 
@@ -80,6 +90,7 @@ class UidManager:
                 if volume_to_score == 0:
                     continue
                 self.task_to_uid_queue[task].add_uid(uid)
+                self.miner_states.add_uid(task, uid, self.uid_to_axon[uid].hotkey)
                 self.synthetic_scoring_tasks.append(
                     asyncio.create_task(
                         self.handle_task_scoring_for_uid(
@@ -150,6 +161,12 @@ class UidManager:
             if uid_record.consumed_volume >= volume_to_score:
                 break
 
+            # No traffic while the miner's breaker is open, and once it's half open, this is the probe
+            if not self.breaker.allow_request(task, uid):
+                uid_record.synthetic_requests_still_to_make -= 1
+                i += 1
+                continue
+
             synthetic_data = await self.synthetic_data_manager.fetch_synthetic_data_for_task(task)
 
             synthetic_synapse = tasks.TASKS_TO_SYNAPSE[task](**synthetic_data)
@@ -193,47 +210,79 @@ class UidManager:
                 },
                 status_code=500,
             )
-        queue = self.task_to_uid_queue[task]
-        latest_uid = queue.get_uid_and_move_to_back()
-        if latest_uid is None:
+        # Only miners whose scoring has started have a record to query with
+        uid_records = self.uid_records_for_tasks[task]
+        available_uids = [uid for uid in self.task_to_uid_queue[task].uid_map if uid in uid_records]
+        # Miners whose breaker isn't closed are left out - unless that's all of them
+        available_uids = self.breaker.closed_uids(task, available_uids) or available_uids
+        # Likewise, miners with a free slot go first
+        available_uids = self.in_flight.uids_with_free_slots(task, available_uids) or available_uids
+        if not available_uids:
             return JSONResponse(content={"error": f"No UIDs available for this task {task}"}, status_code=500)
-        uid_record = self.uid_records_for_tasks[task][latest_uid]
-        attempts = 0
+
+        operation_timeout = proxy_cst.OPERATION_TIMEOUTS.get(synapse.__class__.__name__, 15)
+        deadline = time.time() + operation_timeout * proxy_cst.ORGANIC_QUERY_DEADLINE_TIMEOUTS
+
+        def _select_miner(failed_uids: List[axon_uid]) -> Optional[axon_uid]:
+            return self.selector.select(task, available_uids, exclude=failed_uids)
+
+        async def _query(uid: axon_uid, failed_uids: List[axon_uid]) -> Optional[utility_models.QueryResult]:
+            query_result = await self._query_no_stream_hedged(
+                task, uid_records[uid], synapse, outgoing_model, available_uids, failed_uids
+            )
+            if query_result is not None and query_result.success:
+                return query_result
+            # A hedged query can have failed on the other miner
+            if query_result is not None and query_result.axon_uid not in failed_uids:
+                failed_uids.append(query_result.axon_uid)
+            return None
+
+        async def _query_stream(uid: axon_uid, failed_uids: List[axon_uid]) -> Optional[AsyncGenerator]:
+            generator = query_utils.query_miner_stream(
+                uid_records[uid], synapse, outgoing_model, task, self.dendrite, synthetic_query=False
+            )
+            try:
+                first_chunk = await generator.__anext__()
+            except StopAsyncIteration:
+                return None
+            if first_chunk is None:
+                bt.logging.info("First chunk is none")
+                await generator.aclose()
+                return None
+            return _async_chain(first_chunk, generator)
 
         if not stream:
-            while attempts < 3:
-                query_result: utility_models.QueryResult = await query_utils.query_miner_no_stream(
-                    uid_record,
-                    synapse,
-                    outgoing_model,
-                    task,
-                    dendrite=self.dendrite,
-                    synthetic_query=False,
-                )
-                if query_result is None or not query_result.success:
-                    attempts += 1
-                else:
-                    break
+            query_result, failed_uids = await retries.query_with_retries(_select_miner, _query, deadline)
+            if query_result is not None:
+                query_result.failed_axon_uids = failed_uids
+                return query_result
         else:
-            while attempts < 3:
-                generator = query_utils.query_miner_stream(
-                    uid_record, synapse, outgoing_model, task, self.dendrite, synthetic_query=False
-                )
-                try:
-                    first_chunk = await generator.__anext__()
-                    if first_chunk is None:
-                        bt.logging.info("First chunk is none")
-                        return JSONResponse(
-                            content={"error": f"No UIDs available for this task {task}"}, status_code=500
-                        )
-                    query_result = _async_chain(first_chunk, generator)
-                    break
-                except StopAsyncIteration:
-                    attempts += 1
-
-        if attempts == 3:
-            return JSONResponse(content={"error": "Could not process request, mi apologies"}, status_code=500)
-        return query_result
+            generator, failed_uids = await retries.query_with_retries(_select_miner, _query_stream, deadline)
+            if generator is not None:
+                return generator
+
+        bt.logging.info(f"Organic query for task {task} failed on uids {failed_uids}")
+        return JSONResponse(content={"error": "Could not process request, mi apologies"}, status_code=500)
+
+    async def _query_no_stream_hedged(
+        self,
+        task: Task,
+        uid_record: UIDRecord,
+        synapse: bt.Synapse,
+        outgoing_model: BaseModel,
+        available_uids: List[axon_uid],
+        failed_uids: List[axon_uid],
+    ) -> Optional[utility_models.QueryResult]:
+        def _query(record: UIDRecord) -> Query:
+            return query_utils.query_miner_no_stream(
+                record, synapse, outgoing_model, task, dendrite=self.dendrite, synthetic_query=False
+            )
+
+        def _query_another_miner() -> Optional[Query]:
+            hedge_uid = self.selector.select(task, available_uids, exclude=[uid_record.axon_uid, *failed_uids])
+            return None if hedge_uid is None else _query(self.uid_records_for_tasks[task][hedge_uid])
+
+        return await self.hedger.run(task, _query(uid_record), _query_another_miner)
 
     @staticmethod
     def _get_percentage_of_tasks_to_score() -> float:
@@ -1,28 +1,20 @@
 # Schema for the db
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 from core import Task
 from models import utility_models
 from validation.db.db_management import db_manager
-from validation.models import PeriodScore
+from validation.models import PeriodScore, PeriodScoreAggregate, RewardAggregate
 from validation.models import axon_uid
 from validation.models import RewardData
 
 PERIOD_SCORE_TIME_DECAYING_FACTOR = 0.5
+QUALITY_TASKS_TO_FETCH = 50
+# Anything smaller is what's left of a zero volume after adding and taking away decayed volumes
+MIN_DECAYED_VOLUME_SUM = 1e-12
 
 
-async def _get_reward_datas(miner_hotkey: str, task: Task) -> List[RewardData]:
-    reward_datas = await db_manager.fetch_recent_most_rewards_for_uid(task, miner_hotkey)
-    return reward_datas
-
-
-async def _get_period_scores(miner_hotkey: str, task: Task) -> List[PeriodScore]:
-    period_scores = await db_manager.fetch_hotkey_scores_for_task(task, miner_hotkey)
-    return period_scores
-
-
-async def _calculate_combined_quality_score(miner_hotkey: str, task: Task) -> float:
-    reward_datas = await _get_reward_datas(miner_hotkey, task)
+def _calculate_combined_quality_score(reward_datas: List[RewardData]) -> float:
     combined_quality_scores = [
         reward_data.quality_score * reward_data.speed_scoring_factor for reward_data in reward_datas
     ]
@@ -31,8 +23,7 @@ async def _calculate_combined_quality_score(miner_hotkey: str, task: Task) -> fl
     return sum(combined_quality_scores) / len(combined_quality_scores)
 
 
-async def _calculate_normalised_period_score(miner_hotkey: str, task: Task) -> float:
-    period_scores = await _get_period_scores(miner_hotkey, task)
+def _calculate_normalised_period_score(period_scores: List[PeriodScore]) -> float:
     all_period_scores = [ps for ps in period_scores if ps.period_score is not None]
     normalised_period_scores = _normalise_period_scores(all_period_scores)
     return normalised_period_scores
@@ -58,9 +49,53 @@ def _normalise_period_scores(period_scores: List[PeriodScore]) -> float:
     if total_weight == 0:
         return 0
     else:
-        # Make sure UID's which are new don't instantly jump to the top
-        penalty = max(0, 1 - len(period_scores) / 8) / 4
-        return total_score / total_weight * (1 - penalty)
+        return total_score / total_weight * (1 - _new_uid_penalty(len(period_scores)))
+
+
+def _new_uid_penalty(number_of_period_scores: int) -> float:
+    # Make sure UID's which are new don't instantly jump to the top
+    return max(0, 1 - number_of_period_scores / 8) / 4
+
+
+def _calculate_combined_quality_score_from_aggregates(
+    task: Task, reward_aggregates: List[RewardAggregate], recent_combined_quality_scores: List[float]
+) -> float:
+    """
+    Same result as `_calculate_combined_quality_score` on the rewards `fetch_recent_most_rewards_for_hotkeys` gives:
+    all the rewards for the task, topped up with the hotkey's most recent rewards for any task
+    """
+    priority_count, priority_sum = 0, 0.0
+    for reward_aggregate in reward_aggregates:
+        if reward_aggregate.task == task.value:
+            priority_count = reward_aggregate.reward_count
+            priority_sum = reward_aggregate.combined_quality_score_sum
+
+    number_to_fill = QUALITY_TASKS_TO_FETCH - priority_count
+    if number_to_fill < 0:
+        # No limit on the top up, so it's every reward the hotkey has
+        fill_count = sum(reward_aggregate.reward_count for reward_aggregate in reward_aggregates)
+        fill_sum = sum(reward_aggregate.combined_quality_score_sum for reward_aggregate in reward_aggregates)
+    else:
+        fill_scores = recent_combined_quality_scores[:number_to_fill]
+        fill_count = len(fill_scores)
+        fill_sum = sum(fill_scores)
+
+    if priority_count + fill_count == 0:
+        return 0
+    return (priority_sum + fill_sum) / (priority_count + fill_count)
+
+
+def _calculate_normalised_period_score_from_aggregate(aggregate: Optional[PeriodScoreAggregate]) -> float:
+    """
+    Same result as `_normalise_period_scores`: there the volume weights are divided through by the sum of volumes,
+    which cancels out, leaving the decayed weighted score sum over the decayed volume sum
+    """
+    if aggregate is None or aggregate.period_score_count <= 0:
+        return 0
+    if aggregate.decayed_volume_sum < MIN_DECAYED_VOLUME_SUM:
+        return 0
+    normalised_period_score = aggregate.decayed_weighted_score_sum / aggregate.decayed_volume_sum
+    return normalised_period_score * (1 - _new_uid_penalty(aggregate.period_score_count))
 
 
 def _calculate_hotkey_effective_volume_for_task(
@@ -86,24 +121,78 @@ def apply_non_linear_transformation_and_renormalise(linear_normalised_scores: Di
     return {hotkey: score / sum_transformed_scores for hotkey, score in transformed_scores.items()}
 
 
-async def calculate_scores_for_settings_weights(
+def _get_miner_hotkeys_and_tasks_to_score(
     capacities_for_tasks: Dict[Task, Dict[axon_uid, float]],
     uid_to_uid_info: Dict[axon_uid, utility_models.UIDinfo],
     task_weights: Dict[Task, float],
+) -> Tuple[List[str], List[Task]]:
+    tasks_to_score = [task for task in Task if task in task_weights]
+    miner_hotkeys = list(
+        {uid_to_uid_info[uid].hotkey for task in tasks_to_score for uid in capacities_for_tasks[task]}
+    )
+    return miner_hotkeys, tasks_to_score
+
+
+async def _get_quality_and_period_scores(
+    miner_hotkeys: List[str], tasks_to_score: List[Task]
+) -> Dict[Tuple[Task, str], Tuple[float, float]]:
+    """Combined quality and normalised period score for each (task, hotkey), from the score aggregates"""
+    hotkey_to_reward_aggregates = await db_manager.fetch_reward_aggregates_for_hotkeys(miner_hotkeys)
+    hotkey_to_recent_scores = await db_manager.fetch_recent_combined_quality_scores_for_hotkeys(
+        miner_hotkeys, limit=QUALITY_TASKS_TO_FETCH
+    )
+    period_score_aggregates = await db_manager.fetch_period_score_aggregates_for_hotkeys(miner_hotkeys)
+
+    return {
+        (task, miner_hotkey): (
+            _calculate_combined_quality_score_from_aggregates(
+                task,
+                hotkey_to_reward_aggregates.get(miner_hotkey, []),
+                hotkey_to_recent_scores.get(miner_hotkey, []),
+            ),
+            _calculate_normalised_period_score_from_aggregate(period_score_aggregates.get((task, miner_hotkey))),
+        )
+        for task in tasks_to_score
+        for miner_hotkey in miner_hotkeys
+    }
+
+
+async def _get_quality_and_period_scores_from_raw_rows(
+    miner_hotkeys: List[str], tasks_to_score: List[Task]
+) -> Dict[Tuple[Task, str], Tuple[float, float]]:
+    """Combined quality and normalised period score for each (task, hotkey), from every raw row"""
+    reward_datas_for_tasks_and_hotkeys = await db_manager.fetch_recent_most_rewards_for_hotkeys(
+        miner_hotkeys, tasks_to_score, quality_tasks_to_fetch=QUALITY_TASKS_TO_FETCH
+    )
+    period_scores_for_tasks_and_hotkeys = await db_manager.fetch_hotkey_scores_for_tasks(miner_hotkeys)
+
+    return {
+        (task, miner_hotkey): (
+            _calculate_combined_quality_score(reward_datas_for_tasks_and_hotkeys.get((task, miner_hotkey), [])),
+            _calculate_normalised_period_score(period_scores_for_tasks_and_hotkeys.get((task, miner_hotkey), [])),
+        )
+        for task in tasks_to_score
+        for miner_hotkey in miner_hotkeys
+    }
+
+
+def _calculate_scores_from_quality_and_period_scores(
+    capacities_for_tasks: Dict[Task, Dict[axon_uid, float]],
+    uid_to_uid_info: Dict[axon_uid, utility_models.UIDinfo],
+    task_weights: Dict[Task, float],
+    tasks_to_score: List[Task],
+    quality_and_period_scores: Dict[Tuple[Task, str], Tuple[float, float]],
 ) -> Dict[str, float]:
     total_hotkey_scores: Dict[str, float] = {}
 
-    for task in Task:
-        if task not in task_weights:
-            continue
+    for task in tasks_to_score:
         task_weight = task_weights[task]
         hotkey_to_effective_volumes: Dict[str, float] = {}
         capacities = capacities_for_tasks[task]
 
         for uid, volume in capacities.items():
             miner_hotkey = uid_to_uid_info[uid].hotkey
-            combined_quality_score = await _calculate_combined_quality_score(miner_hotkey, task)
-            normalised_period_score = await _calculate_normalised_period_score(miner_hotkey, task)
+            combined_quality_score, normalised_period_score = quality_and_period_scores[(task, miner_hotkey)]
             effective_volume_for_task = _calculate_hotkey_effective_volume_for_task(
                 combined_quality_score, normalised_period_score, volume
             )
@@ -124,3 +213,39 @@ async def calculate_scores_for_settings_weights(
             )
 
     return total_hotkey_scores
+
+
+async def calculate_scores_for_settings_weights(
+    capacities_for_tasks: Dict[Task, Dict[axon_uid, float]],
+    uid_to_uid_info: Dict[axon_uid, utility_models.UIDinfo],
+    task_weights: Dict[Task, float],
+) -> Dict[str, float]:
+    await db_manager.flush_write_buffers()
+
+    miner_hotkeys, tasks_to_score = _get_miner_hotkeys_and_tasks_to_score(
+        capacities_for_tasks, uid_to_uid_info, task_weights
+    )
+    quality_and_period_scores = await _get_quality_and_period_scores(miner_hotkeys, tasks_to_score)
+    return _calculate_scores_from_quality_and_period_scores(
+        capacities_for_tasks, uid_to_uid_info, task_weights, tasks_to_score, quality_and_period_scores
+    )
+
+
+async def calculate_scores_for_settings_weights_from_raw_rows(
+    capacities_for_tasks: Dict[Task, Dict[axon_uid, float]],
+    uid_to_uid_info: Dict[axon_uid, utility_models.UIDinfo],
+    task_weights: Dict[Task, float],
+) -> Dict[str, float]:
+    """
+    The same calculation, reading every raw row rather than the score aggregates.
+    Much slower - it's kept as the reference the aggregates are checked against
+    """
+    await db_manager.flush_write_buffers()
+
+    miner_hotkeys, tasks_to_score = _get_miner_hotkeys_and_tasks_to_score(
+        capacities_for_tasks, uid_to_uid_info, task_weights
+    )
+    quality_and_period_scores = await _get_quality_and_period_scores_from_raw_rows(miner_hotkeys, tasks_to_score)
+    return _calculate_scores_from_quality_and_period_scores(
+        capacities_for_tasks, uid_to_uid_info, task_weights, tasks_to_score, quality_and_period_scores
+    )
@@ -1,9 +1,10 @@
 import uuid
+from datetime import datetime, timedelta
 
 import aiosqlite
 import anyio
 import typer
-from typing import Optional
+from typing import List, Optional
 from rich.console import Console
 from rich.table import Table
 from config.create_config import get_config
@@ -178,7 +179,7 @@ def logs_for_key(key: str):
         console = Console()
         table = Table(show_header=True, header_style="bold magenta")
 
-        async with aiosqlite.connect(sql.DATABASE_PATH) as conn:
+        async with sql.get_read_only_db_connection() as conn:
             logs = await sql.get_all_logs_for_key(conn, key)
 
         if logs:
@@ -197,14 +198,25 @@ def logs_for_key(key: str):
 
 
 @cli.command()
-def logs_summary():
+def logs_summary(days: Optional[int] = None):
     """
-    Summary of all logs.
+    Summary of usage, per key and per endpoint.
+
+    Read from the daily log rollups over a read-only connection, so it's quick over any range and never
+    gets in the way of a running validator.
+
+    Arguments:
+    days: Only include the last this many days. Defaults to all time.
     """
 
     async def run():
-        async with aiosqlite.connect(sql.DATABASE_PATH) as conn:
-            keys = await sql.get_all_api_keys(conn)
+        since = None
+        if days is not None:
+            since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d 00:00:00")
+
+        async with sql.get_read_only_db_connection() as conn:
+            usage_by_key = await sql.get_usage_by_key(conn, since)
+            usage_by_endpoint = await sql.get_usage_by_endpoint(conn, since)
 
         console = Console()
 
@@ -212,38 +224,37 @@ def logs_summary():
         summary_table.add_column("key")
         summary_table.add_column("Total Requests")
         summary_table.add_column("Total Credits Used")
+        summary_table.add_column("Average Latency (s)")
 
-        global_endpoint_dict = {}
-
-        for key in keys:
-            key = dict(key)[sql.KEY]
-            async with aiosqlite.connect(sql.DATABASE_PATH) as conn:
-                logs = await sql.get_all_logs_for_key(conn, key)
-
-            total_requests = len(logs)
-            total_credits_used = sum([dict(log).get("cost", 0) for log in logs])
-
-            for log in logs:
-                log = dict(log)
-                endpoint = log.get(sql.ENDPOINT, "unknown_endpoint")
-                global_endpoint_dict[endpoint] = global_endpoint_dict.get(endpoint, 0) + 1
-
-            summary_table.add_row(key, str(total_requests), str(total_credits_used))
+        for usage in usage_by_key:
+            summary_table.add_row(*_usage_columns(usage))
 
         console.print(summary_table)
 
         breakdown_table = Table(show_header=True, header_style="bold green")
         breakdown_table.add_column("Endpoint")
         breakdown_table.add_column("Count")
+        breakdown_table.add_column("Credits Used")
+        breakdown_table.add_column("Average Latency (s)")
 
-        for endpoint, count in global_endpoint_dict.items():
-            breakdown_table.add_row(endpoint, str(count))
+        for usage in usage_by_endpoint:
+            breakdown_table.add_row(*_usage_columns(usage))
 
         console.print("Endpoint Breakdown:")
         console.print(breakdown_table)
-    
+
     anyio.run(run)
 
 
+def _usage_columns(usage: dict) -> List[str]:
+    average_latency = usage["average_latency"]
+    return [
+        usage["name"],
+        str(usage[sql.REQUEST_COUNT]),
+        str(usage[sql.CREDITS_USED]),
+        f"{average_latency:.2f}" if average_latency is not None else "-",
+    ]
+
+
 if __name__ == "__main__":
     cli()